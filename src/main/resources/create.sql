@@ -25,5 +25,5 @@ CREATE TABLE Availabilities (
 CREATE TABLE Appointments (
     AppointmentID VARCHAR(36) REFERENCES Availabilities NOT NULL PRIMARY KEY,
     VaccineType VARCHAR(255) REFERENCES Vaccines,
-    PatientID VARCHAR(255) REFERENCES Patients,
+    PatientID VARCHAR(255) REFERENCES Patients
 );
\ No newline at end of file
@@ -0,0 +1,3 @@
+-- Vaccines.Version is bumped on every change to Doses, so the inventory cache can tell when to reload.
+-- applied-if-column: Vaccines.Version
+ALTER TABLE Vaccines ADD Version INT NOT NULL DEFAULT 0;
@@ -0,0 +1,4 @@
+-- Algorithm and cost of each stored password hash, NULL for PBKDF2-SHA256 at 100000 iterations.
+-- applied-if-column: Caregivers.HashParams
+ALTER TABLE Caregivers ADD HashParams VARCHAR(64) NULL;
+ALTER TABLE Patients ADD HashParams VARCHAR(64) NULL;
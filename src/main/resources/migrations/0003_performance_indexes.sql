@@ -0,0 +1,13 @@
+-- Covering index for the open-slot anti-join of search_caregiver_schedule and reserve: seeks on Date and returns
+-- the slots already ordered by caregiver. Appointments is probed through its primary key.
+CREATE INDEX IX_Availabilities_Date ON Availabilities (Date, CaregiverID, AppointmentID);
+-- Covering index for a patient's appointment list. A caregiver's list seeks the UNIQUE(CaregiverID, Date) index.
+CREATE INDEX IX_Appointments_PatientID ON Appointments (PatientID, AppointmentID, VaccineType);
+-- plan-check: SELECT AV.AppointmentID, AV.CaregiverID FROM Availabilities AV LEFT JOIN Appointments AP ON AP.AppointmentID = AV.AppointmentID WHERE AP.AppointmentID is null AND AV.Date = '2030-01-01'
+-- plan-check: SELECT AV.AppointmentID, AV.CaregiverID FROM Availabilities AV WHERE AV.Date = '2030-01-01' AND NOT EXISTS (SELECT 1 FROM Appointments AP WHERE AP.AppointmentID = AV.AppointmentID) ORDER BY AV.CaregiverID, AV.AppointmentID
+-- The pages of Appointment.list_for: a patient's first and next pages, a caregiver's next page and date range
+-- plan-check: SELECT AP.AppointmentID, AP.VaccineType, AV.Date, AV.CaregiverID, AP.PatientID FROM Appointments AP JOIN Availabilities AV ON AV.AppointmentID = AP.AppointmentID WHERE AP.PatientID = 'patient' ORDER BY AV.Date, AP.AppointmentID
+-- plan-check: SELECT AP.AppointmentID, AP.VaccineType, AV.Date, AV.CaregiverID, AP.PatientID FROM Appointments AP JOIN Availabilities AV ON AV.AppointmentID = AP.AppointmentID WHERE AP.PatientID = 'patient' AND (AV.Date > (SELECT Date FROM Availabilities WHERE AppointmentID = 'appointment') OR (AV.Date = (SELECT Date FROM Availabilities WHERE AppointmentID = 'appointment') AND AP.AppointmentID > 'appointment')) ORDER BY AV.Date, AP.AppointmentID
+-- plan-check: SELECT AP.AppointmentID, AP.VaccineType, AV.Date, AV.CaregiverID, AP.PatientID FROM Appointments AP JOIN Availabilities AV ON AV.AppointmentID = AP.AppointmentID WHERE AV.CaregiverID = 'caregiver' AND AV.Date > (SELECT Date FROM Availabilities WHERE AppointmentID = 'appointment') ORDER BY AV.Date
+-- plan-check: SELECT AP.AppointmentID, AP.VaccineType, AV.Date, AV.CaregiverID, AP.PatientID FROM Appointments AP JOIN Availabilities AV ON AV.AppointmentID = AP.AppointmentID WHERE AV.CaregiverID = 'caregiver' AND AV.Date >= '2030-01-01' AND AV.Date <= '2030-12-31' ORDER BY AV.Date
+-- plan-check: SELECT Date FROM Availabilities WHERE CaregiverID = 'caregiver' AND Date BETWEEN '2030-01-01' AND '2030-12-31'
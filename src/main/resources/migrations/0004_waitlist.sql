@@ -0,0 +1,14 @@
+-- Patients waiting for an appointment with a vaccine between two dates, booked automatically by the waitlist
+-- matcher as slots and doses are added. CreatedAt is set by the application, the oldest entry is served first.
+CREATE TABLE Waitlist (
+    PatientID VARCHAR(255) REFERENCES Patients NOT NULL,
+    VaccineType VARCHAR(255) REFERENCES Vaccines NOT NULL,
+    StartDate DATE NOT NULL,
+    EndDate DATE NOT NULL,
+    CreatedAt DATETIME2 NOT NULL,
+    PRIMARY KEY (PatientID, VaccineType)
+);
+-- Entries whose window is still open, the matcher's lookup
+CREATE INDEX IX_Waitlist_EndDate ON Waitlist (EndDate, StartDate);
+-- plan-check: SELECT PatientID, VaccineType, StartDate, EndDate, CreatedAt FROM Waitlist WHERE EndDate >= '2030-01-01' AND StartDate <= '2030-12-31'
+-- plan-check: SELECT VaccineType, StartDate, EndDate, CreatedAt FROM Waitlist WHERE PatientID = 'patient' ORDER BY VaccineType
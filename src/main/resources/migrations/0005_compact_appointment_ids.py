@@ -0,0 +1,29 @@
+"""
+Rewrites the UUID AppointmentIDs handed out before compact ids (util/CompactId.py) as compact ids, given in date
+order so the rewritten keys are as well ordered as new ones. Booked slots keep their appointment: Appointments
+rows are taken out while their slot's key changes and put back under the new key.
+"""
+from util.CompactId import get_ids
+
+# UUIDs are the only ids with dashes
+LEGACY = "AppointmentID LIKE '%-%'"
+CHUNK = 500
+
+
+def upgrade(conn, backend):
+    cursor = conn.cursor()
+    cursor.execute(f'SELECT AppointmentID FROM Availabilities WHERE {LEGACY} ORDER BY Date, CaregiverID')
+    old_ids = [row[0] for row in cursor.fetchall()]
+    if not old_ids:
+        return
+    new_ids = dict(zip(old_ids, get_ids().next_many(len(old_ids))))
+    cursor.execute(f'SELECT AppointmentID, VaccineType, PatientID FROM Appointments WHERE {LEGACY}')
+    booked = [(new_ids[apt_id], vaccine, patient) for apt_id, vaccine, patient in cursor.fetchall()]
+    cursor.execute(f'DELETE FROM Appointments WHERE {LEGACY}')
+    renames = [(new, old) for old, new in new_ids.items()]
+    for i in range(0, len(renames), CHUNK):
+        cursor.executemany('UPDATE Availabilities SET AppointmentID = %s WHERE AppointmentID = %s',
+                           renames[i:i + CHUNK])
+    for i in range(0, len(booked), CHUNK):
+        cursor.executemany('INSERT INTO Appointments (AppointmentID, VaccineType, PatientID) VALUES (%s, %s, %s)',
+                           booked[i:i + CHUNK])
@@ -0,0 +1,12 @@
+-- Sessions handed out at login (see db/SessionStore.py), so a returning client can resume with its token instead of
+-- sending its password through the hash again. Logging out deletes the row, expired rows are purged by new logins.
+CREATE TABLE Sessions (
+    TokenID CHAR(32) PRIMARY KEY,
+    Kind VARCHAR(9) NOT NULL,
+    Username VARCHAR(255) NOT NULL,
+    ExpiresAt DATETIME2 NOT NULL
+);
+-- The purge of expired sessions
+CREATE INDEX IX_Sessions_ExpiresAt ON Sessions (ExpiresAt);
+-- plan-check: SELECT Kind, Username FROM Sessions WHERE TokenID = 'token' AND ExpiresAt > '2030-01-01'
+-- plan-check: SELECT TokenID FROM Sessions WHERE ExpiresAt <= '2030-01-01'
@@ -0,0 +1,51 @@
+"""
+Adds Availabilities.BookedVaccine, the vaccine of the appointment booked on the slot (NULL while it is open), kept in
+step with Appointments by triggers so every writer, the scheduler or not, maintains it. Counting bookings per date,
+vaccine or caregiver (Capacity.py) then reads Availabilities' indexes alone instead of probing Appointments once
+per slot. Open-slot searches still go by Appointments.
+"""
+
+PLAN_CHECKS = [
+    "SELECT Date, BookedVaccine, COUNT(*) FROM Availabilities WHERE Date BETWEEN '2030-01-01' AND '2030-12-31' "
+    "GROUP BY Date, BookedVaccine",
+    "SELECT COUNT(*), COUNT(BookedVaccine) FROM Availabilities WHERE CaregiverID = 'caregiver' "
+    "AND Date BETWEEN '2030-01-01' AND '2030-12-31'",
+]
+
+STATEMENTS = [
+    'ALTER TABLE Availabilities ADD BookedVaccine VARCHAR(255) NULL',
+    'UPDATE Availabilities SET BookedVaccine = (SELECT AP.VaccineType FROM Appointments AP '
+    'WHERE AP.AppointmentID = Availabilities.AppointmentID) '
+    'WHERE AppointmentID IN (SELECT AppointmentID FROM Appointments)',
+    # Bookings per date and vaccine. A caregiver's are counted through the UNIQUE(CaregiverID, Date) index, so
+    # a booking updates one more index entry, not two
+    'CREATE INDEX IX_Availabilities_BookedVaccine ON Availabilities (Date, BookedVaccine)',
+]
+
+TRIGGERS = {
+    'sqlite': [
+        'CREATE TRIGGER TR_Appointments_Insert AFTER INSERT ON Appointments BEGIN '
+        'UPDATE Availabilities SET BookedVaccine = NEW.VaccineType WHERE AppointmentID = NEW.AppointmentID; END',
+        'CREATE TRIGGER TR_Appointments_Delete AFTER DELETE ON Appointments BEGIN '
+        'UPDATE Availabilities SET BookedVaccine = NULL WHERE AppointmentID = OLD.AppointmentID; END',
+        'CREATE TRIGGER TR_Appointments_Update AFTER UPDATE ON Appointments BEGIN '
+        'UPDATE Availabilities SET BookedVaccine = NULL WHERE AppointmentID = OLD.AppointmentID; '
+        'UPDATE Availabilities SET BookedVaccine = NEW.VaccineType WHERE AppointmentID = NEW.AppointmentID; END',
+    ],
+    # NOCOUNT stops the trigger's UPDATEs sending their own row-count (DONE_IN_PROC) messages to the client, which
+    # a driver can mistake for the count of the statement that fired it. It does not change @@ROWCOUNT
+    'mssql': [
+        'CREATE TRIGGER TR_Appointments_Booked ON Appointments AFTER INSERT, UPDATE, DELETE AS BEGIN '
+        'SET NOCOUNT ON; '
+        'UPDATE AV SET BookedVaccine = NULL FROM Availabilities AV '
+        'JOIN deleted D ON D.AppointmentID = AV.AppointmentID; '
+        'UPDATE AV SET BookedVaccine = I.VaccineType FROM Availabilities AV '
+        'JOIN inserted I ON I.AppointmentID = AV.AppointmentID; END',
+    ],
+}
+
+
+def upgrade(conn, backend):
+    cursor = conn.cursor()
+    for statement in STATEMENTS + TRIGGERS[backend.name]:
+        cursor.execute(statement)
@@ -0,0 +1,143 @@
+import argparse
+import contextvars
+import json
+import re
+import sys
+import time
+from db.Backend import get_backend
+from db.ConnectionManager import DBError, get_pool, pin_connection
+from db.GroupedConnection import GroupedConnection
+from db.InventoryCache import get_inventory
+from db.SlotCache import get_slot_cache
+from Scheduler import Session, check_settings
+from Server import SessionStdout, execute
+
+
+"""
+Runs a script of scheduler commands without the interactive prompt, e.g. for bulk operations and nightly jobs.
+Commands share one connection and are committed in groups; every command yields one JSON line
+{"line": 3, "command": "...", "ok": true, "output": "...", "ms": 1.2} and the run ends with a summary line.
+"""
+
+# Output lines the command handlers print when a command did not do what was asked
+FAILED = re.compile(r'^(error|db-|datetime error|exception|failed|login failed|upload availability failed|'
+                    r'username taken|please |sorry|invalid operation|you are already logged in|'
+                    r'user already logged in)', re.IGNORECASE | re.MULTILINE)
+
+# Commands whose third token is a password, masked in the results
+WITH_PASSWORD = {'create_patient', 'create_caregiver', 'login_patient', 'login_caregiver'}
+# Commands whose second token is a session token, also masked
+WITH_TOKEN = {'resume'}
+# The token a login prints, masked in the output
+ISSUED_TOKEN = re.compile(r'(Session token: )\S+')
+
+
+def mask(command: str) -> str:
+    tokens = command.split(" ")
+    if tokens[0].lower() in WITH_PASSWORD and len(tokens) > 2:
+        tokens[2] = '***'
+    if tokens[0].lower() in WITH_TOKEN and len(tokens) > 1:
+        tokens[1] = '***'
+    return " ".join(tokens)
+
+
+def mask_output(output: str) -> str:
+    return ISSUED_TOKEN.sub(r'\1***', output)
+
+
+class BatchRunner:
+
+    def __init__(self, group_size: int = 100, stop_on_error: bool = False) -> None:
+        """
+        @param group_size: int, commands committed together; 1 commits after every command
+        @param stop_on_error: bool, stop at the first failed command instead of carrying on
+        """
+        self.group_size = group_size
+        self.stop_on_error = stop_on_error
+        self.stats = {'commands': 0, 'ok': 0, 'failed': 0, 'rolled_back': 0, 'commits': 0, 'seconds': 0.0,
+                      'rate': 0.0}
+
+    def run(self, lines, emit=None) -> dict:
+        """
+        Runs every command in lines, skipping blank lines and # comments, until the end or a quit command.
+        @param lines: iterable of command lines, e.g. an open file
+        @param emit: optional callable, given the result dict of each command
+        @return: dict of summary stats
+        """
+        if not isinstance(sys.stdout, SessionStdout):
+            sys.stdout = SessionStdout(sys.stdout)
+        session = Session()
+        pool = get_pool()
+        conn = GroupedConnection(pool.acquire(), get_backend(), self.group_size)
+        broken = False
+        started = time.perf_counter()
+        try:
+            with pin_connection(conn):
+                for number, line in enumerate(lines, 1):
+                    command = line.strip()
+                    if not command or command.startswith('#'):
+                        continue
+                    result, keep_open = self._run_one(conn, session, number, command)
+                    if emit is not None:
+                        emit(result)
+                    if not keep_open or (self.stop_on_error and not result['ok']):
+                        break
+            conn.flush()
+        except DBError:
+            broken = True
+            self._lost(conn)
+            raise
+        finally:
+            self.stats['commits'] = conn.commits
+            self.stats['seconds'] = time.perf_counter() - started
+            self.stats['rate'] = self.stats['commands'] / self.stats['seconds'] if self.stats['seconds'] else 0.0
+            pool.release(conn.conn, discard=broken)
+        return self.stats
+
+    def _run_one(self, conn: GroupedConnection, session: Session, number: int, command: str) -> tuple:
+        started = time.perf_counter()
+        try:
+            conn.begin_command()
+            output, ok, keep_open = contextvars.copy_context().run(execute, session, command)
+            conn.end_command()
+        except DBError as e:
+            # The transaction itself failed, which takes every uncommitted command in the group with it
+            self._lost(conn)
+            output, ok, keep_open = f'Error: Batch transaction failed, group rolled back - {e}\n', False, True
+        ok = ok and FAILED.search(output) is None
+        self.stats['commands'] += 1
+        self.stats['ok' if ok else 'failed'] += 1
+        result = {'line': number, 'command': mask(command), 'ok': ok, 'output': mask_output(output),
+                  'ms': round((time.perf_counter() - started) * 1000, 3)}
+        return result, keep_open
+
+    def _lost(self, conn: GroupedConnection) -> None:
+        self.stats['rolled_back'] += conn.abort()
+        # The caches already reflect the rolled back work
+        get_slot_cache().invalidate()
+        get_inventory().invalidate()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Run a file of scheduler commands, one per line.')
+    parser.add_argument('script', nargs='?', default='-', help='command file, or - for stdin (default)')
+    parser.add_argument('--group-size', type=int, default=100, help='commands committed together (default 100)')
+    parser.add_argument('--stop-on-error', action='store_true', help='stop at the first failed command')
+    parser.add_argument('--quiet', action='store_true', help='only print failed commands and the summary')
+    args = parser.parse_args()
+    check_settings()
+    out = sys.stdout
+
+    def emit(result: dict) -> None:
+        if not args.quiet or not result['ok']:
+            out.write(json.dumps(result) + '\n')
+
+    runner = BatchRunner(max(args.group_size, 1), args.stop_on_error)
+    script = sys.stdin if args.script == '-' else open(args.script, encoding='utf-8')
+    try:
+        summary = runner.run(script, emit)
+    finally:
+        if script is not sys.stdin:
+            script.close()
+    out.write(json.dumps({'summary': summary}) + '\n')
+    sys.exit(1 if summary['failed'] else 0)
@@ -0,0 +1,520 @@
+import argparse
+import contextvars
+import datetime
+import json
+import math
+import os
+import random
+import re
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from util.CompactId import get_ids
+
+
+"""
+Load generator for the scheduling commands. Seeds a local SQLite database with synthetic caregivers, patients,
+vaccines and availabilities, then drives concurrent simulated users through the command handlers and reports
+latency percentiles, throughput and database round-trips per command. Results can be saved as a baseline and
+later runs compared against it.
+"""
+
+PASSWORD = 'benchmark'
+START_DATE = datetime.date(2030, 1, 1)
+SEED_CHUNK = 10000
+DEFAULT_MIX = 'search=40,reserve=15,cancel=10,show=20,login_patient=10,login_caregiver=5'
+COMMANDS = ('search', 'reserve', 'cancel', 'show', 'login_patient', 'login_caregiver', 'resume')
+APPOINTMENT_ID = re.compile(r'Appointment ID: (\S+),')
+SESSION_TOKEN = re.compile(r'Session token: (\S+)')
+
+# Round-trips made by the command running on this thread
+_trips = threading.local()
+
+
+def _count(n: int = 1) -> None:
+    _trips.count = getattr(_trips, 'count', 0) + n
+
+
+class CountingCursor:
+
+    def __init__(self, cursor) -> None:
+        self._cursor = cursor
+
+    def execute(self, *args, **kwargs):
+        _count()
+        return self._cursor.execute(*args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        _count()
+        return self._cursor.executemany(*args, **kwargs)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class CountingConnection:
+    """
+    Connection wrapper counting every statement, commit and rollback as one round-trip to the database.
+    """
+
+    def __init__(self, conn) -> None:
+        self._conn = conn
+
+    def cursor(self, *args, **kwargs):
+        return CountingCursor(self._conn.cursor(*args, **kwargs))
+
+    def commit(self):
+        _count()
+        self._conn.commit()
+
+    def rollback(self):
+        _count()
+        self._conn.rollback()
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+def caregiver_name(i: int) -> str:
+    return f'cg{i:07d}'
+
+
+def patient_name(i: int) -> str:
+    return f'pt{i:07d}'
+
+
+def vaccine_name(i: int) -> str:
+    return f'vac{i:03d}'
+
+
+def _chunks(rows, size: int = SEED_CHUNK):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def seed(conn, hasher, caregivers: int, patients: int, vaccines: int, days: int, booked: float) -> dict:
+    """
+    Fills an empty database with synthetic data: every caregiver is available on each of days dates from
+    START_DATE, and a booked fraction of those slots already hold appointments. All users share one password.
+    @return: dict of row counts per table
+    """
+    salt, uhash, params = hasher.hash(PASSWORD)
+    rng = random.Random(42)
+    cursor = conn.cursor()
+    cursor.executemany('INSERT INTO Vaccines (Name, Doses, Version) VALUES (%s, %d, 0)',
+                       [(vaccine_name(i), 10 ** 9) for i in range(vaccines)])
+    for table, name, count in (('Caregivers', caregiver_name, caregivers), ('Patients', patient_name, patients)):
+        for chunk in _chunks((name(i), salt, uhash, params) for i in range(count)):
+            cursor.executemany(f'INSERT INTO {table} (Username, Salt, Hash, HashParams) VALUES (%s, %s, %s, %s)',
+                               chunk)
+    ids = get_ids()
+    slots = ((caregiver_name(c), START_DATE + datetime.timedelta(days=d), ids.next())
+             for c in range(caregivers) for d in range(days))
+    appointments = 0
+    for chunk in _chunks(slots):
+        cursor.executemany('INSERT INTO Availabilities (CaregiverID, Date, AppointmentID) VALUES (%s, %s, %s)', chunk)
+        taken = [(apt, vaccine_name(rng.randrange(vaccines)), patient_name(rng.randrange(patients)))
+                 for _, _, apt in chunk if rng.random() < booked]
+        cursor.executemany('INSERT INTO Appointments VALUES (%s, %s, %s)', taken)
+        appointments += len(taken)
+        conn.commit()
+    conn.commit()
+    return {'caregivers': caregivers, 'patients': patients, 'vaccines': vaccines,
+            'availabilities': caregivers * days, 'appointments': appointments}
+
+
+class SimulatedUser:
+    """
+    One patient issuing a random mix of commands through the scheduler's handlers, in its own session.
+    """
+
+    def __init__(self, index: int, sizes: dict, days: int, mix: dict, rng: random.Random) -> None:
+        # Imported here rather than at the top so main() can configure the backend first
+        from Scheduler import Session
+        from Server import execute
+        from Batch import FAILED
+        self._execute = execute
+        self._failed = FAILED
+        self.index = index
+        self.sizes = sizes
+        self.days = days
+        self.commands = list(mix)
+        self.weights = [mix[c] for c in self.commands]
+        self.rng = rng
+        self._session_class = Session
+        self.session = Session()
+        self.reserved = []
+        self.token = None
+
+    def _date(self) -> str:
+        return str(START_DATE + datetime.timedelta(days=self.rng.randrange(self.days)))
+
+    def next_command(self) -> tuple:
+        """
+        @return: tuple (benchmark command, list of command lines to run for it)
+        """
+        name = self.rng.choices(self.commands, self.weights)[0]
+        if name == 'cancel' and not self.reserved:
+            name = 'reserve'
+        if name == 'resume' and self.token is None:
+            name = 'login_patient'
+        patient = patient_name(self.index % self.sizes['patients'])
+        if name == 'search':
+            return name, [f'search_caregiver_schedule {self._date()}']
+        if name == 'reserve':
+            return name, [f'reserve {self._date()} {vaccine_name(self.rng.randrange(self.sizes["vaccines"]))}']
+        if name == 'cancel':
+            return name, [f'cancel {self.reserved.pop()}']
+        if name == 'show':
+            return name, ['show_appointments']
+        if name == 'resume':
+            return name, [f'resume {self.token}']
+        if name == 'login_patient':
+            return name, ['logout', f'login_patient {patient} {PASSWORD}']
+        caregiver = caregiver_name(self.rng.randrange(self.sizes['caregivers']))
+        return name, ['logout', f'login_caregiver {caregiver} {PASSWORD}', 'logout',
+                      f'login_patient {patient} {PASSWORD}']
+
+    def run(self, command_lines: list) -> tuple:
+        """
+        Runs the lines of one benchmark command.
+        @return: tuple (seconds, round-trips, ok)
+        """
+        _trips.count = 0
+        ok = True
+        started = time.perf_counter()
+        for line in command_lines:
+            if line.startswith('resume '):
+                # A client reconnecting: a new session, logged in by its token
+                self.session = self._session_class()
+            output, line_ok, _ = contextvars.copy_context().run(self._execute, self.session, line)
+            ok = ok and line_ok and self._failed.search(output) is None
+            match = APPOINTMENT_ID.search(output)
+            if match:
+                self.reserved.append(match.group(1))
+            match = SESSION_TOKEN.search(output)
+            if match:
+                self.token = match.group(1)
+        return time.perf_counter() - started, _trips.count, ok
+
+
+def percentile(sorted_values: list, p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    # Nearest-rank
+    return sorted_values[max(0, math.ceil(p / 100 * len(sorted_values)) - 1)]
+
+
+def drive(users: int, ops: int, sizes: dict, days: int, mix: dict, seed_value: int = 1) -> dict:
+    """
+    Runs users simulated users concurrently, each issuing ops commands after logging in.
+    @return: dict with per-command results and totals
+    """
+    from Server import SessionStdout
+    if not isinstance(sys.stdout, SessionStdout):
+        # Keeps what the commands print out of the report
+        sys.stdout = SessionStdout(sys.stdout)
+    samples = {name: [] for name in COMMANDS}
+    lock = threading.Lock()
+    start_barrier = threading.Barrier(users + 1)
+
+    def user_thread(index: int) -> None:
+        user = SimulatedUser(index, sizes, days, mix, random.Random(seed_value * 100003 + index))
+        patient = patient_name(index % sizes['patients'])
+        user.run([f'login_patient {patient} {PASSWORD}'])
+        start_barrier.wait()
+        mine = []
+        for _ in range(ops):
+            name, lines = user.next_command()
+            mine.append((name,) + user.run(lines))
+        with lock:
+            for name, seconds, trips, ok in mine:
+                samples[name].append((seconds, trips, ok))
+
+    threads = [threading.Thread(target=user_thread, args=(i,), name=f'user-{i}') for i in range(users)]
+    for t in threads:
+        t.start()
+    start_barrier.wait()
+    started = time.perf_counter()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    results = {}
+    for name, rows in samples.items():
+        if not rows:
+            continue
+        latencies = sorted(seconds * 1000 for seconds, _, _ in rows)
+        results[name] = {'ops': len(rows), 'ops_per_s': len(rows) / elapsed,
+                         'p50_ms': percentile(latencies, 50), 'p95_ms': percentile(latencies, 95),
+                         'p99_ms': percentile(latencies, 99), 'max_ms': latencies[-1],
+                         'round_trips': sum(trips for _, trips, _ in rows) / len(rows),
+                         'failed': sum(1 for _, _, ok in rows if not ok)}
+    total = sum(r['ops'] for r in results.values())
+    return {'seconds': elapsed, 'ops': total, 'ops_per_s': total / elapsed if elapsed else 0.0,
+            'commands': results}
+
+
+def report(run: dict, baseline: dict = None, tolerance: float = 0.2) -> list:
+    """
+    Prints a table of the results, with the change against baseline when given.
+    @return: list of regressions, (command, metric, baseline value, new value)
+    """
+    regressions = []
+    header = f'{"command":<16}{"ops":>8}{"ops/s":>10}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}{"trips":>8}' \
+             f'{"failed":>8}'
+    if baseline is not None:
+        header += f'{"p95 vs base":>13}{"ops/s vs base":>15}'
+    print(header)
+    for name in COMMANDS:
+        r = run['commands'].get(name)
+        if r is None:
+            continue
+        line = f'{name:<16}{r["ops"]:>8}{r["ops_per_s"]:>10.1f}{r["p50_ms"]:>10.2f}{r["p95_ms"]:>10.2f}' \
+               f'{r["p99_ms"]:>10.2f}{r["round_trips"]:>8.1f}{r["failed"]:>8}'
+        base = (baseline or {}).get('commands', {}).get(name)
+        if base is not None:
+            p95 = r['p95_ms'] / base['p95_ms'] - 1 if base['p95_ms'] else 0.0
+            rate = r['ops_per_s'] / base['ops_per_s'] - 1 if base['ops_per_s'] else 0.0
+            line += f'{p95:>+13.1%}{rate:>+15.1%}'
+            if p95 > tolerance:
+                regressions.append((name, 'p95_ms', base['p95_ms'], r['p95_ms']))
+            if r['round_trips'] > base['round_trips'] + 1e-9:
+                regressions.append((name, 'round_trips', base['round_trips'], r['round_trips']))
+        print(line)
+    print(f'total {run["ops"]} commands in {run["seconds"]:.2f}s, {run["ops_per_s"]:.1f}/s')
+    for name, metric, old, new in regressions:
+        print(f'REGRESSION {name} {metric}: {old:.2f} -> {new:.2f}')
+    return regressions
+
+
+def compare_ids(rows: int, directory: str) -> dict:
+    """
+    Inserts rows availabilities, half of them booked, into a fresh database per AppointmentID scheme (random UUIDs
+    as before, and compact ids) the way upload_availability and reserve write them, a caregiver's year at a time.
+    @return: dict, scheme -> insert rate, average key length and the size of each table and index in KiB
+    """
+    from db.SQLiteBackend import SQLiteBackend
+    schemes = {'uuid4': lambda n: [str(uuid.uuid4()) for _ in range(n)], 'compact': get_ids().next_many}
+    caregivers = -(-rows // 365)
+    results = {}
+    for scheme, make_ids in schemes.items():
+        path = os.path.join(directory, f'ids-{scheme}.db')
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+        backend = SQLiteBackend(path)
+        conn = backend.connect()
+        cursor = conn.cursor()
+        cursor.executemany('INSERT INTO Caregivers (Username) VALUES (%s)',
+                           [(caregiver_name(c),) for c in range(caregivers)])
+        cursor.execute("INSERT INTO Patients (Username) VALUES ('p')")
+        cursor.execute("INSERT INTO Vaccines (Name, Doses, Version) VALUES ('v', 0, 0)")
+        conn.commit()
+        started = time.perf_counter()
+        for c in range(caregivers):
+            days = min(365, rows - c * 365)
+            slots = [(caregiver_name(c), START_DATE + datetime.timedelta(days=d), apt_id)
+                     for d, apt_id in enumerate(make_ids(days))]
+            cursor.executemany('INSERT INTO Availabilities (CaregiverID, Date, AppointmentID) VALUES (%s, %s, %s)',
+                               slots)
+            cursor.executemany("INSERT INTO Appointments VALUES (%s, 'v', 'p')", [(s[2],) for s in slots[::2]])
+            conn.commit()
+        elapsed = time.perf_counter() - started
+        cursor.execute('SELECT AVG(LENGTH(AppointmentID)) FROM Availabilities')
+        key_length = cursor.fetchone()[0]
+        cursor.execute("SELECT name, SUM(pgsize) FROM dbstat WHERE name LIKE '%Availabilities%' "
+                       "OR name LIKE '%Appointments%' GROUP BY name ORDER BY name")
+        sizes = {name: size / 1024 for name, size in cursor.fetchall()}
+        conn.close()
+        backend.close()
+        results[scheme] = {'rows_per_s': rows * 1.5 / elapsed, 'key_length': key_length, 'kib': sizes}
+    return results
+
+
+def report_ids(results: dict) -> None:
+    schemes = list(results)
+    print(f'{"":<40}' + ''.join(f'{scheme:>12}' for scheme in schemes))
+    print(f'{"rows inserted/s":<40}' + ''.join(f'{results[s]["rows_per_s"]:>12.0f}' for s in schemes))
+    print(f'{"key length":<40}' + ''.join(f'{results[s]["key_length"]:>12.1f}' for s in schemes))
+    for name in results[schemes[0]]['kib']:
+        print(f'{name + " KiB":<40}' + ''.join(f'{results[s]["kib"].get(name, 0):>12.0f}' for s in schemes))
+
+
+def _read_prompt(proc) -> str:
+    # Reads the scheduler's output up to its next '> ' prompt
+    out = ''
+    while not out.endswith('\n> '):
+        chunk = os.read(proc.stdout.fileno(), 65536)
+        if not chunk:
+            raise RuntimeError(f'Scheduler exited early: {out[-500:]!r}')
+        out += chunk.decode()
+    return out
+
+
+def measure_startup(runs: int, path: str, typing: float = 0.2) -> dict:
+    """
+    Starts the interactive scheduler runs times on the SQLite database at path, created first if missing, and times
+    how long it takes to prompt for a command and to finish a first command that needs the database, entered typing
+    seconds after the prompt as a user would.
+    @return: dict, 'ready_ms' and 'first_command_ms' -> median over the runs
+    """
+    from db.SQLiteBackend import SQLiteBackend
+    backend = SQLiteBackend(path)
+    backend.connect().close()
+    backend.close()
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Scheduler.py')
+    env = dict(os.environ, Backend='sqlite', SQLitePath=path)
+    ready, first = [], []
+    for _ in range(runs):
+        started = time.perf_counter()
+        proc = subprocess.Popen([sys.executable, '-u', script], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                cwd=os.path.dirname(script), env=env)
+        try:
+            _read_prompt(proc)
+            prompted = time.perf_counter()
+            time.sleep(typing)
+            # Looks up an account that does not exist: a query, but no password hashing
+            proc.stdin.write(f'login_patient nobody {PASSWORD}\n'.encode())
+            proc.stdin.flush()
+            _read_prompt(proc)
+            done = time.perf_counter() - typing
+            proc.stdin.write(b'quit\n')
+            proc.stdin.flush()
+            proc.wait(timeout=30)
+        finally:
+            if proc.poll() is None:
+                proc.kill()
+        ready.append((prompted - started) * 1000)
+        first.append((done - prompted) * 1000)
+    return {'ready_ms': statistics.median(ready), 'first_command_ms': statistics.median(first)}
+
+
+def report_startup(result: dict, baseline: dict = None, tolerance: float = 0.2) -> list:
+    """
+    Prints the startup times, with the change against baseline when given.
+    @return: list of regressions, ('startup', metric, baseline value, new value)
+    """
+    regressions = []
+    for metric, value in result.items():
+        line = f'{metric:<20}{value:>10.1f}'
+        base = (baseline or {}).get('startup', {}).get(metric)
+        if base:
+            line += f'{value / base - 1:>+10.1%}'
+            if value / base - 1 > tolerance:
+                regressions.append(('startup', metric, base, value))
+        print(line)
+    for name, metric, old, new in regressions:
+        print(f'REGRESSION {name} {metric}: {old:.2f} -> {new:.2f}')
+    return regressions
+
+
+def parse_mix(text: str) -> dict:
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        if name not in COMMANDS:
+            raise ValueError(f'Unknown command {name!r} in mix, expected one of {", ".join(COMMANDS)}')
+        mix[name] = float(weight)
+    return mix
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Benchmark the scheduling commands against a local database.')
+    parser.add_argument('--db', default='benchmark.db', help='SQLite database file, seeded if empty')
+    parser.add_argument('--reseed', action='store_true', help='delete the database file and seed it again')
+    parser.add_argument('--caregivers', type=int, default=1000)
+    parser.add_argument('--patients', type=int, default=10000)
+    parser.add_argument('--vaccines', type=int, default=5)
+    parser.add_argument('--days', type=int, default=365, help='dates every caregiver is available on')
+    parser.add_argument('--booked', type=float, default=0.5, help='fraction of slots already reserved')
+    parser.add_argument('--users', type=int, default=16, help='concurrent simulated users')
+    parser.add_argument('--ops', type=int, default=200, help='commands per simulated user')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f'command weights (default {DEFAULT_MIX})')
+    parser.add_argument('--seed', type=int, default=1, help='random seed of the workload')
+    parser.add_argument('--save', help='write the results to this JSON file, e.g. as a baseline')
+    parser.add_argument('--compare', help='baseline JSON file to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed p95 slowdown before a regression')
+    parser.add_argument('--ids', type=int, metavar='ROWS',
+                        help='instead, compare AppointmentID schemes by inserting ROWS availabilities')
+    parser.add_argument('--startup', type=int, metavar='RUNS',
+                        help='instead, time starting the scheduler and running its first command RUNS times')
+    args = parser.parse_args()
+
+    if args.ids:
+        report_ids(compare_ids(args.ids, os.path.dirname(os.path.abspath(args.db))))
+        return 0
+    if args.startup:
+        baseline = None
+        if args.compare:
+            with open(args.compare) as f:
+                baseline = json.load(f)
+        result = measure_startup(args.startup, args.db)
+        regressions = report_startup(result, baseline, args.tolerance)
+        if args.save:
+            with open(args.save, 'w') as f:
+                json.dump({'startup': result}, f, indent=2)
+        return 1 if regressions else 0
+
+    # The backend is picked when the scheduler modules are first imported, so configure it before importing them
+    if args.reseed:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(args.db + suffix):
+                os.remove(args.db + suffix)
+    os.environ['Backend'] = 'sqlite'
+    os.environ['SQLitePath'] = args.db
+    os.environ.setdefault('PoolMaxSize', str(args.users + 2))
+    from db.Backend import get_backend
+    from util.PasswordHasher import get_hasher
+    from Scheduler import check_settings
+    check_settings()
+    backend = get_backend()
+    connect = backend.connect
+    backend.connect = lambda: CountingConnection(connect())
+
+    conn = connect()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('SELECT COUNT(*) FROM Caregivers')
+        if cursor.fetchone()[0] == 0:
+            started = time.perf_counter()
+            counts = seed(conn, get_hasher(), args.caregivers, args.patients, args.vaccines, args.days, args.booked)
+            print(f'Seeded {counts} in {time.perf_counter() - started:.1f}s')
+        else:
+            print(f'Reusing {args.db}, pass --reseed to seed it again with new sizes')
+        # Sizes of what is actually in the database, which may have been seeded by an earlier run
+        cursor.execute('SELECT (SELECT COUNT(*) FROM Caregivers), (SELECT COUNT(*) FROM Patients), '
+                       '(SELECT COUNT(*) FROM Vaccines), (SELECT MAX(Date) FROM Availabilities)')
+        caregivers, patients, vaccines, last = cursor.fetchone()
+    finally:
+        conn.close()
+    sizes = {'caregivers': caregivers, 'patients': patients, 'vaccines': vaccines}
+    # SQLite returns aggregates of DATE columns as text
+    days = (datetime.date.fromisoformat(str(last)[:10]) - START_DATE).days + 1
+
+    run = drive(args.users, args.ops, sizes, days, parse_mix(args.mix), args.seed)
+    run['config'] = {k: v for k, v in vars(args).items() if k not in ('save', 'compare', 'reseed')}
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    regressions = report(run, baseline, args.tolerance)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(run, f, indent=2)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
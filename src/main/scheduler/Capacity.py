@@ -0,0 +1,183 @@
+import argparse
+import datetime
+import sys
+import time
+from db.ConnectionManager import ConnectionManager, DBError
+from db.InventoryCache import get_inventory
+
+
+"""
+Capacity planning report for the coming days: caregiver slots against booked appointments, and the doses left of
+each vaccine against what the open slots would use if they were booked. The database counts slots and bookings per
+date and vaccine and per caregiver from Availabilities' indexes (BookedVaccine, added by migration 0007), and
+everything else is computed on those counts with NumPy, which is only needed for this report (pip install numpy).
+"""
+
+DATE_FORMAT = '%Y-%m-%d'
+
+# Slots per date and booked vaccine, NULL for the open ones; read in IX_Availabilities_BookedVaccine order
+BY_DATE = 'SELECT Date, BookedVaccine, COUNT(*) FROM Availabilities WHERE Date BETWEEN %s AND %s ' \
+          'GROUP BY Date, BookedVaccine'
+# Slots and bookings of every caregiver, one seek of the UNIQUE(CaregiverID, Date) index each rather than a sort
+BY_CAREGIVER = 'SELECT C.Username, ' \
+               '(SELECT COUNT(*) FROM Availabilities AV WHERE AV.CaregiverID = C.Username ' \
+               'AND AV.Date BETWEEN %s AND %s), ' \
+               '(SELECT COUNT(AV.BookedVaccine) FROM Availabilities AV WHERE AV.CaregiverID = C.Username ' \
+               'AND AV.Date BETWEEN %s AND %s) FROM Caregivers C'
+
+
+class CapacityPlanner:
+    """
+    Builds the report's arrays: for D days, C caregivers with a slot in the window and V vaccines,
+        slots, booked       D int, slots and appointments per day
+        vaccines            D x V int, appointments booked per day and vaccine
+        caregiver_slots,
+        caregiver_booked    C int, slots and appointments per caregiver
+    Open slots are projected to be booked at fill times their number, split between vaccines in the proportions
+    already booked in the window (evenly if nothing is), and doses are used up in date order.
+    """
+
+    def __init__(self, fill: float = 1.0) -> None:
+        """
+        @param fill: float, fraction of the open slots expected to be booked
+        """
+        try:
+            import numpy
+        except ImportError:
+            raise RuntimeError('Capacity planning needs numpy: pip install numpy') from None
+        self._np = numpy
+        self.fill = fill
+
+    def load(self, start: datetime.date, days: int) -> dict:
+        """
+        Counts the slots from start for days days, and reads the doses left of every vaccine.
+        @return: dict with dates, caregivers and vaccine names, the arrays above and doses
+        """
+        np = self._np
+        dates = [start + datetime.timedelta(days=i) for i in range(days)]
+        day_index = {date: i for i, date in enumerate(dates)}
+        inventory = get_inventory().all()
+        vaccine_index = {name: i for i, (name, _) in enumerate(inventory)}
+        with ConnectionManager() as conn:
+            cursor = conn.cursor()
+            cursor.execute(BY_DATE, (dates[0], dates[-1]))
+            by_date = cursor.fetchall()
+            cursor.execute(BY_CAREGIVER, (dates[0], dates[-1], dates[0], dates[-1]))
+            by_caregiver = cursor.fetchall()
+        day = np.array([day_index[row[0]] for row in by_date], np.int64)
+        # -1 for open slots, and for a vaccine added since the inventory was read
+        vaccine = np.array([vaccine_index.get(row[1], -1) for row in by_date], np.int64)
+        count = np.array([row[2] for row in by_date], np.int64)
+        is_booked = np.array([row[1] is not None for row in by_date], bool)
+        known = vaccine >= 0
+        vaccines = np.zeros((days, len(inventory)), np.int64)
+        np.add.at(vaccines, (day[known], vaccine[known]), count[known])
+        caregiver_slots = np.array([row[1] for row in by_caregiver], np.int64)
+        caregiver_booked = np.array([row[2] for row in by_caregiver], np.int64)
+        active = caregiver_slots > 0
+        return {'dates': dates, 'vaccine_names': [name for name, _ in inventory],
+                'caregivers': [row[0] for row, keep in zip(by_caregiver, active) if keep],
+                'slots': np.bincount(day, weights=count, minlength=days).astype(np.int64),
+                'booked': np.bincount(day[is_booked], weights=count[is_booked], minlength=days).astype(np.int64),
+                'vaccines': vaccines, 'caregiver_slots': caregiver_slots[active],
+                'caregiver_booked': caregiver_booked[active],
+                'doses': np.array([doses for _, doses in inventory], np.int64)}
+
+    def plan(self, data: dict) -> dict:
+        """
+        Computes the report from the arrays of load().
+        @return: dict of per-day arrays (slots, booked, open, utilization, projected, uncovered), per-caregiver
+            caregiver_utilization and per-vaccine arrays (booked_total, projected_total, exhausted (day index, -1 if
+            never), shortfall)
+        """
+        np = self._np
+        slots, booked = data['slots'], data['booked']
+        open_slots = slots - booked
+        caregiver_slots = data['caregiver_slots']
+        doses = data['doses']
+        booked_total = data['vaccines'].sum(axis=0)
+        if booked_total.sum():
+            share = booked_total / booked_total.sum()
+        else:
+            share = np.full(len(doses), 1 / len(doses)) if len(doses) else np.zeros(0)
+        # Expected new bookings per day and vaccine, and the doses they would use up to each day
+        projected = self.fill * open_slots[:, None] * share[None, :]
+        used = np.cumsum(projected, axis=0)
+        short = used > doses[None, :]
+        # Bookings past the last dose, each day's share of the running overrun
+        uncovered = np.diff(np.maximum(used - doses[None, :], 0), axis=0, prepend=np.zeros((1, len(doses))))
+        return {'slots': slots, 'booked': booked, 'open': open_slots,
+                'utilization': np.divide(booked, slots, out=np.zeros(len(slots)), where=slots > 0),
+                'projected': projected.sum(axis=1), 'uncovered': uncovered.sum(axis=1),
+                'caregiver_slots': caregiver_slots,
+                'caregiver_utilization': np.divide(data['caregiver_booked'], caregiver_slots,
+                                                   out=np.zeros(len(caregiver_slots)), where=caregiver_slots > 0),
+                'booked_total': booked_total, 'projected_total': used[-1],
+                'exhausted': np.where(short.any(axis=0), short.argmax(axis=0), -1),
+                'shortfall': np.maximum(used[-1] - doses, 0)}
+
+    def report(self, data: dict, plan: dict, by: int = 1, top: int = 5) -> None:
+        """
+        Prints the report, one line per by days.
+        @param top: int, busiest caregivers listed
+        """
+        np = self._np
+        dates = data['dates']
+        starts = np.arange(0, len(dates), by)
+        sums = {key: np.add.reduceat(plan[key], starts) for key in ('slots', 'booked', 'open', 'projected',
+                                                                    'uncovered')}
+        print(f'{"from":<12}{"slots":>10}{"booked":>10}{"open":>10}{"util":>8}{"projected":>11}{"no dose":>10}')
+        for i, first in enumerate(starts):
+            slots = sums['slots'][i]
+            print(f'{dates[first].strftime(DATE_FORMAT):<12}{slots:>10}{sums["booked"][i]:>10}{sums["open"][i]:>10}'
+                  f'{sums["booked"][i] / slots if slots else 0:>8.0%}{sums["projected"][i]:>11.0f}'
+                  f'{sums["uncovered"][i]:>10.0f}')
+        print()
+        print(f'{"vaccine":<20}{"doses left":>12}{"booked":>10}{"projected":>11}{"runs out":>12}{"short":>10}')
+        for v, name in enumerate(data['vaccine_names']):
+            day = plan['exhausted'][v]
+            runs_out = dates[day].strftime(DATE_FORMAT) if day >= 0 else '-'
+            print(f'{name:<20}{data["doses"][v]:>12}{plan["booked_total"][v]:>10}{plan["projected_total"][v]:>11.0f}'
+                  f'{runs_out:>12}{plan["shortfall"][v]:>10.0f}')
+        utilization = plan['caregiver_utilization']
+        if len(utilization):
+            print()
+            print(f'{len(utilization)} caregivers with slots, mean utilization {utilization.mean():.0%}, '
+                  f'{int((utilization >= 0.9).sum())} at 90% or more')
+            for c in np.argsort(-utilization, kind='stable')[:top]:
+                print(f'  {data["caregivers"][c]:<30}{utilization[c]:>6.0%} of {plan["caregiver_slots"][c]} slots')
+
+
+def parse_date(text: str) -> datetime.date:
+    return datetime.datetime.strptime(text, DATE_FORMAT).date()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Report caregiver capacity and vaccine doses for the coming days.')
+    parser.add_argument('--from', dest='start', type=parse_date, help='first day, YYYY-MM-DD (default today)')
+    parser.add_argument('--days', type=int, default=90, help='days covered (default 90)')
+    parser.add_argument('--by', choices=('day', 'week'), default='day', help='one line per day or per week')
+    parser.add_argument('--fill', type=float, default=1.0,
+                        help='fraction of open slots expected to be booked, for the dose projection (default 1)')
+    parser.add_argument('--top', type=int, default=5, help='busiest caregivers listed (default 5)')
+    args = parser.parse_args()
+    if args.days < 1:
+        print('Error: --days must be at least 1', file=sys.stderr)
+        sys.exit(1)
+    start = args.start or datetime.date.today()
+    try:
+        planner = CapacityPlanner(args.fill)
+        started = time.perf_counter()
+        data = planner.load(start, args.days)
+        loaded = time.perf_counter()
+        plan = planner.plan(data)
+        planned = time.perf_counter()
+    except DBError as e:
+        print(f'Error: Capacity report failed - {e} (is migration 0007 applied? see Migrate.py)', file=sys.stderr)
+        sys.exit(1)
+    except RuntimeError as e:
+        print(f'Error: {e}', file=sys.stderr)
+        sys.exit(1)
+    planner.report(data, plan, 7 if args.by == 'week' else 1, args.top)
+    print(f'\n{args.days} days from {start.strftime(DATE_FORMAT)}: loaded in {loaded - started:.2f}s, '
+          f'computed in {(planned - loaded) * 1000:.1f}ms', file=sys.stderr)
@@ -0,0 +1,167 @@
+import argparse
+import csv
+import datetime
+import itertools
+import os
+import sys
+import time
+from db.ConnectionManager import ConnectionManager, DBError
+from model.Caregiver import Caregiver
+from model.Patient import Patient
+
+
+"""
+Exports appointments, the vaccine inventory or the accounts for reporting, to CSV or Parquet. Rows are streamed from
+one query --chunk-rows at a time and written as they arrive, so memory stays flat however many rows there are. Output
+goes to a temporary file that replaces the target only once the export is complete.
+"""
+
+DATE_FORMAT = '%Y-%m-%d'
+
+# Every booked appointment, in the order of IX_Availabilities_Date so the database streams it without a sort
+APPOINTMENTS = 'SELECT AP.AppointmentID, AV.Date, AV.CaregiverID, AP.PatientID, AP.VaccineType ' \
+               'FROM Availabilities AV JOIN Appointments AP ON AP.AppointmentID = AV.AppointmentID ' \
+               'WHERE AV.Date BETWEEN %s AND %s ORDER BY AV.Date, AV.CaregiverID'
+# Doses left of every vaccine, and how many are booked on dates in the range
+INVENTORY = 'SELECT V.Name, V.Doses, (SELECT COUNT(*) FROM Appointments AP ' \
+            'JOIN Availabilities AV ON AV.AppointmentID = AP.AppointmentID ' \
+            'WHERE AP.VaccineType = V.Name AND AV.Date BETWEEN %s AND %s) FROM Vaccines V ORDER BY V.Name'
+
+# Dataset -> (query, [(column, type)]), type one of 'string', 'date', 'int'
+DATASETS = {
+    'appointments': (APPOINTMENTS, [('AppointmentID', 'string'), ('Date', 'date'), ('CaregiverID', 'string'),
+                                    ('PatientID', 'string'), ('VaccineType', 'string')]),
+    'inventory': (INVENTORY, [('Vaccine', 'string'), ('DosesLeft', 'int'), ('DosesBooked', 'int')]),
+    # Listed as AccountRow tuples, without password material; the hash parameters show who is still to be rehashed
+    'patients': (Patient, [('Username', 'string'), ('HashParams', 'string')]),
+    'caregivers': (Caregiver, [('Username', 'string'), ('HashParams', 'string')]),
+}
+
+# Without --from/--to every date is exported
+FIRST_DATE = datetime.date(1900, 1, 1)
+LAST_DATE = datetime.date(9999, 12, 31)
+
+
+class CsvWriter:
+
+    def __init__(self, f, columns: list) -> None:
+        self._writer = csv.writer(f)
+        self._writer.writerow([name for name, _ in columns])
+
+    def write(self, rows: list) -> None:
+        self._writer.writerows(rows)
+
+    def close(self) -> None:
+        pass
+
+
+class ParquetWriter:
+    """
+    Writes each chunk as one row group. Needs pyarrow, which is only imported when Parquet is asked for.
+    """
+
+    def __init__(self, f, columns: list) -> None:
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError('Parquet export needs pyarrow: pip install pyarrow') from None
+        self._pa = pyarrow
+        types = {'string': pyarrow.string(), 'date': pyarrow.date32(), 'int': pyarrow.int64()}
+        self._schema = pyarrow.schema([(name, types[kind]) for name, kind in columns])
+        self._writer = pyarrow.parquet.ParquetWriter(f, self._schema)
+
+    def write(self, rows: list) -> None:
+        columns = [list(values) for values in zip(*rows)]
+        self._writer.write_table(self._pa.Table.from_arrays(columns, schema=self._schema))
+
+    def close(self) -> None:
+        self._writer.close()
+
+
+WRITERS = {'csv': (CsvWriter, 'w'), 'parquet': (ParquetWriter, 'wb')}
+
+
+class Exporter:
+
+    def __init__(self, chunk_rows: int = 10000) -> None:
+        """
+        @param chunk_rows: int, rows fetched and written at a time
+        """
+        self.chunk_rows = chunk_rows
+
+    def chunks(self, dataset: str, start=None, end=None):
+        """
+        Generates the rows of dataset with dates from start to end (inclusive), as lists of at most chunk_rows.
+        Accounts have no date, so the range does not apply to them.
+        """
+        query, _ = DATASETS[dataset]
+        if not isinstance(query, str):
+            rows = query.iter_rows()
+            for chunk in iter(lambda: list(itertools.islice(rows, self.chunk_rows)), []):
+                yield chunk
+            return
+        with ConnectionManager() as conn:
+            cursor = conn.cursor()
+            cursor.execute(query, (start or FIRST_DATE, end or LAST_DATE))
+            while True:
+                rows = cursor.fetchmany(self.chunk_rows)
+                if not rows:
+                    return
+                yield rows
+
+    def export(self, dataset: str, path: str, fmt: str = 'csv', start=None, end=None) -> int:
+        """
+        Writes dataset to path ('-' for stdout, CSV only) in fmt ('csv' or 'parquet').
+        @return: int, rows written
+        """
+        writer_class, mode = WRITERS[fmt]
+        _, columns = DATASETS[dataset]
+        if path == '-':
+            if fmt != 'csv':
+                raise ValueError('Only CSV can be written to stdout')
+            return self._write(writer_class(sys.stdout, columns), dataset, start, end)
+        tmp = f'{path}.{os.getpid()}.tmp'
+        try:
+            with open(tmp, mode, **({'newline': '', 'encoding': 'utf-8'} if mode == 'w' else {})) as f:
+                rows = self._write(writer_class(f, columns), dataset, start, end)
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        return rows
+
+    def _write(self, writer, dataset: str, start, end) -> int:
+        written = 0
+        for rows in self.chunks(dataset, start, end):
+            writer.write(rows)
+            written += len(rows)
+        writer.close()
+        return written
+
+
+def parse_date(text: str) -> datetime.date:
+    return datetime.datetime.strptime(text, DATE_FORMAT).date()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Export appointments, vaccine inventory or accounts to CSV or '
+                                                 'Parquet.')
+    parser.add_argument('dataset', choices=sorted(DATASETS))
+    parser.add_argument('output', help='file to write, or - for stdout (CSV only)')
+    parser.add_argument('--format', choices=sorted(WRITERS), help='default: from the output file extension, else csv')
+    parser.add_argument('--from', dest='start', type=parse_date, help='first appointment date, YYYY-MM-DD')
+    parser.add_argument('--to', dest='end', type=parse_date, help='last appointment date, YYYY-MM-DD')
+    parser.add_argument('--chunk-rows', type=int, default=10000, help='rows fetched and written at a time')
+    args = parser.parse_args()
+    fmt = args.format or ('parquet' if args.output.lower().endswith('.parquet') else 'csv')
+    started = time.perf_counter()
+    try:
+        count = Exporter(max(args.chunk_rows, 1)).export(args.dataset, args.output, fmt, args.start, args.end)
+    except DBError as e:
+        print(f'Error: Export failed - {e}', file=sys.stderr)
+        sys.exit(1)
+    except (RuntimeError, ValueError) as e:
+        print(f'Error: {e}', file=sys.stderr)
+        sys.exit(1)
+    print(f'Exported {count} {args.dataset} row(s) in {time.perf_counter() - started:.1f}s', file=sys.stderr)
@@ -0,0 +1,50 @@
+import argparse
+import sys
+from db.Backend import get_backend
+from db.ConnectionManager import ConnectionManager
+from db.MigrationRunner import MigrationRunner
+
+
+"""
+Upgrades the configured database to the latest schema version and checks the query plans the migrations promise.
+Run it after create.sql on a new database, and after pulling changes that add files to resources/migrations.
+"""
+
+
+def status(runner: MigrationRunner, conn) -> None:
+    applied = runner.applied(conn)
+    if applied is None:
+        print('No SchemaMigrations table yet; the next upgrade will create it.')
+        applied = set()
+    for migration in runner.migrations:
+        print(f'{"applied" if migration.version in applied else "pending":<9}{migration}')
+
+
+def check(runner: MigrationRunner, conn, verbose: bool = False) -> bool:
+    ok = True
+    for migration, query, plan, scans in runner.check_plans(conn):
+        print(f'{"SCAN" if scans else "ok":<6}{migration}: {query}')
+        for line in (plan if verbose else scans):
+            print(f'        {line}')
+        ok = ok and not scans
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Apply pending schema migrations to the configured database.')
+    parser.add_argument('--status', action='store_true', help='list applied and pending migrations and exit')
+    parser.add_argument('--to', type=int, help='stop after this version')
+    parser.add_argument('--check', action='store_true', help='after upgrading, verify no checked query scans a table')
+    parser.add_argument('--verbose', action='store_true', help='print the full plan of every checked query')
+    args = parser.parse_args()
+    runner = MigrationRunner(get_backend())
+    with ConnectionManager() as conn:
+        if args.status:
+            status(runner, conn)
+            sys.exit(0)
+        done = runner.upgrade(conn, args.to, progress=lambda m: print(f'Applying {m} ...'))
+        print(f'{len(done)} migration(s) applied, database is at version '
+              f'{max(runner.applied(conn) or {0})}.')
+        if args.check and not check(runner, conn, args.verbose):
+            print('Error: Some queries still scan a table.')
+            sys.exit(1)
@@ -1,26 +1,70 @@
 from model.Vaccine import Vaccine
 from model.Caregiver import Caregiver
 from model.Patient import Patient
-from util.Util import Util
-from db.ConnectionManager import ConnectionManager
-import pymssql
+from model.Appointment import Appointment
+from model.Waitlist import Waitlist
+from util.PasswordHasher import get_hasher
+from util.Metrics import get_metrics
+from util.AccountImport import AccountImport
+from util.WaitlistMatcher import get_matcher
+from db.ConnectionManager import ConnectionManager, DBError, prewarm
+from db.InventoryCache import get_inventory
+from db.SlotCache import get_slot_cache
+from db.UsernameFilter import get_usernames
+from db.SessionStore import get_sessions
+import contextvars
 import datetime
-from operator import itemgetter
+import sys
 
 
-# Objects for containing current user information
-# None -> logged out
-current_patient = None
-current_caregiver = None
+class Session:
+    """
+    Login state of one user of the scheduler: the interactive console, or one connection to the server.
+    """
+
+    def __init__(self) -> None:
+        # Objects for containing current user information
+        # None -> logged out
+        self.patient = None
+        self.caregiver = None
+        # Session token printed at login, revoked at logout
+        self.token = None
+
+
+# Session of whoever is running the current command, defaulting to the interactive console's
+_console_session = Session()
+_session = contextvars.ContextVar('session', default=_console_session)
+
+
+def current_session() -> Session:
+    return _session.get()
+
+
+def use_session(session: Session) -> None:
+    """
+    Makes session the current one in this context (see contextvars), e.g. for one server connection.
+    """
+    _session.set(session)
+
 
 # Date format used by program, printed for users on startup
 # Eg: %Y-%m-%d -> YYYY-MM-DD
 DATE_FORMAT = '%Y-%m-%d'
 
+# Day names and day sets accepted by bulk upload_availability, Monday = 0
+WEEKDAYS = ['mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun']
+DAY_SETS = {'daily': set(range(7)), 'weekdays': set(range(5)), 'weekends': {5, 6}}
+# Most dates a single bulk upload may cover
+MAX_UPLOAD_DAYS = 731
+# Range searches cover at most MAX_SEARCH_DAYS days, shown SEARCH_PAGE_DAYS days per page
+MAX_SEARCH_DAYS = 366
+SEARCH_PAGE_DAYS = 31
+
 
 def uname_exists(username: str, table: str) -> bool:
     """
     Checks if a given username exists in the database, for either Patients or Caregivers.
+    Names the username filter rules out are answered without a query.
     Will error if given an incorrect name.
     @param username: str, username to check
     @param table: str, either 'Patients' or 'Caregivers'
@@ -29,24 +73,21 @@ def uname_exists(username: str, table: str) -> bool:
     # check for valid table input
     if table != 'Caregivers' and table != 'Patients':
         raise Exception('Bad table input -- you should not see this :)')
-    cm = ConnectionManager()
-    conn = cm.create_connection()
-    select_username = f"SELECT * FROM {table} WHERE Username = '{username}'"
+    select_username = f"SELECT 1 FROM {table} WHERE Username = %s"
     try:
-        cursor = conn.cursor(as_dict=True)
-        cursor.execute(select_username)
-        #  returns false if the cursor is not before the first record or if there are no rows in the ResultSet.
-        for row in cursor:
-            return row['Username'] is not None
-    except pymssql.Error as e:
+        if not get_usernames(table).might_contain(username):
+            return False
+        with ConnectionManager() as conn:
+            cursor = conn.cursor()
+            cursor.execute(select_username, username)
+            return cursor.fetchone() is not None
+    except DBError as e:
         print("Error occurred when checking username")
         print("Db-Error:", e)
         quit()
     except Exception as e:
         print("Error occurred when checking username")
         print("Error:", e)
-    finally:
-        cm.close_connection()
     return False
 
 
@@ -66,14 +107,13 @@ def create_caregiver(tokens: list) -> None:
     if uname_exists(username, 'Caregivers'):
         print(f'Username taken, try again!')
         return
-    salt = Util.generate_salt()
-    uhash = Util.generate_hash(password, salt)
+    salt, uhash, params = get_hasher().hash(password)
     # create the caregiver
-    caregiver = Caregiver(username, salt=salt, uhash=uhash)
+    caregiver = Caregiver(username, salt=salt, uhash=uhash, params=params)
     # save to caregiver information to our database
     try:
-        caregiver.save_to_db()
-    except pymssql.Error as e:
+        created = caregiver.save_to_db()
+    except DBError as e:
         print("Failed to create user.")
         print("Db-Error:", e)
         quit()
@@ -81,6 +121,9 @@ def create_caregiver(tokens: list) -> None:
         print("Failed to create user.")
         print(e)
         return
+    if not created:
+        print(f'Username taken, try again!')
+        return
     print("Created user ", username)
 
 
@@ -100,12 +143,11 @@ def create_patient(tokens: list) -> None:
     if uname_exists(uname, 'Patients'):
         print('Username taken, try again!')
         return
-    salt = Util.generate_salt()
-    uhash = Util.generate_hash(pw, salt)
-    patient = Patient(uname, salt=salt, uhash=uhash)
+    salt, uhash, params = get_hasher().hash(pw)
+    patient = Patient(uname, salt=salt, uhash=uhash, params=params)
     try:
-        patient.save_to_db()
-    except pymssql.Error as e:
+        created = patient.save_to_db()
+    except DBError as e:
         print(f'Failed to create user.')
         print(f'Db-Error: {e}')
         return
@@ -113,9 +155,38 @@ def create_patient(tokens: list) -> None:
         print(f'Failed to create user.')
         print(f'Exception: {e}')
         return
+    if not created:
+        print('Username taken, try again!')
+        return
     print(f'Created user {uname}')
 
 
+def import_accounts(tokens: list) -> None:
+    """
+    Creates patients or caregivers in bulk from a CSV file of username,password rows.
+    Usernames that already exist are skipped.  Passwords are hashed in parallel across all cores.
+    @param tokens: list, contains user input, valid format ['import_accounts', 'patients' or 'caregivers', 'path']
+    @return: None, prints progress and a throughput summary in console and commits accounts to DB.
+    """
+    if len(tokens) != 3 or tokens[1] not in ('patients', 'caregivers'):
+        print('Error: Please provide patients or caregivers and a CSV file path.')
+        return
+    importer = AccountImport(tokens[1].capitalize())
+    try:
+        with open(tokens[2], newline='') as f:
+            stats = importer.run(f, progress=lambda st: print(f'... {st["created"]} created, {st["rate"]:.0f}/s'))
+    except OSError as e:
+        print(f'Error: Could not read {tokens[2]}')
+        print(f'Error: {e}')
+        return
+    except DBError as e:
+        print('Error: Import failed, accounts committed so far were kept.')
+        print(f'Db-Msg: {e}')
+        return
+    print(f'Imported {stats["created"]} {tokens[1]} in {stats["seconds"]:.1f}s ({stats["rate"]:.0f}/s): '
+          f'{stats["existing"]} already existed, {stats["invalid"]} invalid rows skipped.')
+
+
 def login_patient(tokens: list) -> None:
     """
     Logs in patient given user input.  Requires valid username-password combination.
@@ -123,8 +194,8 @@ def login_patient(tokens: list) -> None:
     @param tokens: list, contains user input, only valid format ['login_patient', 'username', 'password']
     @return: None, prints status in console and sets current logged in patient.
     """
-    global current_patient
-    if current_caregiver is not None or current_patient is not None:
+    session = current_session()
+    if session.caregiver is not None or session.patient is not None:
         print('You are already logged in, please logout first.')
         return
     if len(tokens) != 3:
@@ -135,7 +206,7 @@ def login_patient(tokens: list) -> None:
     patient = None
     try:
         patient = Patient(uname, password=pw).get()
-    except pymssql.Error as e:
+    except DBError as e:
         print("Login failed.")
         print("Db-Error:", e)
         quit()
@@ -147,7 +218,8 @@ def login_patient(tokens: list) -> None:
         print("Login failed.")
     else:
         print(f'Logged in as {uname}')
-        current_patient = patient
+        session.patient = patient
+        session.token = issue_token('patient', uname)
 
 
 def login_caregiver(tokens: list) -> None:
@@ -158,8 +230,8 @@ def login_caregiver(tokens: list) -> None:
     @return: None, prints status in console and sets current logged in caregiver.
     """
     # check 1: if someone's already logged-in, they need to log out first
-    global current_caregiver
-    if current_caregiver is not None or current_patient is not None:
+    session = current_session()
+    if session.caregiver is not None or session.patient is not None:
         print("User already logged in.")
         return
 
@@ -174,7 +246,7 @@ def login_caregiver(tokens: list) -> None:
     caregiver = None
     try:
         caregiver = Caregiver(username, password=password).get()
-    except pymssql.Error as e:
+    except DBError as e:
         print("Login failed.")
         print("Db-Error:", e)
         quit()
@@ -188,7 +260,56 @@ def login_caregiver(tokens: list) -> None:
         print("Login failed.")
     else:
         print("Logged in as: " + username)
-        current_caregiver = caregiver
+        session.caregiver = caregiver
+        session.token = issue_token('caregiver', username)
+
+
+def issue_token(kind: str, username: str):
+    """
+    Starts a session for the user who just logged in with their password and prints its token.
+    @return: str, the token, or None if it could not be stored (the login stands regardless)
+    """
+    try:
+        token = get_sessions().issue(kind, username)
+    except DBError as e:
+        print('Could not start a session token.')
+        print(f'Db-Error: {e}')
+        return None
+    print(f'Session token: {token} (log in again later with: resume <token>)')
+    return token
+
+
+def resume(tokens: list) -> None:
+    """
+    Logs in with the session token printed at an earlier login, without the password. Only accessible if no user
+    is logged in.
+    @param tokens: list, contains user input, only valid format ['resume', 'token']
+    @return: None, prints status in console and sets the current logged in user.
+    """
+    session = current_session()
+    if session.caregiver is not None or session.patient is not None:
+        print('You are already logged in, please logout first.')
+        return
+    if len(tokens) != 2:
+        print('Login failed.')
+        return
+    try:
+        found = get_sessions().verify(tokens[1])
+    except DBError as e:
+        print('Login failed.')
+        print(f'Db-Error: {e}')
+        return
+    if found is None:
+        print('Login failed, the session has expired or was logged out.')
+        return
+    kind, username = found
+    if kind == 'patient':
+        session.patient = Patient(username)
+        print(f'Logged in as {username}')
+    else:
+        session.caregiver = Caregiver(username)
+        print("Logged in as: " + username)
+    session.token = tokens[1]
 
 
 def search_caregiver_schedule(tokens) -> None:
@@ -198,13 +319,15 @@ def search_caregiver_schedule(tokens) -> None:
     @param tokens: list contains user input.  Must be form 'search_caregiver_schedule YYYY-MM-DD
     @return: None, prints status to console.
     """
-    global current_caregiver
-    global current_patient
+    session = current_session()
     global DATE_FORMAT
     # Ensure someone logs in.
-    if current_caregiver is None and current_patient is None:
+    if session.caregiver is None and session.patient is None:
         print('Error: Please login first!')
         return
+    if len(tokens) > 2:
+        search_caregiver_schedule_range(tokens)
+        return
     # Ensure date was provided
     if len(tokens) != 2:
         print('Error: Please provide date!')
@@ -216,28 +339,17 @@ def search_caregiver_schedule(tokens) -> None:
         print(f'Error: Could not read date')
         print(f'Datetime Error - {e}')
         return
-    # Grab available vaccines and caregivers
-    cm = ConnectionManager()
-    conn = cm.create_connection()
-    cursor = conn.cursor(as_dict=True)
+    # Grab available vaccines and caregivers, both served from in-process caches that only query on a miss
     try:
-        grab_vaccines = 'SELECT Name, Doses FROM Vaccines;'
-        cursor.execute(grab_vaccines)
         vaccines = []
-        for row in cursor:
-            vaccines.append(f'{row["Name"]} {row["Doses"]}')
-        grab_caregivers = 'SELECT AV.AppointmentID, AV.CaregiverID ' \
-                          'FROM Availabilities AV LEFT JOIN Appointments AP ' \
-                          'ON AP.AppointmentID = AV.AppointmentID ' \
-                          'WHERE AP.AppointmentID is null AND AV.Date = %s'
+        for name, doses in Vaccine.get_all():
+            vaccines.append(f'{name} {doses}')
         try:
             slots = []
-            cursor.execute(grab_caregivers, str(date.date()))
-            for row in cursor:
-                slots.append(f'{row["AppointmentID"]} {row["CaregiverID"]}')
+            for apt_id, caregiver in get_slot_cache().get(date.date()):
+                slots.append(f'{apt_id} {caregiver}')
             if len(slots) == 0:
                 print(f'Sorry, no appointments available for {date}')
-                cm.close_connection()
                 return
             else:
                 print('Currently available reservations:')
@@ -247,23 +359,94 @@ def search_caregiver_schedule(tokens) -> None:
                 # Print out current amounts of vaccines
                 for row in vaccines:
                     print(row)
-                cm.close_connection()
                 return
-        except pymssql.Error as e:
+        except DBError as e:
             print('Error: Could not grab caregiver availability')
             print(f'Db-Msg:{e}')
             return
         except Exception as e:
             print(f'Error: {e}')
-    except pymssql.Error as e:
+    except DBError as e:
         print('Error: Could not connect to DB and/or grab vaccine info.')
         print(f'DB-Msg: {e}')
         return
     except Exception as e:
         print(f'Error: {e}')
         return
-    finally:
-        cm.close_connection()
+
+
+def search_caregiver_schedule_range(tokens) -> None:
+    """
+    Searches a range of dates, printing the number of open appointments per day, SEARCH_PAGE_DAYS days per page.
+    @param tokens: list, ['search_caregiver_schedule', 'START', 'END' or e.g. '30d'/'4w', optional vaccine name,
+    optional 'slots' to list each open appointment, optional 'page', 'N']
+    @return: None, prints status to console.
+    """
+    session = current_session()
+    if session.caregiver is None and session.patient is None:
+        print('Error: Please login first!')
+        return
+    usage = 'search_caregiver_schedule <start> <end | 30d | 4w> [vaccine] [slots] [page <n>]'
+    vaccine, with_slots, page = None, False, 1
+    options = tokens[3:]
+    try:
+        start = datetime.datetime.strptime(tokens[1], DATE_FORMAT).date()
+        end = range_end(start, tokens[2])
+        while options:
+            option = options.pop(0)
+            if option == 'slots':
+                with_slots = True
+            elif option == 'page' and options:
+                page = int(options.pop(0))
+            elif vaccine is None and option:
+                vaccine = option
+            else:
+                raise ValueError(f'Unexpected {option!r}')
+    except ValueError as e:
+        print(f'Error: Please use {usage}')
+        print(f'Error: {e}')
+        return
+    if (end - start).days >= MAX_SEARCH_DAYS:
+        print(f'Error: At most {MAX_SEARCH_DAYS} days can be searched at once')
+        return
+    pages = (end - start).days // SEARCH_PAGE_DAYS + 1
+    if not 1 <= page <= pages:
+        print(f'Error: Page must be between 1 and {pages}')
+        return
+    # Only this page's days are queried
+    first = start + datetime.timedelta(days=(page - 1) * SEARCH_PAGE_DAYS)
+    last = min(end, first + datetime.timedelta(days=SEARCH_PAGE_DAYS - 1))
+    try:
+        inventory = Vaccine.get_all()
+        if vaccine is not None:
+            doses = dict(inventory).get(vaccine)
+            if not doses:
+                print(f'Sorry, there are no doses of {vaccine} vaccine left.' if doses is not None
+                      else f'Error: Unknown vaccine {vaccine}')
+                return
+            inventory = [(vaccine, doses)]
+        if with_slots:
+            slots = get_slot_cache().slots_between(first, last)
+            counts = [(date, len(day)) for date, day in sorted(slots.items())]
+        else:
+            slots = {}
+            counts = get_slot_cache().counts_between(first, last)
+    except DBError as e:
+        print('Error: Could not grab caregiver availability')
+        print(f'Db-Msg: {e}')
+        return
+    except Exception as e:
+        print(f'Error: {e}')
+        return
+    print(f'Open appointments from {first} to {last}' + (f' (page {page} of {pages})' if pages > 1 else '') + ':')
+    for date, count in counts:
+        print(f'{date} {count}')
+        for apt_id, caregiver in slots.get(date, []):
+            print(f'    {apt_id} {caregiver}')
+    print(f'Total: {sum(count for _, count in counts)} open appointment(s) on {len(counts)} day(s)')
+    print('Current Vaccine Availability')
+    for name, doses in inventory:
+        print(f'{name} {doses}')
 
 
 def reserve(tokens):
@@ -271,17 +454,18 @@ def reserve(tokens):
     Reserves appointment for the currently logged-in user on the supplied date with the supplied vaccine
     For an appointment to be successfully reserved, there must be an available caregiver on said date,
     with at least 1 of the vaccine specified in stockpile.
-    If more than one caregiver is available on a certain day, patients will be assigned to the caregivers whose ID
-    comes first alphabetically.
+    If more than one caregiver is available on a certain day, the configured AssignmentPolicy picks one: the first
+    by name (alphabetical, the default), the one with the fewest booked appointments (least_loaded) or each in
+    turn (round_robin).
     @param tokens: list, contains user input, only valid format ['reserve', 'DATE', 'vaccine name']
     @return: None, prints status in console and sets current logged in patient.
     """
     # Check if user is logged in as patient
-    global current_patient, current_caregiver
-    if current_patient is None and current_caregiver is None:
+    session = current_session()
+    if session.patient is None and session.caregiver is None:
         print('Error: Please login first.')
         return
-    elif current_patient is None:
+    elif session.patient is None:
         print('Error: Please login as a patient.')
         return
 
@@ -298,110 +482,182 @@ def reserve(tokens):
         return
     vac_name = tokens[2]
 
-    # Queries used :)
-    check_vaccine_amt = 'SELECT Doses FROM Vaccines V WHERE V.Name = %s'
-    grab_caregivers = 'SELECT AV.AppointmentID, AV.CaregiverID ' \
-                      'FROM Availabilities AV LEFT JOIN Appointments AP ' \
-                      'ON AP.AppointmentID = AV.AppointmentID ' \
-                      'WHERE AP.AppointmentID is null AND AV.Date = %s'
-    add_apt = 'INSERT INTO Appointments VALUES (%s, %s, %s)'
-
-    cm = ConnectionManager()
-    conn = cm.create_connection()
-    cursor = conn.cursor(as_dict=True)
-    # Check to ensure that there is enough of the specified vaccine in reserve.
-    dose_amt = -1
+    # Dose decrement, slot selection and booking all happen in one transaction
     try:
-        cursor.execute(check_vaccine_amt, vac_name)
-        for row in cursor:
-            dose_amt = row['Doses']
-    except pymssql.Error as e:
-        print('Error: Could not check Vaccine dose amount')
+        status, apt = Appointment.reserve(date.date(), vac_name, session.patient.get_username())
+        # Only a vaccine that exists can be waited for
+        known = status == Appointment.RESERVED or get_inventory().get_doses(vac_name) is not None
+    except DBError as e:
+        print('Error: Could not add appointment.')
         print(f'Db-Msg: {e}')
         return
     except Exception as e:
         print(f'Error: {e}')
         return
-    if dose_amt < 1:
+    if not known:
+        print(f'Error: Unknown vaccine {vac_name}')
+        return
+    if status == Appointment.NO_DOSES:
         print(f'Sorry, there are not enough doses of {vac_name} vaccine.')
+        print(f'To be booked as soon as there are, use: waitlist {tokens[1]} <end date | 30d | 4w> {vac_name}')
+        return
+    if status == Appointment.NO_SLOTS:
+        print(f'Sorry, there are no open appointments on {date}.')
+        print(f'To be booked as soon as there are, use: waitlist {tokens[1]} <end date | 30d | 4w> {vac_name}')
         return
 
-    # Check for open appointments on this date.
-    apps = []
-    try:
-        cursor.execute(grab_caregivers, date)
-        for row in cursor:
-            apps.append([row['AppointmentID'], row['CaregiverID']])
-    except pymssql.Error as e:
-        print('Error: Could not check Vaccine dose amount')
-        print(f'Db-Msg: {e}')
+    # If this executes, then everything has been updated correctly
+    print('Vaccine appointment scheduled!')
+    print(f'Appointment ID: {apt.get_appointment_id()}, Caregiver: {apt.get_caregiver()}')
+
+
+def waitlist(tokens):
+    """
+    Puts the logged in patient on the waitlist for a vaccine. They are booked into the earliest open appointment
+    in their window as soon as one and a dose are free, oldest entry first, and find it in show_appointments.
+    Joining again for the same vaccine replaces the window and goes to the back of the queue.
+    @param tokens: list, ['waitlist', 'START', 'END' or e.g. '30d'/'4w', 'vaccine'] to join,
+                   ['waitlist', 'leave', 'vaccine'] to leave
+    @return: None, prints status in console.
+    """
+    session = current_session()
+    if session.patient is None:
+        print('Error: Please login as a patient.')
         return
-    except Exception as e:
+    user = session.patient.get_username()
+    if len(tokens) == 3 and tokens[1] == 'leave':
+        try:
+            removed = Waitlist.remove(user, tokens[2])
+        except DBError as e:
+            print('Error: Could not leave the waitlist.')
+            print(f'Db-Msg: {e}')
+            return
+        print(f'Left the waitlist for {tokens[2]}.' if removed else f'Error: Not on the waitlist for {tokens[2]}.')
+        return
+    if len(tokens) != 4:
+        print('Error: Please use waitlist <start date> <end date | 30d | 4w> <vaccine> or waitlist leave <vaccine>')
+        return
+    try:
+        start = datetime.datetime.strptime(tokens[1], DATE_FORMAT).date()
+        end = range_end(start, tokens[2])
+    except ValueError as e:
+        print(f'Error: Please enter valid dates in format {DATE_FORMAT}')
         print(f'Error: {e}')
         return
-    if len(apps) < 1:
-        print(f'Sorry, there are no open appointments on {date}.')
+    if end < datetime.date.today():
+        print('Error: The window has already passed.')
         return
-
-    # Choose the appointment based on the person's name, sorted alphabetically
-    apps = sorted(apps, key=itemgetter(1))
-    apt = apps[0]
-
-    # Decrease vaccine amount
+    if (end - start).days >= MAX_SEARCH_DAYS:
+        print(f'Error: The window can be at most {MAX_SEARCH_DAYS} days')
+        return
+    entry = Waitlist(user, tokens[3], start, end)
     try:
-        vac = Vaccine(vac_name, dose_amt)
-        vac.decrease_available_doses(1)
-    except pymssql.Error as e:
-        print('Error: Could not update vaccine count.')
+        if entry.vaccine_name not in dict(Vaccine.get_all()):
+            print(f'Error: Unknown vaccine {entry.vaccine_name}')
+            return
+        entry.save_to_db()
+        # There may already be room in the window
+        booked = [apt for apt in get_matcher().match(start, end, entry.vaccine_name) if apt.patient == user]
+    except DBError as e:
+        print('Error: Could not join the waitlist.')
         print(f'Db-Msg: {e}')
         return
     except Exception as e:
         print(f'Error: {e}')
         return
+    if booked:
+        print('Vaccine appointment scheduled!')
+        print(f'Appointment ID: {booked[0].get_appointment_id()}, Caregiver: {booked[0].get_caregiver()}, '
+              f'Date: {booked[0].date}')
+        return
+    print(f'Added to the waitlist for {entry}.')
+    print('You will be booked as soon as an appointment opens up; check show_appointments.')
+
 
-    # Add this appointment to the table
+def match_waitlist(start=None, end=None, vaccine_name: str = None) -> None:
+    """
+    Books waitlisted patients into availability or doses just added, see WaitlistMatcher.match().
+    """
     try:
-        cursor.execute(add_apt, (apt[0], vac_name, current_patient.get_username()))  # noqa 356
-        conn.commit()
-    except pymssql.Error as e:
-        vac.increase_available_doses(1)  # RESET VACCINE DOSES
-        print('Error: Could not add appointment.')
+        booked = get_matcher().match(start, end, vaccine_name)
+    except DBError as e:
+        print('Error: Could not match the waitlist.')
         print(f'Db-Msg: {e}')
         return
-    except Exception as e:
-        vac.increase_available_doses(1)  # RESET VACCINE DOSES
-        print(f'Error: {e}')
-        return
+    if booked:
+        print(f'{len(booked)} waitlisted patient(s) booked.')
 
-    # If this executes, then everything has been updated correctly
-    print('Vaccine appointment scheduled!')
-    print(f'Appointment ID: {apt[0]}, Caregiver: {apt[1]}')
-    cm.close_connection()
-    return
+
+def range_end(start: datetime.date, until: str) -> datetime.date:
+    """
+    Returns the last date of a range starting at start.
+    @param until: str, last date in DATE_FORMAT, or a length counted from start such as '12w' (weeks) or '30d' (days)
+    @return: datetime.date, raises ValueError on malformed input or an end before start
+    """
+    if until[-1:] in ('d', 'w') and until[:-1].isdigit():
+        length = int(until[:-1]) * (7 if until[-1] == 'w' else 1)
+        if length < 1:
+            raise ValueError('Length must be at least 1 day')
+        end = start + datetime.timedelta(days=length - 1)
+    else:
+        end = datetime.datetime.strptime(until, DATE_FORMAT).date()
+    if end < start:
+        raise ValueError('End date is before start date')
+    return end
+
+
+def expand_dates(start: datetime.date, until: str, days: str = 'daily') -> list:
+    """
+    Expands a bulk availability request into the dates it covers.
+    @param start: datetime.date, first date
+    @param until: str, last date in DATE_FORMAT, or a length counted from start such as '12w' (weeks) or '30d' (days)
+    @param days: str, 'daily', 'weekdays', 'weekends' or a comma separated list such as 'mon,wed,fri'
+    @return: list of datetime.date, raises ValueError on malformed input
+    """
+    end = range_end(start, until)
+    if (end - start).days >= MAX_UPLOAD_DAYS:
+        raise ValueError(f'At most {MAX_UPLOAD_DAYS} days can be uploaded at once')
+
+    if days in DAY_SETS:
+        allowed = DAY_SETS[days]
+    else:
+        try:
+            allowed = {WEEKDAYS.index(day) for day in days.split(',')}
+        except ValueError:
+            raise ValueError(f'Unknown days {days!r}, use daily, weekdays, weekends or e.g. mon,wed,fri')
+    return [start + datetime.timedelta(days=i) for i in range((end - start).days + 1)
+            if (start + datetime.timedelta(days=i)).weekday() in allowed]
 
 
 def upload_availability(tokens):
     """
-    Marks the currently logged in caregiver as available for the date specified.
+    Marks the currently logged in caregiver as available for the date specified, or for every matching date in
+    a range.  Dates already scheduled are skipped in bulk mode.
     Only accessible to caregivers.
-    @param tokens: list, contains user input, only valid format ['reserve', 'DATE', 'vaccine name']
+    @param tokens: list, contains user input, valid formats ['upload_availability', 'DATE'] and
+                   ['upload_availability', 'START', 'END DATE or LENGTH (12w, 30d)', optional 'DAYS']
     @return: None, prints status in console and makes changes in DB.
     """
     #  check 1: check if the current logged-in user is a caregiver
-    global current_caregiver, DATE_FORMAT
-    if current_caregiver is None:
+    session = current_session()
+    global DATE_FORMAT
+    if session.caregiver is None:
         print("Please login as a caregiver first!")
         return
 
-    # check 2: the length for tokens need to be exactly 2 to include all information (with the operation name)
-    if len(tokens) != 2:
+    # check 2: the length for tokens need to be 2 for one date, or 3-4 for a range (with the operation name)
+    if len(tokens) not in (2, 3, 4):
         print("Please try again!")
         return
 
+    if len(tokens) > 2:
+        upload_availability_range(tokens)
+        return
+
     try:
         d = datetime.datetime.strptime(tokens[1], DATE_FORMAT)
-        current_caregiver.upload_availability(d)
-    except pymssql.Error as e:
+        session.caregiver.upload_availability(d)
+    except DBError as e:
         print("Upload Availability Failed")
         print("Db-Error:", e)
         quit()
@@ -413,6 +669,36 @@ def upload_availability(tokens):
         print("Error:", e)
         return
     print("Availability uploaded!")
+    match_waitlist(d.date(), d.date())
+
+
+def upload_availability_range(tokens):
+    """
+    Bulk form of upload_availability, inserting every date in one batched transaction.
+    @param tokens: list, ['upload_availability', 'START', 'END DATE or LENGTH', optional 'DAYS']
+    @return: None, prints inserted and skipped counts.
+    """
+    session = current_session()
+    try:
+        start = datetime.datetime.strptime(tokens[1], DATE_FORMAT).date()
+        dates = expand_dates(start, tokens[2], tokens[3] if len(tokens) == 4 else 'daily')
+    except ValueError as e:
+        print(f"Error: Please enter a valid range with dates in format {DATE_FORMAT}")
+        print("Error:", e)
+        return
+    try:
+        inserted, skipped = session.caregiver.upload_availability_bulk(dates)
+    except DBError as e:
+        print("Upload Availability Failed")
+        print("Db-Error:", e)
+        return
+    except Exception as e:
+        print("Error occurred when uploading availability")
+        print("Error:", e)
+        return
+    print(f"Availability uploaded! {inserted} date(s) added, {skipped} already scheduled and skipped.")
+    if inserted:
+        match_waitlist(dates[0], dates[-1])
 
 
 def cancel(tokens):
@@ -422,96 +708,66 @@ def cancel(tokens):
     @param tokens: list, contains user input, valid format ['cancel', '<ID>']
     @return: None, prints output in console and changes DB.
     """
-    global current_caregiver, current_patient
+    session = current_session()
     # Ensure a user is logged in
-    if current_caregiver is None and current_patient is None:
+    if session.caregiver is None and session.patient is None:
         print('Error: Please login first!')
         return
     # Ensure an ID was provided
     if len(tokens) != 2:
         print('Error: Please provide an AppointmentID to cancel.')
+        return
     cm = ConnectionManager()
     conn = cm.create_connection()
     cursor = conn.cursor(as_dict=True)
-    vac_query = 'SELECT AP.VaccineType FROM Appointments AP WHERE AP.AppointmentID = %s'
-    del_query = 'DELETE FROM Appointments WHERE AppointmentID = %s'
     # If currently logged in as patient
-    if current_caregiver is None:
-        query = 'SELECT AP.PatientID FROM Appointments AP WHERE AP.AppointmentID = %s'
-        try:
-            cursor.execute(query, tokens[1])
-            id_from_db = None
-            for row in cursor:
-                id_from_db = row['PatientID']
-            if id_from_db is None:
-                print('Error: Appointment not found.')
-            elif id_from_db != current_patient.get_username():
-                print('Error: This appointment is not registered under your user account.')
-                return
-            else:
-                try:
-                    cursor.execute(vac_query, tokens[1])
-                    for row in cursor:
-                        vac_name = str(row['VaccineType'])
-                    vac = Vaccine(vac_name).get()
-                    vac.increase_available_doses(1)
-                    cursor.execute(del_query, tokens[1])
-                    conn.commit()
-                    print('Appointment successfully cancelled!')
-                except pymssql.Error as e:
-                    print('Error: Could not cancel appointment.')
-                    print(f'Db-Msg: {e}')
-                except Exception as e:
-                    print('Error: Please try again!')
-                    print(e)
-        except pymssql.Error as e:
-            print('Error: Could not lookup appointment.')
-            print(f'Db-Msg: {e}')
-        except Exception as e:
-            print('Error: Please try again!')
-            print(e)
-        finally:
-            cm.close_connection()
-            return
+    if session.caregiver is None:
+        query = 'SELECT AP.PatientID, AV.Date, AV.CaregiverID FROM Availabilities AV, Appointments AP ' \
+                'WHERE AV.AppointmentID = AP.AppointmentID AND AP.AppointmentID = %s'
+        owner, not_found, note = 'PatientID', 'Error: Appointment not found.', None
+        username = session.patient.get_username()
     # If currently logged in as caregiver
-    elif current_patient is None:
-        query = 'SELECT AV.CaregiverID FROM Availabilities AV, Appointments AP ' \
+    else:
+        query = 'SELECT AV.CaregiverID, AV.Date FROM Availabilities AV, Appointments AP ' \
                 'WHERE AV.AppointmentID = AP.AppointmentID AND AV.AppointmentID = %s'
-        try:
-            cursor.execute(query, tokens[1])
-            id_from_db = None
-            for row in cursor:
-                id_from_db = row['CaregiverID']
-            if id_from_db is None:
-                print('Error: Appointment not Found')
-            elif id_from_db != current_caregiver.get_username():
-                print('Error: This appointment is not registered under your user account.')
-            else:
-                try:
-                    cursor.execute(vac_query, tokens[1])
-                    for row in cursor:
-                        vac_name = row['VaccineType']
-                    vac = Vaccine(vac_name).get()
-                    vac.increase_available_doses(1)
-                    cursor.execute(del_query, tokens[1])
-                    conn.commit()
-                    print('Appointment successfully cancelled!')
-                    print('Note: This date will be marked as available and be reservable by other patients.')
-                except pymssql.Error as e:
-                    print('Error: Could not cancel appointment.')
-                    print(f'Db-Msg: {e}')
-                except Exception as e:
-                    print('Error: Please try again!')
-                    print(e)
-        except pymssql.Error as e:
-            print('Error: Could not lookup appointment.')
-            print(f'Db-Msg: {e}')
-        except Exception as e:
-            print('Error: Please try again!')
-            print(e)
-        finally:
+        owner, not_found = 'CaregiverID', 'Error: Appointment not Found'
+        note = 'Note: This date will be marked as available and be reservable by other patients.'
+        username = session.caregiver.get_username()
+    try:
+        cursor.execute(query, tokens[1])
+        id_from_db = None
+        for row in cursor:
+            id_from_db = row[owner]
+            apt_date, apt_caregiver = row['Date'], row['CaregiverID']
+        if id_from_db is None:
+            print(not_found)
+        elif id_from_db != username:
+            print('Error: This appointment is not registered under your user account.')
+        else:
+            try:
+                # Dose restore and delete in one transaction on this connection
+                cancelled = Appointment.cancel(tokens[1], apt_date, apt_caregiver, conn)
+            except DBError as e:
+                print('Error: Could not cancel appointment.')
+                print(f'Db-Msg: {e}')
+                return
+            if not cancelled:
+                # Cancelled by someone else since the lookup
+                print(not_found)
+                return
+            print('Appointment successfully cancelled!')
+            if note is not None:
+                print(note)
             cm.close_connection()
-            return
+            match_waitlist(apt_date, apt_date)
+    except DBError as e:
+        print('Error: Could not lookup appointment.')
+        print(f'Db-Msg: {e}')
+    except Exception as e:
+        print('Error: Please try again!')
+        print(e)
+    finally:
+        cm.close_connection()
 
 
 def add_doses(tokens):
@@ -521,8 +777,8 @@ def add_doses(tokens):
     @return:
     """
     #  check 1: check if the current logged-in user is a caregiver
-    global current_caregiver
-    if current_caregiver is None:
+    session = current_session()
+    if session.caregiver is None:
         print("Please login as a caregiver first!")
         return
 
@@ -536,7 +792,7 @@ def add_doses(tokens):
     vaccine = None
     try:
         vaccine = Vaccine(vaccine_name, doses).get()
-    except pymssql.Error as e:
+    except DBError as e:
         print("Error occurred when adding doses")
         print("Db-Error:", e)
         quit()
@@ -551,7 +807,7 @@ def add_doses(tokens):
         vaccine = Vaccine(vaccine_name, doses)
         try:
             vaccine.save_to_db()
-        except pymssql.Error as e:
+        except DBError as e:
             print("Error occurred when adding doses")
             print("Db-Error:", e)
             quit()
@@ -563,7 +819,7 @@ def add_doses(tokens):
         # if the vaccine is not null, meaning that the vaccine already exists in our table
         try:
             vaccine.increase_available_doses(doses)
-        except pymssql.Error as e:
+        except DBError as e:
             print("Error occurred when adding doses")
             print("Db-Error:", e)
             quit()
@@ -572,96 +828,127 @@ def add_doses(tokens):
             print("Error:", e)
             return
     print("Doses updated!")
+    match_waitlist(vaccine_name=vaccine_name)
 
 
 def show_appointments(tokens):
     """
+    Lists the logged in user's appointments in date order, printing each as it is read from the database.
+    @param tokens: list, ['show_appointments'] optionally followed by '--from', 'DATE', '--to', 'DATE' (inclusive),
+                   '--limit', 'N' (a page of N appointments) and '--after', 'ID' (the page after appointment ID)
+    @return: None, prints appointments in console; patients also see the waitlist entries still waiting.
     """
-    global current_caregiver, current_patient
-    cm = ConnectionManager()
-    conn = cm.create_connection()
-    cursor = conn.cursor(as_dict=True)
+    session = current_session()
     # if user is not logged in
-    if current_caregiver is None and current_patient is None:
+    if session.caregiver is None and session.patient is None:
         print('Error: Please login first.')
-    # If user is a patient
-    elif current_caregiver is None:
-        user = current_patient.get_username() # noqa
-        grab_patient_apts = 'SELECT AP.AppointmentID, AP.VaccineType, AV.Date, AV.CaregiverID ' \
-                            'FROM Appointments AP, Availabilities AV ' \
-                            'WHERE AP.AppointmentId = AV.AppointmentId AND AP.PatientID = %s ' \
-                            'ORDER BY AppointmentID'
-        try:
-            cursor.execute(grab_patient_apts, user)
-            apts = []
-            for row in cursor:
-                apts.append([row['AppointmentID'], row['VaccineType'], row['Date'], row['CaregiverID']])
-            cm.close_connection()
-            if len(apts) == 0:
-                print(f'No current appointments are scheduled for {user}')
-                return
-            else:
-                print(f'Current appointments scheduled for {user}')
-                for apt in apts:
-                    print(f'{apt[0]} {apt[1]} {apt[2]} {apt[3]}')
-                return
-        except pymssql.Error as e:
-            print('Error: Could not lookup appointments.')
-            print(f'Db-Msg: {e}')
-            return
-        except Exception as e:
-            print('Please try again!')
-            print(f'Error: {e}')
-            return
-    # If user is a caregiver
-    elif current_patient is None:
-        user = current_caregiver.get_username()
-        grab_patient_apts = 'SELECT AP.AppointmentID, AP.VaccineType, AV.Date, AP.PatientID ' \
-                            'FROM Appointments AP, Availabilities AV ' \
-                            'WHERE AP.AppointmentId = AV.AppointmentId AND AV.CaregiverID = %s ' \
-                            'ORDER BY AppointmentID'
-        try:
-            cursor.execute(grab_patient_apts, user)
-            apts = []
-            for row in cursor:
-                apts.append([row['AppointmentID'], row['VaccineType'], row['Date'], row['PatientID']])
-            cm.close_connection()
-            if len(apts) == 0:
-                print(f'No current appointments are scheduled for {user}')
-                return
+        return
+    usage = 'show_appointments [--from <date>] [--to <date>] [--limit <n>] [--after <appointment_id>]'
+    options = {}
+    try:
+        if len(tokens) % 2 == 0:
+            raise ValueError('Every option needs a value')
+        for option, value in zip(tokens[1::2], tokens[2::2]):
+            if option in ('--from', '--to'):
+                options[option] = datetime.datetime.strptime(value, DATE_FORMAT).date()
+            elif option == '--limit':
+                options[option] = int(value)
+                if options[option] < 1:
+                    raise ValueError('Limit must be at least 1')
+            elif option == '--after':
+                options[option] = value
             else:
+                raise ValueError(f'Unknown option {option!r}')
+    except ValueError as e:
+        print(f'Error: Please use {usage}')
+        print(f'Error: {e}')
+        return
+    limit = options.get('--limit')
+    if session.caregiver is None:
+        user = session.patient.get_username()
+        who = {'patient': user}
+    else:
+        user = session.caregiver.get_username()
+        who = {'caregiver': user}
+    shown = 0
+    last = None
+    try:
+        # One more than the page, to tell whether there is a next one
+        apts = Appointment.list_for(start=options.get('--from'), end=options.get('--to'), after=options.get('--after'),
+                                    limit=limit + 1 if limit is not None else None, **who)
+        for apt in apts:
+            if shown == limit:
+                apts.close()
+                break
+            if shown == 0:
                 print(f'Current appointments scheduled for {user}')
-                for apt in apts:
-                    print(f'{apt[0]} {apt[1]} {apt[2]} {apt[3]}')
-                return
-        except pymssql.Error as e:
-            print('Error: Could not lookup appointments.')
-            print(f'Db-Msg: {e}')
-            return
-        except Exception as e:
-            print(f'Please try again! {e}')
-            return
+            other = apt.patient if session.patient is None else apt.caregiver
+            print(f'{apt.appointment_id} {apt.vaccine_name} {apt.date} {other}')
+            shown += 1
+            last = apt.appointment_id
+        else:
+            last = None
+        if shown == 0:
+            print(f'No current appointments are scheduled for {user}')
+        if last is not None:
+            more = ' '.join(tokens[:1] + [f'{k} {v}' for k, v in options.items() if k != '--after'])
+            print(f'More: {more} --after {last}')
+        # Appointments booked from the waitlist show up above, entries still waiting below
+        if session.patient is not None and '--after' not in options:
+            for entry in Waitlist.get_for_patient(user):
+                print(f'Waitlisted for {entry}')
+    except DBError as e:
+        print('Error: Could not lookup appointments.')
+        print(f'Db-Msg: {e}')
+    except Exception as e:
+        print('Please try again!')
+        print(f'Error: {e}')
 
 
 def logout(tokens):
     """
-    @param tokens:
-    @return:
+    Logs out the current user and ends their session token.
+    @param tokens: list, contains user input, only valid format ['logout']
+    @return: None, prints status in console.
     """
     if len(tokens) != 1:
         print('Error: Unknown arguments supplied.')
         return
-    global current_caregiver, current_patient
-    if current_caregiver is None and current_patient is None:
+    session = current_session()
+    if session.caregiver is None and session.patient is None:
         print('Error: Log in first.')
         return
     else:
-        current_caregiver = None
-        current_patient = None
+        token, session.token = session.token, None
+        session.caregiver = None
+        session.patient = None
         print('Successfully logged out!')
+        if token is not None:
+            try:
+                get_sessions().revoke(token)
+            except DBError as e:
+                print('Error: Could not end the session token, it stays valid until it expires.')
+                print(f'Db-Error: {e}')
         return
 
 
+def stats(tokens):
+    """
+    Prints latency and query counts per command since startup.
+    @param tokens: list, 'stats', 'stats prometheus' for the Prometheus text format or 'stats reset' to clear them
+    """
+    metrics = get_metrics()
+    if len(tokens) == 1:
+        print(metrics.summary())
+    elif tokens[1] == 'prometheus':
+        print(metrics.render_prometheus(), end='')
+    elif tokens[1] == 'reset':
+        metrics.reset()
+        print('Stats reset.')
+    else:
+        print('Error: Please use stats, stats prometheus or stats reset.')
+
+
 def start():
     stop = False
     global DATE_FORMAT
@@ -670,15 +957,22 @@ def start():
     print(" *** Please enter one of the following commands *** ")
     print("> create_patient <username> <password>")  # //TODO: implement create_patient (Part 1)
     print("> create_caregiver <username> <password>")
+    print("> import_accounts <patients | caregivers> <csv file of username,password rows>")
     print("> login_patient <username> <password>")  # // TODO: implement login_patient (Part 1)
     print("> login_caregiver <username> <password>")
+    print("> resume <session token>")
     print("> search_caregiver_schedule <date>")  # // TODO: implement search_caregiver_schedule (Part 2)
+    print("> search_caregiver_schedule <start date> <end date | 30d | 4w> [vaccine] [slots] [page <n>]")
     print("> reserve <date> <vaccine>")  # // TODO: implement reserve (Part 2)
+    print("> waitlist <start date> <end date | 30d | 4w> <vaccine>")
+    print("> waitlist leave <vaccine>")
     print("> upload_availability <date>")
+    print("> upload_availability <start date> <end date | 12w | 30d> [daily | weekdays | weekends | mon,wed,...]")
     print("> cancel <appointment_id>")  # // TODO: implement cancel (extra credit)
     print("> add_doses <vaccine> <number>")
-    print("> show_appointments")  # // TODO: implement show_appointments (Part 2)
+    print("> show_appointments [--from <date>] [--to <date>] [--limit <n>] [--after <appointment_id>]")
     print("> logout")  # // TODO: implement logout (Part 2)
+    print("> stats [prometheus | reset]")
     print("> Quit")
     print()
     while not stop:
@@ -691,28 +985,56 @@ def start():
             print("Please try again!")
             break
 
-        response = response.lower()
-        tokens = response.split(" ")
-        if len(tokens) == 0:
-            ValueError("Please try again!")
-            continue
-        operation = tokens[0]
+        stop = not run_command(response)
+
+
+# Commands dispatched by run_command, the labels of their metrics
+COMMANDS = {'create_patient', 'create_caregiver', 'import_accounts', 'login_patient', 'login_caregiver',
+            'search_caregiver_schedule', 'reserve', 'upload_availability', 'add_doses', 'show_appointments', 'logout',
+            'cancel', 'waitlist', 'resume'}
+
+
+def run_command(response: str) -> bool:
+    """
+    Parses and runs one command line for the current session, printing its output.
+    @param response: str, the command line as typed
+    @return: bool, False if the command was quit and true otherwise.
+    """
+    # File paths keep their case, everything else is case-insensitive
+    raw_tokens = response.split(" ")
+    response = response.lower()
+    tokens = response.split(" ")
+    if len(tokens) == 0:
+        ValueError("Please try again!")
+        return True
+    operation = tokens[0]
+    if operation == "quit":
+        print("Bye!")
+        return False
+    if operation == "stats":
+        stats(tokens)
+        return True
+    with get_metrics().command(operation if operation in COMMANDS else 'invalid'):
         if operation == "create_patient":
             create_patient(tokens)
         elif operation == "create_caregiver":
             create_caregiver(tokens)
+        elif operation == "import_accounts":
+            import_accounts(tokens[:2] + raw_tokens[2:])
         elif operation == "login_patient":
             login_patient(tokens)
         elif operation == "login_caregiver":
             login_caregiver(tokens)
+        elif operation == "resume":
+            resume(tokens)
         elif operation == "search_caregiver_schedule":
             search_caregiver_schedule(tokens)
         elif operation == "reserve":
             reserve(tokens)
+        elif operation == "waitlist":
+            waitlist(tokens)
         elif operation == "upload_availability":
             upload_availability(tokens)
-        elif operation == cancel:
-            cancel(tokens)
         elif operation == "add_doses":
             add_doses(tokens)
         elif operation == "show_appointments":
@@ -721,11 +1043,20 @@ def start():
             logout(tokens)
         elif operation == "cancel":
             cancel(tokens)
-        elif operation == "quit":
-            print("Bye!")
-            stop = True
         else:
             print("Invalid operation name!")
+    return True
+
+
+def check_settings() -> None:
+    """
+    Exits with an error if the password hashing settings in .env cannot be used, rather than failing every login.
+    """
+    try:
+        get_hasher()
+    except ValueError as e:
+        print(f'Error: Bad password hashing settings - {e}', file=sys.stderr)
+        sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -736,6 +1067,11 @@ if __name__ == "__main__":
     // and then construct a map of vaccineName -> vaccineObject
     '''
 
+    check_settings()
+    # Connect and load the username filters in the background while the banner is printed and the first command
+    # typed
+    prewarm(get_usernames('Patients').load, get_usernames('Caregivers').load)
+
     # start command line
     print()
     print("Welcome to the COVID-19 Vaccine Reservation Scheduling Application!")
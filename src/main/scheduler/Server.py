@@ -0,0 +1,154 @@
+import argparse
+import asyncio
+import contextvars
+import io
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decouple import config
+from Scheduler import Session, check_settings, run_command, use_session
+from db.ConnectionManager import prewarm
+from db.UsernameFilter import get_usernames
+
+
+"""
+Network front-end for the scheduler.  Clients connect over TCP and send one command per line, either as plain
+text or as JSON {"id": ..., "command": "..."}; every command gets one JSON line back:
+{"id": ..., "ok": true, "output": "...", "ms": 1.2}.  Each connection has its own login session.
+"""
+
+# Commands that read the server's filesystem are only available from the console
+CONSOLE_ONLY = {'import_accounts'}
+
+# Buffer collecting the printed output of the command running in this context
+_output = contextvars.ContextVar('output', default=None)
+
+
+class SessionStdout:
+    """
+    Stand-in for sys.stdout that sends whatever a command prints to the buffer of the connection running it.
+    """
+
+    def __init__(self, stream) -> None:
+        self._stream = stream
+
+    def write(self, text: str) -> int:
+        buf = _output.get()
+        return (buf if buf is not None else self._stream).write(text)
+
+    def flush(self) -> None:
+        if _output.get() is None:
+            self._stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+def execute(session: Session, command: str) -> tuple:
+    """
+    Runs one command for session, capturing what it prints. Call it inside a copy of the caller's context (see
+    contextvars) so the session and output buffer stay private to it.
+    @return: tuple (output, ok, keep_open), ok False if the command raised
+    """
+    use_session(session)
+    buf = io.StringIO()
+    _output.set(buf)
+    keep_open, ok = True, True
+    try:
+        if command.split(" ")[0].lower() in CONSOLE_ONLY:
+            print('Error: This command is only available from the console.')
+            ok = False
+        else:
+            keep_open = run_command(command)
+    except SystemExit:
+        # Handlers quit() on fatal database errors; that must not take the server down
+        print('Error: Internal server error, please try again.')
+        ok = False
+    except Exception as e:
+        print(f'Error: {e}')
+        ok = False
+    return buf.getvalue(), ok, keep_open
+
+
+class SchedulerServer:
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 8414, workers: int = 32) -> None:
+        """
+        @param workers: int, threads running commands; commands block on the database and password hashing
+        """
+        self.host = host
+        self.port = port
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='command')
+        self.connections = 0
+
+    @staticmethod
+    def _parse(line: bytes) -> tuple:
+        text = line.decode('utf-8').strip()
+        if text.startswith('{'):
+            request = json.loads(text)
+            return request.get('id'), str(request.get('command', ''))
+        return None, text
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        loop = asyncio.get_running_loop()
+        session = Session()
+        self.connections += 1
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request_id, command = self._parse(line)
+                except (ValueError, AttributeError) as e:
+                    writer.write(json.dumps({'id': None, 'ok': False, 'output': f'Error: Bad request - {e}\n'})
+                                 .encode('utf-8') + b'\n')
+                    await writer.drain()
+                    continue
+                if not command:
+                    continue
+                started = time.perf_counter()
+                output, ok, keep_open = await loop.run_in_executor(
+                    self.executor, contextvars.copy_context().run, execute, session, command)
+                response = {'id': request_id, 'ok': ok, 'output': output,
+                            'ms': round((time.perf_counter() - started) * 1000, 3)}
+                writer.write(json.dumps(response).encode('utf-8') + b'\n')
+                await writer.drain()
+                if not keep_open:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            # Client went away, or sent a line longer than the stream limit
+            pass
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    async def serve(self, ready=None) -> None:
+        """
+        Accepts connections until cancelled.
+        @param ready: optional asyncio.Event set once the server is listening
+        """
+        if not isinstance(sys.stdout, SessionStdout):
+            sys.stdout = SessionStdout(sys.stdout)
+        server = await asyncio.start_server(self.handle, self.host, self.port, backlog=1024)
+        self.port = server.sockets[0].getsockname()[1]
+        if ready is not None:
+            ready.set()
+        async with server:
+            await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Serve the vaccine scheduler over TCP.')
+    parser.add_argument('--host', default=config('ServerHost', default='127.0.0.1'))
+    parser.add_argument('--port', type=int, default=config('ServerPort', default=8414, cast=int))
+    parser.add_argument('--workers', type=int, default=config('ServerWorkers', default=32, cast=int))
+    args = parser.parse_args()
+    check_settings()
+    prewarm(get_usernames('Patients').load, get_usernames('Caregivers').load)
+    print(f'Serving the scheduler on {args.host}:{args.port}')
+    try:
+        asyncio.run(SchedulerServer(args.host, args.port, args.workers).serve())
+    except KeyboardInterrupt:
+        print('Bye!')
@@ -0,0 +1,253 @@
+import heapq
+import threading
+import time
+from bisect import bisect_right, insort
+from collections import OrderedDict
+from decouple import config
+from db.Backend import get_backend, RESERVED, NO_SLOTS
+from db.SlotCache import get_slot_cache
+
+
+class AssignmentPolicy:
+    """
+    Decides which caregiver's open slot on a date a reservation is given.
+    """
+    name = None
+
+    def reserve(self, conn, date, vaccine: str, patient: str) -> tuple:
+        """
+        Books a slot on date chosen by this policy, with the same contract as Backend.reserve.
+        @return: tuple (status, AppointmentID, CaregiverID), status one of RESERVED, NO_DOSES, NO_SLOTS
+        """
+        raise NotImplementedError
+
+
+class AlphabeticalPolicy(AssignmentPolicy):
+    """
+    The caregiver whose name comes first, picked by the database in the reserving statement itself.
+    """
+    name = 'alphabetical'
+
+    def reserve(self, conn, date, vaccine, patient):
+        return get_backend().reserve(conn, date, vaccine, patient)
+
+
+class IndexedPolicy(AssignmentPolicy):
+    """
+    Base for policies that choose in process. Keeps an index of the open slots per date, built from the slot cache
+    the first time a date is reserved on and kept in step with it through its hook, for up to max_dates dates.
+    The chosen slot is booked with Backend.reserve_slot, which touches only that row; one another process took in
+    the meantime is dropped and the next choice tried. With nothing left to choose, the database picks as in
+    AlphabeticalPolicy, which also reports a dose shortage and sees slots this process has not heard of.
+    Subclasses keep their own structure per date and implement _build, _added, _choose and _booked; all four are
+    called with the policy locked.
+    Everything reserve reads from the database goes through the caller's connection, so a reservation never holds
+    more than one pooled connection.
+    """
+
+    def __init__(self, max_dates: int = 1000) -> None:
+        self.max_dates = max_dates
+        self._dates = OrderedDict()  # date -> (open slots {AppointmentID: CaregiverID}, subclass structure)
+        self._versions = {}          # date -> bumped on every change, so builds that raced one are discarded
+        self._lock = threading.Lock()
+        get_slot_cache().add_hook(self._slot_changed)
+
+    def _slot_changed(self, event: str, date, appointment_id, caregiver) -> None:
+        with self._lock:
+            if event == 'invalidate' and date is None:
+                self._dates.clear()
+                self._versions.clear()
+                return
+            self._versions[date] = self._versions.get(date, 0) + 1
+            entry = self._dates.get(date)
+            if entry is None:
+                return
+            slots, structure = entry
+            if event == 'add':
+                if appointment_id not in slots:
+                    slots[appointment_id] = caregiver
+                    self._added(structure, appointment_id, caregiver)
+            elif event == 'remove':
+                # Left in the structure, _choose skips slots that are no longer open
+                slots.pop(appointment_id, None)
+            else:
+                del self._dates[date]
+
+    def _index(self, conn, date) -> None:
+        with self._lock:
+            if date in self._dates:
+                self._dates.move_to_end(date)
+                return
+            version = self._versions.get(date, 0)
+        slots = dict(get_slot_cache().get(date, conn))
+        with self._lock:
+            if date not in self._dates and self._versions.get(date, 0) == version:
+                self._dates[date] = (slots, self._build(slots))
+                while len(self._dates) > self.max_dates:
+                    self._dates.popitem(last=False)
+
+    def _prepare(self, conn) -> None:
+        """
+        Called before choosing, without the lock, e.g. to refresh data from the database through conn.
+        """
+        pass
+
+    def reserve(self, conn, date, vaccine, patient):
+        backend = get_backend()
+        self._prepare(conn)
+        self._index(conn, date)
+        while True:
+            with self._lock:
+                entry = self._dates.get(date)
+                choice = self._choose(*entry) if entry is not None else None
+            if choice is None:
+                status, apt_id, caregiver = backend.reserve(conn, date, vaccine, patient)
+                break
+            apt_id, caregiver = choice
+            status = backend.reserve_slot(conn, apt_id, vaccine, patient)
+            if status != NO_SLOTS:
+                break
+            # Taken by another process
+            with self._lock:
+                if entry is not None:
+                    entry[0].pop(apt_id, None)
+        if status == RESERVED:
+            with self._lock:
+                self._booked(caregiver)
+        return status, apt_id, caregiver
+
+    def _build(self, slots: dict):
+        raise NotImplementedError
+
+    def _added(self, structure, appointment_id: str, caregiver: str) -> None:
+        raise NotImplementedError
+
+    def _choose(self, slots: dict, structure):
+        """
+        @return: (AppointmentID, CaregiverID) of an open slot, or None if there is none
+        """
+        raise NotImplementedError
+
+    def _booked(self, caregiver: str) -> None:
+        pass
+
+
+class LeastLoadedPolicy(IndexedPolicy):
+    """
+    The caregiver with the fewest booked appointments, ties going to the first by name. Each date's open slots are
+    kept in a heap keyed by their caregiver's load, so a choice is O(log n): entries whose load has changed since
+    they were pushed are re-keyed as they reach the top. Loads are counted by the database every refresh seconds
+    and updated in between by the bookings this process makes.
+    """
+    name = 'least_loaded'
+
+    LOADS = 'SELECT AV.CaregiverID, COUNT(*) FROM Availabilities AV ' \
+            'JOIN Appointments AP ON AP.AppointmentID = AV.AppointmentID GROUP BY AV.CaregiverID'
+
+    def __init__(self, max_dates: int = 1000, refresh: float = 60.0) -> None:
+        super().__init__(max_dates)
+        self.refresh = refresh
+        self._load = {}       # CaregiverID -> booked appointments
+        self._loaded = None   # time.monotonic() of the last count
+
+    def _prepare(self, conn):
+        if self._loaded is not None and time.monotonic() - self._loaded < self.refresh:
+            return
+        cursor = conn.cursor()
+        cursor.execute(self.LOADS)
+        load = {caregiver: count for caregiver, count in cursor.fetchall()}
+        with self._lock:
+            self._load = load
+            self._loaded = time.monotonic()
+            # Loads may have gone down (cancellations), which lazy re-keying cannot account for, so rebuild the heaps
+            self._dates.clear()
+
+    def _build(self, slots):
+        heap = [(self._load.get(caregiver, 0), caregiver, apt_id) for apt_id, caregiver in slots.items()]
+        heapq.heapify(heap)
+        return heap
+
+    def _added(self, heap, appointment_id, caregiver):
+        heapq.heappush(heap, (self._load.get(caregiver, 0), caregiver, appointment_id))
+
+    def _choose(self, slots, heap):
+        while heap:
+            load, caregiver, apt_id = heap[0]
+            if slots.get(apt_id) != caregiver:
+                heapq.heappop(heap)
+                continue
+            current = self._load.get(caregiver, 0)
+            if current != load:
+                heapq.heapreplace(heap, (current, caregiver, apt_id))
+                continue
+            return apt_id, caregiver
+        return None
+
+    def _booked(self, caregiver):
+        self._load[caregiver] = self._load.get(caregiver, 0) + 1
+
+
+class RoundRobinPolicy(IndexedPolicy):
+    """
+    Takes turns: the first caregiver by name after the one given the previous reservation, on any date, wrapping
+    around. Each date's open slots are kept sorted by caregiver, so finding the next one is a binary search.
+    """
+    name = 'round_robin'
+
+    def __init__(self, max_dates: int = 1000) -> None:
+        super().__init__(max_dates)
+        self._last = ''
+
+    def _build(self, slots):
+        return sorted((caregiver, apt_id) for apt_id, caregiver in slots.items())
+
+    def _added(self, ring, appointment_id, caregiver):
+        insort(ring, (caregiver, appointment_id))
+
+    def _choose(self, slots, ring):
+        # Past every AppointmentID of the last caregiver
+        i = bisect_right(ring, (self._last, '\uffff'))
+        while ring:
+            if i >= len(ring):
+                i = 0
+            caregiver, apt_id = ring[i]
+            if slots.get(apt_id) == caregiver:
+                return apt_id, caregiver
+            del ring[i]
+        return None
+
+    def _booked(self, caregiver):
+        self._last = caregiver
+
+
+POLICIES = {policy.name: policy for policy in (AlphabeticalPolicy, LeastLoadedPolicy, RoundRobinPolicy)}
+
+_policy = None
+_policy_lock = threading.Lock()
+
+
+def create_policy(name: str) -> AssignmentPolicy:
+    """
+    Builds an assignment policy by name: 'alphabetical', 'least_loaded' or 'round_robin'.
+    """
+    policy = POLICIES.get(name.lower())
+    if policy is None:
+        raise ValueError(f'Unknown assignment policy {name!r}, expected one of {", ".join(POLICIES)}')
+    if policy is LeastLoadedPolicy:
+        return LeastLoadedPolicy(config('AssignmentIndexDates', default=1000, cast=int),
+                                 config('AssignmentLoadRefresh', default=60.0, cast=float))
+    if policy is RoundRobinPolicy:
+        return RoundRobinPolicy(config('AssignmentIndexDates', default=1000, cast=int))
+    return policy()
+
+
+def get_policy() -> AssignmentPolicy:
+    """
+    Returns the process-wide assignment policy, chosen by AssignmentPolicy in .env (default alphabetical).
+    """
+    global _policy
+    if _policy is None:
+        with _policy_lock:
+            if _policy is None:
+                _policy = create_policy(config('AssignmentPolicy', default='alphabetical'))
+    return _policy
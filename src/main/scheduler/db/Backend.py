@@ -0,0 +1,153 @@
+import threading
+from decouple import config
+
+
+# Outcomes of Backend.reserve
+RESERVED = 0
+NO_DOSES = 1
+NO_SLOTS = 2
+
+
+class DBError(Exception):
+    """
+    Any error of the database driver, raised in its place by pooled connections (see db.InstrumentedConnection)
+    with the same args and the driver's exception as __cause__. Catching it does not need the driver imported, so
+    the driver is only loaded once the first connection is opened.
+    """
+    pass
+
+
+class DBIntegrityError(DBError):
+    """
+    A constraint was violated, e.g. a duplicate primary key.
+    """
+    pass
+
+
+class Backend:
+    """
+    A storage engine the scheduler can run against.
+    Connections handed out by connect() follow DB-API 2.0 with the pymssql extensions the app relies on:
+    '%s'/'%d' placeholders, a bare (non-tuple) single parameter and cursor(as_dict=True).
+    """
+    name = None
+    # Exception classes raised by this backend's driver, translated into DBError and DBIntegrityError
+    Error = Exception
+    IntegrityError = Exception
+    # Matches the lines of explain() output that read a whole table or index
+    SCAN = None
+
+    def connect(self):
+        """
+        Opens a new connection to the database.
+        """
+        raise NotImplementedError
+
+    def reserve(self, conn, date, vaccine: str, patient: str) -> tuple:
+        """
+        Atomically takes one dose of vaccine and books the first open slot on date (by caregiver name) for patient,
+        committing on success and rolling back otherwise. Dose shortage is reported ahead of a missing slot.
+        @param conn: connection borrowed from the pool
+        @param date: datetime.date of the appointment
+        @return: tuple (status, AppointmentID, CaregiverID), status one of RESERVED, NO_DOSES, NO_SLOTS
+        """
+        raise NotImplementedError
+
+    def reserve_slot(self, conn, appointment_id: str, vaccine: str, patient: str) -> int:
+        """
+        Atomically books the open slot appointment_id for patient with one dose of vaccine, touching only that slot.
+        Commits if RESERVED and rolls back on NO_DOSES. On NO_SLOTS (the slot is taken) nothing was changed and the
+        transaction is left open, so the caller can try another slot as part of it.
+        @return: int, one of RESERVED, NO_DOSES, NO_SLOTS
+        """
+        raise NotImplementedError
+
+    def limit(self, query: str, n: int) -> str:
+        """
+        Returns the SELECT query restricted to its first n rows.
+        """
+        raise NotImplementedError
+
+    def savepoint(self, conn, name: str) -> None:
+        """
+        Marks a point the current transaction can be rolled back to, starting a transaction if none is open.
+        """
+        raise NotImplementedError
+
+    def rollback_to(self, conn, name: str) -> None:
+        """
+        Undoes everything done since savepoint name, which stays in place.
+        """
+        raise NotImplementedError
+
+    def release(self, conn, name: str) -> None:
+        """
+        Forgets savepoint name, keeping the work done since it as part of the enclosing transaction.
+        """
+        pass
+
+    def explain(self, conn, query: str) -> list:
+        """
+        Returns the lines of the plan the database would use for query, without running it.
+        """
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """
+        Releases anything the backend holds on to outside of its connections.
+        """
+        pass
+
+    def translate(self, error: Exception) -> Exception:
+        """
+        Returns the DBError (or DBIntegrityError) standing for an exception raised by the driver, or error itself
+        if it is not one of the driver's.
+        """
+        if isinstance(error, DBError) or not isinstance(error, self.Error):
+            return error
+        translated = (DBIntegrityError if isinstance(error, self.IntegrityError) else DBError)(*error.args)
+        translated.__cause__ = error
+        return translated
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def create_backend(name: str = None) -> Backend:
+    """
+    Builds a backend by name ('mssql' or 'sqlite'), defaulting to the Backend setting in .env.
+    Driver modules are only imported for the backend that is chosen.
+    """
+    if name is None:
+        name = config('Backend', default='mssql')
+    name = name.lower()
+    if name == 'mssql':
+        from db.MSSQLBackend import MSSQLBackend
+        return MSSQLBackend()
+    if name == 'sqlite':
+        from db.SQLiteBackend import SQLiteBackend
+        return SQLiteBackend(config('SQLitePath', default='scheduler.db'))
+    raise ValueError(f'Unknown backend {name!r}, expected mssql or sqlite')
+
+
+def get_backend() -> Backend:
+    """
+    Returns the process-wide backend, creating it from the .env settings on first use.
+    """
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = create_backend()
+    return _backend
+
+
+def set_backend(backend: Backend) -> None:
+    """
+    Replaces the process-wide backend, e.g. with an in-memory SQLite database for tests and benchmarks.
+    Must be called before the first connection is borrowed.
+    """
+    global _backend
+    with _backend_lock:
+        _backend = backend
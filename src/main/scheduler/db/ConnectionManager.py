@@ -1,33 +1,294 @@
-import pymssql
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
 from decouple import config
+from db.Backend import get_backend, DBError, DBIntegrityError  # noqa: F401
+from db.InstrumentedConnection import instrumented
+from util.Metrics import get_metrics
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of open database connections.
+    Connections are health checked when they are borrowed after sitting idle, and idle connections beyond
+    min_size are closed once they have been unused for idle_timeout seconds.
+    """
+
+    def __init__(self, connect, min_size: int = 1, max_size: int = 10, idle_timeout: float = 300.0,
+                 check_interval: float = 5.0, checkout_timeout: float = 30.0) -> None:
+        """
+        @param connect: callable returning a new DB-API connection
+        @param min_size: int, number of idle connections that are never evicted
+        @param max_size: int, maximum number of connections open at once (idle + borrowed)
+        @param idle_timeout: float, seconds an idle connection may sit unused before it is closed
+        @param check_interval: float, connections idle for longer than this are pinged before being handed out
+        @param checkout_timeout: float, seconds to wait for a free connection before raising PoolTimeout
+        """
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError('Pool sizes must satisfy 0 <= min_size <= max_size and max_size >= 1')
+        self._connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.check_interval = check_interval
+        self.checkout_timeout = checkout_timeout
+        self._idle = []    # (connection, time it was returned), most recently used last
+        self._size = 0     # idle + borrowed connections
+        self._warming = 0  # connections warm() is opening
+        self._cond = threading.Condition()
+
+    def _open(self):
+        # Caller has already reserved a slot in self._size
+        try:
+            return self._connect()
+        except BaseException:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+    @staticmethod
+    def _close(conn) -> None:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    @staticmethod
+    def _healthy(conn) -> bool:
+        try:
+            cursor = conn.cursor()
+            cursor.execute('SELECT 1')
+            cursor.fetchall()
+            return True
+        except Exception:
+            return False
+
+    def _evict_idle(self) -> list:
+        # Must hold self._cond. Oldest connections sit at the front of the idle list.
+        now = time.monotonic()
+        evicted = []
+        while len(self._idle) > self.min_size and now - self._idle[0][1] > self.idle_timeout:
+            evicted.append(self._idle.pop(0)[0])
+            self._size -= 1
+        return evicted
+
+    def warm(self) -> None:
+        """
+        Opens and validates connections until min_size are available, so the first commands do not pay the connect
+        cost. A connection that fails validation is closed and its error raised.
+        Commands borrowing while a connection is being warmed wait for it rather than opening one of their own.
+        """
+        while True:
+            with self._cond:
+                if self._size >= self.min_size:
+                    return
+                self._size += 1
+                self._warming += 1
+            conn = None
+            try:
+                conn = self._open()
+                cursor = conn.cursor()
+                cursor.execute('SELECT 1')
+                cursor.fetchall()
+            except BaseException:
+                if conn is not None:
+                    self._close(conn)
+                    with self._cond:
+                        self._size -= 1
+                with self._cond:
+                    self._warming -= 1
+                    self._cond.notify_all()
+                raise
+            with self._cond:
+                self._warming -= 1
+                self._idle.append((conn, time.monotonic()))
+                self._cond.notify()
+
+    def acquire(self):
+        """
+        Borrows a connection, reusing an idle one when possible.
+        Blocks while max_size connections are borrowed, raising PoolTimeout after checkout_timeout seconds.
+        """
+        deadline = time.monotonic() + self.checkout_timeout
+        while True:
+            conn, idle_since = None, None
+            with self._cond:
+                while True:
+                    evicted = self._evict_idle()
+                    if self._idle:
+                        conn, idle_since = self._idle.pop()
+                        break
+                    if self._size < self.max_size and not self._warming:
+                        self._size += 1
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolTimeout(f'No database connection available after {self.checkout_timeout}s')
+                    self._cond.wait(remaining)
+            for old in evicted:
+                self._close(old)
+            if conn is None:
+                return self._open()
+            if time.monotonic() - idle_since <= self.check_interval or self._healthy(conn):
+                return conn
+            # Stale connection: drop it and try again
+            self._close(conn)
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+
+    def release(self, conn, discard: bool = False) -> None:
+        """
+        Returns a borrowed connection to the pool. Uncommitted work is rolled back.
+        @param discard: bool, close the connection instead of keeping it for reuse
+        """
+        if not discard:
+            try:
+                conn.rollback()
+            except Exception:
+                discard = True
+        if discard:
+            self._close(conn)
+        with self._cond:
+            if discard:
+                self._size -= 1
+            else:
+                self._idle.append((conn, time.monotonic()))
+            evicted = self._evict_idle()
+            self._cond.notify()
+        for old in evicted:
+            self._close(old)
+
+    def close(self) -> None:
+        """
+        Closes every idle connection. Borrowed connections are closed when they are released.
+        """
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn, _ in idle:
+            self._close(conn)
+
+    def connection(self):
+        """
+        Context manager that borrows a connection for the duration of a with block.
+        """
+        return ConnectionManager(self)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+# Connection handed out by every ConnectionManager in this context instead of a pooled one (see pin_connection)
+_pinned = contextvars.ContextVar('pinned_connection', default=None)
+
+
+@contextmanager
+def pin_connection(conn):
+    """
+    Makes every ConnectionManager opened inside the with block use conn, e.g. to run many commands in one
+    transaction. The caller owns conn: it is neither committed nor closed here.
+    """
+    token = _pinned.set(conn)
+    try:
+        yield conn
+    finally:
+        _pinned.reset(token)
+
+
+def get_pool() -> ConnectionPool:
+    """
+    Returns the process-wide connection pool, creating it from the .env settings on first use.
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(instrumented(get_backend()),
+                                       min_size=config('PoolMinSize', default=1, cast=int),
+                                       max_size=config('PoolMaxSize', default=10, cast=int),
+                                       idle_timeout=config('PoolIdleTimeout', default=300.0, cast=float),
+                                       check_interval=config('PoolCheckInterval', default=5.0, cast=float),
+                                       checkout_timeout=config('PoolCheckoutTimeout', default=30.0, cast=float))
+    return _pool
+
+
+def prewarm(*tasks) -> threading.Thread:
+    """
+    Builds the pool and warms it in a background thread, so loading the settings and the database driver and
+    connecting happen while the user is still typing the first command. Errors are left for the first command to
+    run into and report.
+    @param tasks: callables run next in the same thread, e.g. to load caches
+    @return: threading.Thread, the daemon thread doing the work
+    """
+    def warm():
+        started = time.perf_counter()
+        try:
+            get_pool().warm()
+        except Exception:
+            return
+        get_metrics().observe('scheduler_prewarm_seconds', time.perf_counter() - started)
+        for task in tasks:
+            try:
+                task()
+            except Exception:
+                pass
+
+    thread = threading.Thread(target=warm, name='pool-prewarm', daemon=True)
+    thread.start()
+    return thread
 
 
 class ConnectionManager:
+    """
+    Borrows a pooled connection. Use either create_connection()/close_connection() or a with block:
+
+        with ConnectionManager() as conn:
+            ...
+    """
 
-    def __init__(self):
-        self.server_name = config('Server') + ".database.windows.net"
-        self.db_name = config('DBName')
-        self.user = config("UserID")
-        self.password = config("Password")
+    def __init__(self, pool: ConnectionPool = None):
+        self.pool = pool
         self.conn = None
 
     def create_connection(self):
+        pinned = _pinned.get()
+        if pinned is not None:
+            self.conn = pinned
+            return self.conn
+        if self.pool is None:
+            self.pool = get_pool()
+        started = time.perf_counter()
         try:
-            self.conn = pymssql.connect(
-                                        server=self.server_name,
-                                        user=self.user,
-                                        password=self.password,
-                                        database=self.db_name)
-        except pymssql.Error as db_err:
+            self.conn = self.pool.acquire()
+        except DBError as db_err:
             print("Database Programming Error in SQL connection processing! ")
             print(db_err)
             quit()
+        waited = time.perf_counter() - started
+        metrics = get_metrics()
+        metrics.observe('scheduler_pool_wait_seconds', waited)
+        metrics.charge('pool_wait', waited)
         return self.conn
 
     def close_connection(self):
-        try:
-            self.conn.close()
-        except pymssql.Error as db_err:
-            print("Database Programming Error in SQL connection processing! ")
-            print(db_err)
-            quit()
+        # Safe to call more than once, only the first call hands the connection back
+        if self.conn is None:
+            return
+        conn, self.conn = self.conn, None
+        if conn is not _pinned.get():
+            self.pool.release(conn)
+
+    def __enter__(self):
+        return self.create_connection()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close_connection()
+        return False
@@ -0,0 +1,68 @@
+class GroupedConnection:
+    """
+    Wraps a connection so the commits of many commands reach the database as one transaction.
+    Each command runs inside a savepoint: its commit() keeps its work so far, its rollback() and anything it leaves
+    uncommitted are undone back to the savepoint, and the transaction is really committed every group_size
+    commands that wrote something.
+    """
+
+    SAVEPOINT = 'batch_command'
+
+    def __init__(self, conn, backend, group_size: int = 100) -> None:
+        """
+        @param conn: connection borrowed from the pool, owned by this wrapper until it is handed back
+        @param backend: Backend the connection belongs to, used for savepoints
+        @param group_size: int, commands committed together
+        """
+        self.conn = conn
+        self._backend = backend
+        self.group_size = group_size
+        self.pending = 0   # commands whose work waits for the next real commit
+        self.commits = 0   # real commits so far
+        self._wrote = False
+
+    def cursor(self, *args, **kwargs):
+        return self.conn.cursor(*args, **kwargs)
+
+    def begin_command(self) -> None:
+        self._wrote = False
+        self._backend.savepoint(self.conn, self.SAVEPOINT)
+
+    def commit(self) -> None:
+        # Keep the command's work: move the savepoint past it
+        self._backend.release(self.conn, self.SAVEPOINT)
+        self._backend.savepoint(self.conn, self.SAVEPOINT)
+        self._wrote = True
+
+    def rollback(self) -> None:
+        self._backend.rollback_to(self.conn, self.SAVEPOINT)
+
+    def end_command(self) -> None:
+        """
+        Discards what the command did not commit, as releasing a pooled connection would, and commits the group
+        once it is full.
+        """
+        self._backend.rollback_to(self.conn, self.SAVEPOINT)
+        self._backend.release(self.conn, self.SAVEPOINT)
+        if self._wrote:
+            self.pending += 1
+        if self.pending >= self.group_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Commits every command since the last real commit.
+        """
+        self.conn.commit()
+        if self.pending:
+            self.commits += 1
+        self.pending = 0
+
+    def abort(self) -> int:
+        """
+        Rolls back every command since the last real commit, e.g. after the transaction failed.
+        @return: int, the number of commands whose work was lost
+        """
+        lost, self.pending = self.pending, 0
+        self.conn.rollback()
+        return lost
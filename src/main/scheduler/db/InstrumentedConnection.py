@@ -0,0 +1,176 @@
+import time
+from db.SQLTracer import get_tracer
+from util.Metrics import get_metrics
+
+
+# Statement kinds used as the label of query metrics; anything else, e.g. a T-SQL batch, is 'OTHER'
+STATEMENTS = ('SELECT', 'INSERT', 'UPDATE', 'DELETE')
+
+
+def _statement(query) -> str:
+    words = str(query).split(None, 1)
+    kind = words[0].upper() if words else ''
+    return kind if kind in STATEMENTS else 'OTHER'
+
+
+class InstrumentedCursor:
+    """
+    Cursor that records the latency of every statement and the rows fetched (see util.Metrics), and hands each
+    statement to the tracer (see db.SQLTracer) once its results have been read. Driver errors are raised as
+    DBError (see Backend.translate).
+    """
+
+    def __init__(self, cursor, backend, metrics, tracer) -> None:
+        self._cursor = cursor
+        self._backend = backend
+        self._metrics = metrics
+        self._tracer = tracer if tracer.active else None
+        self._trace = None  # [query, params, seconds, rows fetched, rowcount, many] of the last statement
+
+    def _timed(self, method, query, params, many=False):
+        self._finish()
+        started = time.perf_counter()
+        try:
+            return method(query, params)
+        except Exception as e:
+            raise self._backend.translate(e)
+        finally:
+            elapsed = time.perf_counter() - started
+            self._metrics.observe('scheduler_query_seconds', elapsed, statement=_statement(query))
+            self._metrics.charge('sql', elapsed, queries=1)
+            if self._tracer is not None:
+                self._trace = [query, params, elapsed, 0, self._cursor.rowcount, many]
+
+    def _finish(self) -> None:
+        # The last statement is done: its rows were read, or another statement is starting
+        trace, self._trace = self._trace, None
+        if trace is not None:
+            query, params, seconds, fetched, rowcount, many = trace
+            self._tracer.record(query, params, seconds, fetched or max(rowcount or 0, 0), many)
+
+    def execute(self, query, params=None):
+        self._timed(self._cursor.execute, query, params)
+        return self
+
+    def executemany(self, query, seq_of_params):
+        if self._tracer is not None and not isinstance(seq_of_params, (list, tuple)):
+            # Keep the parameters around for the trace
+            seq_of_params = list(seq_of_params)
+        self._timed(self._cursor.executemany, query, seq_of_params, many=True)
+        return self
+
+    def _fetched(self, rows: int, seconds: float = 0.0, done: bool = False) -> None:
+        if rows:
+            self._metrics.inc('scheduler_rows_fetched_total', rows)
+        if self._trace is not None:
+            self._trace[2] += seconds
+            self._trace[3] += rows
+            if done:
+                self._finish()
+
+    def fetchone(self):
+        started = time.perf_counter()
+        try:
+            row = self._cursor.fetchone()
+        except Exception as e:
+            raise self._backend.translate(e)
+        self._fetched(row is not None, time.perf_counter() - started, done=row is None)
+        return row
+
+    def fetchmany(self, *args):
+        started = time.perf_counter()
+        try:
+            rows = self._cursor.fetchmany(*args)
+        except Exception as e:
+            raise self._backend.translate(e)
+        self._fetched(len(rows), time.perf_counter() - started, done=not rows)
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        try:
+            rows = self._cursor.fetchall()
+        except Exception as e:
+            raise self._backend.translate(e)
+        self._fetched(len(rows), time.perf_counter() - started, done=True)
+        return rows
+
+    def __iter__(self):
+        rows = 0
+        started = time.perf_counter()
+        try:
+            for row in self._cursor:
+                rows += 1
+                yield row
+        except Exception as e:
+            raise self._backend.translate(e)
+        finally:
+            # Includes the time the caller spent on each row, which is what iterating costs it
+            self._fetched(rows, time.perf_counter() - started, done=True)
+
+    def nextset(self):
+        try:
+            return self._cursor.nextset()
+        except Exception as e:
+            raise self._backend.translate(e)
+
+    def close(self) -> None:
+        self._finish()
+        self._cursor.close()
+
+    def __del__(self):
+        try:
+            self._finish()
+        except Exception:
+            pass
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class InstrumentedConnection:
+    """
+    Connection whose cursors are instrumented and whose commits and rollbacks raise DBError. Everything else is
+    passed through to the driver's connection.
+    """
+
+    def __init__(self, conn, backend, metrics, tracer) -> None:
+        self._conn = conn
+        self._backend = backend
+        self._metrics = metrics
+        self._tracer = tracer
+
+    def cursor(self, *args, **kwargs):
+        return InstrumentedCursor(self._conn.cursor(*args, **kwargs), self._backend, self._metrics, self._tracer)
+
+    def commit(self) -> None:
+        try:
+            self._conn.commit()
+        except Exception as e:
+            raise self._backend.translate(e)
+
+    def rollback(self) -> None:
+        try:
+            self._conn.rollback()
+        except Exception as e:
+            raise self._backend.translate(e)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+def instrumented(backend):
+    """
+    Wraps backend.connect() so every connection it opens is timed, counted, instrumented and traced.
+    """
+    def connect_instrumented():
+        metrics = get_metrics()
+        started = time.perf_counter()
+        try:
+            conn = backend.connect()
+        except Exception as e:
+            raise backend.translate(e)
+        metrics.observe('scheduler_connect_seconds', time.perf_counter() - started)
+        metrics.inc('scheduler_connections_opened_total')
+        return InstrumentedConnection(conn, backend, metrics, get_tracer())
+    return connect_instrumented
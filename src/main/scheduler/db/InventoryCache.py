@@ -0,0 +1,125 @@
+import threading
+import time
+from contextlib import contextmanager
+from decouple import config
+from db.ConnectionManager import ConnectionManager
+
+
+class InventoryCache:
+    """
+    Write-through, in-process copy of the Vaccines table (name -> doses).
+    Writes in this process go to the database first and are then applied to the cache as the same relative change.
+    Every write also bumps the row's Version, so a one-row COUNT/SUM(Version) check, run at most every
+    check_interval seconds, notices writes from other processes and triggers a reload.
+    """
+
+    LOAD = 'SELECT Name, Doses, Version FROM Vaccines'
+    CHECK = 'SELECT COUNT(*), SUM(Version) FROM Vaccines'
+
+    def __init__(self, check_interval: float = 5.0) -> None:
+        """
+        @param check_interval: float, seconds the cache is trusted before its version is checked again
+        """
+        self.check_interval = check_interval
+        self._doses = None       # name -> doses, None until loaded
+        self._version = None     # (row count, sum of Version) the cache corresponds to
+        self._checked = 0.0
+        self._generation = 0     # bumped around every write, so loads that raced one are discarded
+        self._writing = 0
+        self._lock = threading.Lock()
+
+    def _current(self) -> dict:
+        with self._lock:
+            doses, version, generation = self._doses, self._version, self._generation
+            if doses is not None and time.monotonic() - self._checked < self.check_interval:
+                return doses
+        with ConnectionManager() as conn:
+            cursor = conn.cursor()
+            if doses is not None:
+                cursor.execute(self.CHECK)
+                count, total = cursor.fetchone()
+                if (count, total or 0) == version:
+                    with self._lock:
+                        if self._generation == generation:
+                            self._checked = time.monotonic()
+                    return doses
+            cursor.execute(self.LOAD)
+            rows = cursor.fetchall()
+        doses = {name: amount for name, amount, _ in rows}
+        with self._lock:
+            if self._generation == generation and self._writing == 0:
+                self._doses = doses
+                self._version = (len(rows), sum(v for _, _, v in rows))
+                self._checked = time.monotonic()
+        return doses
+
+    def get_doses(self, name: str):
+        """
+        Returns the doses left of vaccine name, or None if there is no such vaccine.
+        """
+        doses = self._current().get(name)
+        if doses is None:
+            # Possibly added by another process since the last check
+            self.invalidate()
+            doses = self._current().get(name)
+        return doses
+
+    def all(self) -> list:
+        """
+        Returns (name, doses) for every vaccine, sorted by name.
+        """
+        doses = self._current()
+        with self._lock:
+            return sorted(doses.items())
+
+    def invalidate(self) -> None:
+        """
+        Forces the next read to reload from the database.
+        """
+        with self._lock:
+            self._doses = None
+            self._generation += 1
+
+    @contextmanager
+    def write(self):
+        """
+        Brackets a database write to Vaccines. Call the yielded function with (name, delta) once the change is
+        committed; a name the cache does not know is added with delta doses. Recorded changes are applied to the
+        cache when the block exits.
+        """
+        changes = []
+        with self._lock:
+            self._writing += 1
+            self._generation += 1
+        try:
+            yield lambda name, delta: changes.append((name, delta))
+        finally:
+            with self._lock:
+                self._writing -= 1
+                self._generation += 1
+                if self._doses is not None:
+                    count, total = self._version
+                    for name, delta in changes:
+                        if name in self._doses:
+                            self._doses[name] += delta
+                            total += 1
+                        else:
+                            self._doses[name] = delta
+                            count += 1
+                    self._version = (count, total)
+
+
+_inventory = None
+_inventory_lock = threading.Lock()
+
+
+def get_inventory() -> InventoryCache:
+    """
+    Returns the process-wide inventory cache, checked every InventoryCheckInterval seconds (.env).
+    """
+    global _inventory
+    if _inventory is None:
+        with _inventory_lock:
+            if _inventory is None:
+                _inventory = InventoryCache(config('InventoryCheckInterval', default=5.0, cast=float))
+    return _inventory
@@ -0,0 +1,115 @@
+import re
+import pymssql
+from decouple import config
+from db.Backend import Backend, RESERVED, NO_DOSES
+
+
+# One batch: the conditional decrement row-locks the vaccine so concurrent reservations of it queue up, and
+# UPDLOCK/READPAST lets reservations of other vaccines skip slots that are already being taken.
+RESERVE_BATCH = """
+SET NOCOUNT ON;
+DECLARE @status INT = 0, @apt VARCHAR(36) = NULL, @cg VARCHAR(255) = NULL;
+UPDATE Vaccines SET Doses = Doses - 1, Version = Version + 1 WHERE Name = %(vaccine)s AND Doses >= 1;
+IF @@ROWCOUNT = 0
+    SET @status = 1;
+ELSE
+BEGIN
+    SELECT TOP 1 @apt = AV.AppointmentID, @cg = AV.CaregiverID
+    FROM Availabilities AV WITH (UPDLOCK, READPAST, ROWLOCK)
+    WHERE AV.Date = %(date)s
+      AND NOT EXISTS (SELECT 1 FROM Appointments AP WHERE AP.AppointmentID = AV.AppointmentID)
+    ORDER BY AV.CaregiverID, AV.AppointmentID;
+    IF @apt IS NULL
+        SET @status = 2;
+    ELSE
+        INSERT INTO Appointments VALUES (@apt, %(vaccine)s, %(patient)s);
+END
+SELECT @status AS Status, @apt AS AppointmentID, @cg AS CaregiverID;
+"""
+
+# Books one given slot. UPDLOCK/HOLDLOCK keeps the key range locked from the check to the insert, so a concurrent
+# booking of the same slot waits and then finds it taken instead of failing on the primary key.
+RESERVE_SLOT_BATCH = """
+SET NOCOUNT ON;
+DECLARE @status INT = 0;
+INSERT INTO Appointments (AppointmentID, VaccineType, PatientID)
+SELECT %(apt)s, %(vaccine)s, %(patient)s
+WHERE NOT EXISTS (SELECT 1 FROM Appointments WITH (UPDLOCK, HOLDLOCK) WHERE AppointmentID = %(apt)s);
+IF @@ROWCOUNT = 0
+    SET @status = 2;
+ELSE
+BEGIN
+    UPDATE Vaccines SET Doses = Doses - 1, Version = Version + 1 WHERE Name = %(vaccine)s AND Doses >= 1;
+    IF @@ROWCOUNT = 0
+        SET @status = 1;
+END
+SELECT @status AS Status;
+"""
+
+
+class MSSQLBackend(Backend):
+    """
+    Azure SQL / SQL Server through pymssql.
+    """
+    name = 'mssql'
+    Error = pymssql.Error
+    IntegrityError = pymssql.IntegrityError
+    SCAN = re.compile(r'Table Scan|Index Scan')
+
+    def __init__(self):
+        self.server_name = config('Server') + ".database.windows.net"
+        self.db_name = config('DBName')
+        self.user = config("UserID")
+        self.password = config("Password")
+
+    def connect(self):
+        return pymssql.connect(server=self.server_name,
+                               user=self.user,
+                               password=self.password,
+                               database=self.db_name)
+
+    def reserve(self, conn, date, vaccine, patient):
+        cursor = conn.cursor()
+        cursor.execute(RESERVE_BATCH, {'vaccine': vaccine, 'date': date, 'patient': patient})
+        status, apt_id, caregiver = cursor.fetchone()
+        if status == RESERVED:
+            conn.commit()
+        else:
+            # Undo the dose decrement
+            conn.rollback()
+        return status, apt_id, caregiver
+
+    def reserve_slot(self, conn, appointment_id, vaccine, patient):
+        cursor = conn.cursor()
+        cursor.execute(RESERVE_SLOT_BATCH, {'apt': appointment_id, 'vaccine': vaccine, 'patient': patient})
+        status = cursor.fetchone()[0]
+        if status == RESERVED:
+            conn.commit()
+        elif status == NO_DOSES:
+            # Undo the booking
+            conn.rollback()
+        return status
+
+    def limit(self, query, n):
+        return re.sub(r'^\s*SELECT\b', f'SELECT TOP {int(n)}', query, count=1, flags=re.IGNORECASE)
+
+    def savepoint(self, conn, name):
+        # pymssql keeps a transaction open whenever autocommit is off
+        conn.cursor().execute(f'SAVE TRANSACTION {name}')
+
+    def rollback_to(self, conn, name):
+        conn.cursor().execute(f'ROLLBACK TRANSACTION {name}')
+
+    def explain(self, conn, query):
+        cursor = conn.cursor()
+        cursor.execute('SET SHOWPLAN_TEXT ON')
+        try:
+            cursor.execute(query)
+            lines = []
+            while True:
+                lines.extend(str(row[0]) for row in cursor.fetchall())
+                if not cursor.nextset():
+                    break
+        finally:
+            cursor.execute('SET SHOWPLAN_TEXT OFF')
+        return lines
@@ -0,0 +1,182 @@
+import importlib.util
+import os
+import re
+from db.Backend import DBError
+
+
+# Versioned schema changes applied on top of create.sql, named <version>_<name>.sql (or .py, see PythonMigration)
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'resources', 'migrations')
+
+_FILE = re.compile(r'^(\d+)_(\w+)\.(sql|py)$')
+# Directives given in comments of a migration file
+_APPLIED_IF_COLUMN = re.compile(r'^--\s*applied-if-column:\s*(\w+)\.(\w+)\s*$')
+_PLAN_CHECK = re.compile(r'^--\s*plan-check:\s*(.+?)\s*$')
+
+CREATE_HISTORY = 'CREATE TABLE SchemaMigrations (' \
+                 'Version INT PRIMARY KEY, ' \
+                 'Name VARCHAR(255) NOT NULL, ' \
+                 'AppliedAt DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP)'
+
+
+class Migration:
+    """
+    One schema change: the statements of a migration file, separated by semicolons at the end of a line.
+    Comment directives in the file:
+    -- applied-if-column: Table.Column   the change is already in place if Column exists (see MigrationRunner)
+    -- plan-check: SELECT ...            a query whose plan must not scan a table once the migration is applied
+    """
+
+    def __init__(self, version: int, name: str, text: str) -> None:
+        self.version = version
+        self.name = name
+        self.marker = None
+        self.checks = []
+        lines = []
+        for line in text.splitlines():
+            stripped = line.strip()
+            marker = _APPLIED_IF_COLUMN.match(stripped)
+            check = _PLAN_CHECK.match(stripped)
+            if marker:
+                self.marker = marker.groups()
+            elif check:
+                self.checks.append(check.group(1))
+            elif not stripped.startswith('--'):
+                lines.append(line)
+        self.statements = [s.strip() for s in re.split(r';\s*$', '\n'.join(lines), flags=re.MULTILINE) if s.strip()]
+
+    def apply(self, conn, backend) -> None:
+        cursor = conn.cursor()
+        for statement in self.statements:
+            cursor.execute(statement)
+
+    def __str__(self):
+        return f'{self.version:04d}_{self.name}'
+
+
+class PythonMigration(Migration):
+    """
+    A migration written as a module with an upgrade(conn, backend) function, for changes plain SQL cannot make the
+    same way on every backend, such as computing new key values. The module may list PLAN_CHECKS queries.
+    """
+
+    def __init__(self, version: int, name: str, path: str) -> None:
+        super().__init__(version, name, '')
+        spec = importlib.util.spec_from_file_location(f'migration_{version:04d}_{name}', path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        self.checks = list(getattr(module, 'PLAN_CHECKS', ()))
+        self._upgrade = module.upgrade
+
+    def apply(self, conn, backend) -> None:
+        self._upgrade(conn, backend)
+
+
+class MigrationRunner:
+    """
+    Brings a database created from create.sql up to date by applying the migrations it has not had yet, each in
+    its own transaction. Applied versions are recorded in the SchemaMigrations table.
+    """
+
+    SAVEPOINT = 'migration'
+
+    def __init__(self, backend, directory: str = MIGRATIONS_DIR) -> None:
+        self.backend = backend
+        self.migrations = []
+        for filename in sorted(os.listdir(directory)):
+            match = _FILE.match(filename)
+            if not match:
+                continue
+            version, name, path = int(match.group(1)), match.group(2), os.path.join(directory, filename)
+            if match.group(3) == 'py':
+                self.migrations.append(PythonMigration(version, name, path))
+            else:
+                with open(path) as f:
+                    self.migrations.append(Migration(version, name, f.read()))
+
+    def applied(self, conn):
+        """
+        @return: set of applied versions, or None if the database has no SchemaMigrations table yet
+        """
+        cursor = conn.cursor()
+        try:
+            cursor.execute('SELECT Version FROM SchemaMigrations')
+            return {row[0] for row in cursor.fetchall()}
+        except (self.backend.Error, DBError):
+            # Raised by the driver on a bare connection, as DBError on a pooled one
+            conn.rollback()
+            return None
+
+    @staticmethod
+    def _has_column(conn, table: str, column: str) -> bool:
+        cursor = conn.cursor()
+        cursor.execute(f'SELECT * FROM {table} WHERE 1 = 0')
+        cursor.fetchall()
+        return column.lower() in (d[0].lower() for d in cursor.description)
+
+    def _record(self, conn, migration: Migration) -> None:
+        conn.cursor().execute('INSERT INTO SchemaMigrations (Version, Name) VALUES (%d, %s)',
+                              (migration.version, migration.name))
+
+    def _adopt(self, conn) -> set:
+        # A database from before migrations were tracked: create the history, counting the leading migrations
+        # whose changes were already made by hand as applied.
+        self.backend.savepoint(conn, self.SAVEPOINT)
+        try:
+            conn.cursor().execute(CREATE_HISTORY)
+            applied = set()
+            for migration in self.migrations:
+                if migration.marker is None or not self._has_column(conn, *migration.marker):
+                    break
+                self._record(conn, migration)
+                applied.add(migration.version)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        return applied
+
+    def pending(self, conn) -> list:
+        applied = self.applied(conn) or set()
+        return [m for m in self.migrations if m.version not in applied]
+
+    def upgrade(self, conn, target: int = None, progress=None) -> list:
+        """
+        Applies every pending migration up to version target (default all), in order.
+        @param progress: optional callable, given each Migration as it is applied
+        @return: list of the migrations applied
+        """
+        applied = self.applied(conn)
+        if applied is None:
+            applied = self._adopt(conn)
+        done = []
+        for migration in self.migrations:
+            if migration.version in applied or (target is not None and migration.version > target):
+                continue
+            if progress is not None:
+                progress(migration)
+            self.backend.savepoint(conn, self.SAVEPOINT)
+            try:
+                migration.apply(conn, self.backend)
+                self._record(conn, migration)
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            done.append(migration)
+        return done
+
+    def check_plans(self, conn) -> list:
+        """
+        Explains the plan-check queries of every applied migration.
+        @return: list of (migration, query, plan lines, scanning lines), scanning lines empty when the plan is good
+        """
+        applied = self.applied(conn) or set()
+        results = []
+        for migration in self.migrations:
+            if migration.version not in applied:
+                continue
+            for query in migration.checks:
+                plan = self.backend.explain(conn, query)
+                scans = [line for line in plan if self.backend.SCAN.search(line)]
+                results.append((migration, query, plan, scans))
+        return results
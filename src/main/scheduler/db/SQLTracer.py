@@ -0,0 +1,137 @@
+import datetime
+import json
+import logging
+import random
+import re
+import threading
+from decouple import config
+from util.Metrics import current_command
+
+
+WHITESPACE = re.compile(r'\s+')
+# Multi-row VALUES lists, collapsed to their first row so every batch size normalizes to the same statement
+ROWS = re.compile(r'(\([^()]*\))(?:\s*,\s*\1)+')
+# Parameters with one of these in their name, and every binary parameter (salts and hashes), are redacted
+SECRET_NAMES = ('password', 'hash', 'salt')
+REDACTED = '<redacted>'
+MAX_STATEMENT = 4000
+MAX_VALUE = 200
+MAX_PARAMS = 20
+
+
+def normalize(query) -> str:
+    """
+    Returns query on one line with runs of whitespace collapsed and repeated VALUES rows written once as
+    '(...), ...', cut to MAX_STATEMENT characters.
+    """
+    return ROWS.sub(r'\1, ...', WHITESPACE.sub(' ', str(query)).strip())[:MAX_STATEMENT]
+
+
+def _value(value):
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return REDACTED
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    text = str(value)
+    return text if len(text) <= MAX_VALUE else text[:MAX_VALUE] + '...'
+
+
+def redact(params):
+    """
+    Returns a JSON-safe copy of statement parameters with credentials replaced by REDACTED.
+    """
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {k: REDACTED if any(s in str(k).lower() for s in SECRET_NAMES) else _value(v)
+                for k, v in params.items()}
+    if isinstance(params, (tuple, list)):
+        values = [_value(v) for v in params[:MAX_PARAMS]]
+        if len(params) > MAX_PARAMS:
+            values.append(f'... {len(params)} values')
+        return values
+    return _value(params)
+
+
+class SQLTracer:
+    """
+    Receives every statement run on a pooled connection once its results have been read.
+    Statements taking at least slow_ms go to the query log as WARNING, a sample_rate fraction of the others as
+    INFO. Functions added with add_hook() are given every statement.
+    """
+
+    def __init__(self, slow_ms: float = 100.0, sample_rate: float = 0.0, path: str = None,
+                 max_bytes: int = 10 * 1024 * 1024, backups: int = 5) -> None:
+        """
+        @param slow_ms: float, statements at least this slow are always logged
+        @param sample_rate: float, fraction (0 to 1) of the other statements that are logged
+        @param path: str, query log file, rotated at max_bytes with backups old files kept; None to not log
+        """
+        self.slow_ms = slow_ms
+        self.sample_rate = sample_rate
+        self.hooks = []
+        self._logger = None
+        if path:
+            # Only imported when there is a query log, it is slow to import
+            from logging.handlers import RotatingFileHandler
+            self._logger = logging.Logger('scheduler.sql')
+            handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups, encoding='utf-8',
+                                          delay=True)
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            self._logger.addHandler(handler)
+
+    def add_hook(self, hook) -> None:
+        """
+        @param hook: callable given a dict per statement: ts, ms, rows, slow, command, statement, params, many
+        """
+        self.hooks.append(hook)
+
+    @property
+    def active(self) -> bool:
+        return self._logger is not None or bool(self.hooks)
+
+    def record(self, query, params, seconds: float, rows: int, many: bool = False) -> None:
+        """
+        @param seconds: float, time spent executing the statement and fetching its rows
+        @param rows: int, rows fetched or affected
+        @param many: bool, params is a sequence of parameter sets (executemany)
+        """
+        ms = seconds * 1000
+        slow = ms >= self.slow_ms
+        logged = self._logger is not None and (slow or (self.sample_rate and random.random() < self.sample_rate))
+        if not logged and not self.hooks:
+            return
+        if many:
+            params = list(params) if not isinstance(params, (list, tuple)) else params
+            # Only the first parameter set, and how many there were
+            params = {'count': len(params), 'first': redact(params[0]) if params else None}
+        else:
+            params = redact(params)
+        entry = {'ts': datetime.datetime.now().isoformat(timespec='milliseconds'), 'ms': round(ms, 3),
+                 'rows': rows, 'slow': slow, 'command': current_command(), 'statement': normalize(query),
+                 'params': params, 'many': many}
+        for hook in self.hooks:
+            hook(entry)
+        if logged:
+            self._logger.log(logging.WARNING if slow else logging.INFO, json.dumps(entry, default=str))
+
+
+_tracer = None
+_tracer_lock = threading.Lock()
+
+
+def get_tracer() -> SQLTracer:
+    """
+    Returns the process-wide tracer, configured from QueryLogFile, SlowQueryMs, QuerySampleRate,
+    QueryLogMaxBytes and QueryLogBackups in .env.
+    """
+    global _tracer
+    if _tracer is None:
+        with _tracer_lock:
+            if _tracer is None:
+                _tracer = SQLTracer(config('SlowQueryMs', default=100.0, cast=float),
+                                    config('QuerySampleRate', default=0.0, cast=float),
+                                    config('QueryLogFile', default='') or None,
+                                    config('QueryLogMaxBytes', default=10 * 1024 * 1024, cast=int),
+                                    config('QueryLogBackups', default=5, cast=int))
+    return _tracer
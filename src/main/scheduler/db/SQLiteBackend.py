@@ -0,0 +1,255 @@
+import datetime
+import itertools
+import os
+import re
+import sqlite3
+import threading
+from functools import lru_cache
+from db.Backend import Backend, RESERVED, NO_DOSES, NO_SLOTS
+from db.MigrationRunner import MigrationRunner
+
+
+# Schema shared with the MSSQL deployment, upgraded by the migrations next to it
+CREATE_SQL = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'resources', 'create.sql')
+
+_PLACEHOLDER = re.compile(r"%(?:\((\w+)\))?([sd%])")
+_memory_ids = itertools.count()
+
+# DATE columns come back as datetime.date, the same as pymssql returns them
+sqlite3.register_converter('DATE', lambda b: datetime.date.fromisoformat(b.decode()))
+
+
+@lru_cache(maxsize=512)
+def translate(query: str) -> str:
+    """
+    Rewrites pymssql placeholders ('%s', '%d', '%(name)s') into sqlite3 ones ('?', ':name').
+    """
+    def sub(m):
+        if m.group(2) == '%':
+            return '%'
+        return f':{m.group(1)}' if m.group(1) else '?'
+    return _PLACEHOLDER.sub(sub, query)
+
+
+def _adapt(value):
+    # Dates are stored as ISO text so they compare correctly against '%Y-%m-%d' parameters
+    if isinstance(value, datetime.datetime):
+        if value.time() == datetime.time():
+            return value.date().isoformat()
+        return value.isoformat(' ')
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    return value
+
+
+def _params(params):
+    if params is None:
+        return ()
+    if isinstance(params, dict):
+        return {k: _adapt(v) for k, v in params.items()}
+    if not isinstance(params, (tuple, list)):
+        # pymssql accepts a single bare parameter
+        params = (params,)
+    return tuple(_adapt(v) for v in params)
+
+
+def _dict_row(cursor, row):
+    return {d[0]: v for d, v in zip(cursor.description, row)}
+
+
+class SQLiteCursor:
+    """
+    sqlite3 cursor speaking the pymssql dialect used throughout the app.
+    """
+
+    def __init__(self, cursor, as_dict: bool = False):
+        self._cursor = cursor
+        if as_dict:
+            self._cursor.row_factory = _dict_row
+
+    def execute(self, query, params=None):
+        self._cursor.execute(translate(query), _params(params))
+        return self
+
+    def executemany(self, query, seq_of_params):
+        self._cursor.executemany(translate(query), (_params(p) for p in seq_of_params))
+        return self
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchmany(self, size=None):
+        return self._cursor.fetchmany(size if size is not None else self._cursor.arraysize)
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def close(self):
+        self._cursor.close()
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+
+class SQLiteConnection:
+    """
+    sqlite3 connection whose cursors accept pymssql-style queries.
+    """
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def cursor(self, as_dict: bool = False):
+        return SQLiteCursor(self._conn.cursor(), as_dict)
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    @property
+    def in_transaction(self):
+        return self._conn.in_transaction
+
+    def close(self):
+        self._conn.close()
+
+
+class SQLiteBackend(Backend):
+    """
+    Embedded, in-process SQLite database built from create.sql.
+    Pass ':memory:' for a throwaway database that lives as long as the backend does.
+    """
+    name = 'sqlite'
+    Error = sqlite3.Error
+    IntegrityError = sqlite3.IntegrityError
+    SCAN = re.compile(r'^SCAN ')
+
+    def __init__(self, path: str = 'scheduler.db', timeout: float = 30.0):
+        self.path = path
+        self.timeout = timeout
+        self._keeper = None
+        self._init_lock = threading.Lock()
+        self._initialized = False
+        if path == ':memory:':
+            # Each pooled connection must see the same database, so use a named shared-cache one and keep a
+            # connection open for the lifetime of the backend.
+            self._target = f'file:scheduler-{os.getpid()}-{next(_memory_ids)}?mode=memory&cache=shared'
+            self._uri = True
+            self._keeper = self._open()
+        else:
+            self._target = path
+            self._uri = False
+
+    def _open(self):
+        # IMMEDIATE takes the write lock when a transaction starts, so concurrent writers queue on the busy
+        # timeout instead of failing on a lock upgrade.
+        conn = sqlite3.connect(self._target, uri=self._uri, timeout=self.timeout, isolation_level='IMMEDIATE',
+                               detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False)
+        conn.execute('PRAGMA foreign_keys = ON')
+        if not self._uri:
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('PRAGMA synchronous = NORMAL')
+        return conn
+
+    def _create_schema(self, conn) -> None:
+        with self._init_lock:
+            if self._initialized:
+                return
+            exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'Vaccines'").fetchone()
+            if exists is None:
+                with open(CREATE_SQL) as f:
+                    conn.executescript(f.read())
+            # Local databases are kept up to date automatically
+            MigrationRunner(self).upgrade(SQLiteConnection(conn))
+            self._initialized = True
+
+    def connect(self):
+        conn = self._open()
+        if not self._initialized:
+            self._create_schema(conn)
+        return SQLiteConnection(conn)
+
+    def reserve(self, conn, date, vaccine, patient):
+        # In-process, so separate statements cost no round-trips. The decrement opens an IMMEDIATE transaction,
+        # which holds the database write lock until commit and serializes concurrent reservations.
+        cursor = conn.cursor()
+        try:
+            cursor.execute('UPDATE Vaccines SET Doses = Doses - 1, Version = Version + 1 '
+                           'WHERE Name = %s AND Doses >= 1', vaccine)
+            if cursor.rowcount == 0:
+                conn.rollback()
+                return NO_DOSES, None, None
+            cursor.execute('SELECT AV.AppointmentID, AV.CaregiverID FROM Availabilities AV '
+                           'WHERE AV.Date = %s AND NOT EXISTS '
+                           '(SELECT 1 FROM Appointments AP WHERE AP.AppointmentID = AV.AppointmentID) '
+                           'ORDER BY AV.CaregiverID, AV.AppointmentID LIMIT 1', date)
+            row = cursor.fetchone()
+            if row is None:
+                conn.rollback()
+                return NO_SLOTS, None, None
+            cursor.execute('INSERT INTO Appointments VALUES (%s, %s, %s)', (row[0], vaccine, patient))
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        return RESERVED, row[0], row[1]
+
+    def reserve_slot(self, conn, appointment_id, vaccine, patient):
+        # Booking first: if the slot is gone nothing has been written yet
+        cursor = conn.cursor()
+        try:
+            cursor.execute('INSERT INTO Appointments (AppointmentID, VaccineType, PatientID) SELECT %s, %s, %s '
+                           'WHERE NOT EXISTS (SELECT 1 FROM Appointments WHERE AppointmentID = %s)',
+                           (appointment_id, vaccine, patient, appointment_id))
+            if cursor.rowcount == 0:
+                return NO_SLOTS
+            cursor.execute('UPDATE Vaccines SET Doses = Doses - 1, Version = Version + 1 '
+                           'WHERE Name = %s AND Doses >= 1', vaccine)
+            if cursor.rowcount == 0:
+                conn.rollback()
+                return NO_DOSES
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        return RESERVED
+
+    def limit(self, query, n):
+        return f'{query} LIMIT {int(n)}'
+
+    def savepoint(self, conn, name):
+        cursor = conn.cursor()
+        if not conn.in_transaction:
+            # A savepoint outside a transaction would start one that RELEASE commits
+            cursor.execute('BEGIN IMMEDIATE')
+        cursor.execute(f'SAVEPOINT {name}')
+
+    def rollback_to(self, conn, name):
+        conn.cursor().execute(f'ROLLBACK TO {name}')
+
+    def release(self, conn, name):
+        conn.cursor().execute(f'RELEASE {name}')
+
+    def explain(self, conn, query):
+        cursor = conn.cursor()
+        cursor.execute('EXPLAIN QUERY PLAN ' + query)
+        return [row[3] for row in cursor.fetchall()]
+
+    def close(self) -> None:
+        if self._keeper is not None:
+            self._keeper.close()
+            self._keeper = None
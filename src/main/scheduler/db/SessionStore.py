@@ -0,0 +1,142 @@
+import datetime
+import hashlib
+import hmac
+import re
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from decouple import config
+from db.ConnectionManager import ConnectionManager
+from util.Metrics import get_metrics
+
+
+# <TokenID, 32 hex>.<expiry, hex seconds since the epoch>.<signature, 32 hex>; lower case, as commands are lowercased
+TOKEN = re.compile(r'^([0-9a-f]{32})\.([0-9a-f]{1,12})\.([0-9a-f]{32})$')
+KINDS = ('patient', 'caregiver')
+
+
+class SessionStore:
+    """
+    Session tokens, so only the first login of a user pays for password hashing.
+    A token names a row of Sessions (who it is for) and carries its expiry, signed with HMAC-SHA256 under secret.
+    Forged, mangled and expired tokens are turned away from the signature and expiry alone. Good ones are looked up
+    in an LRU cache of recently resumed sessions and only go to the database on a miss, or once their entry is
+    older than check_interval seconds so logouts in other processes are noticed. Logging out deletes the row.
+    """
+
+    LOOKUP = 'SELECT Kind, Username FROM Sessions WHERE TokenID = %s AND ExpiresAt > %s'
+    PURGE_INTERVAL = 3600.0
+
+    def __init__(self, secret: bytes, ttl: float = 7 * 24 * 3600, cache_size: int = 10000,
+                 check_interval: float = 60.0) -> None:
+        """
+        @param secret: bytes, signing key; tokens only verify in processes sharing it
+        @param ttl: float, seconds a session lasts after login
+        @param cache_size: int, most sessions kept in the verification cache
+        @param check_interval: float, seconds a cached session is trusted before the database is asked again
+        """
+        self.secret = secret
+        self.ttl = ttl
+        self.cache_size = cache_size
+        self.check_interval = check_interval
+        self._cache = OrderedDict()  # TokenID -> (kind, username, expiry, time.monotonic() of the lookup)
+        self._purged = 0.0
+        self._lock = threading.Lock()
+
+    def _sign(self, token_id: str, expires: int) -> str:
+        return hmac.new(self.secret, f'{token_id}.{expires:x}'.encode(), hashlib.sha256).hexdigest()[:32]
+
+    def issue(self, kind: str, username: str) -> str:
+        """
+        Starts a session for the patient or caregiver username, who has just logged in with their password.
+        @return: str, the token to resume the session with
+        """
+        if kind not in KINDS:
+            raise ValueError(f'Bad session kind {kind!r}, expected one of {", ".join(KINDS)}')
+        token_id = secrets.token_hex(16)
+        expires = int(time.time() + self.ttl)
+        now = datetime.datetime.now()
+        with ConnectionManager() as conn:
+            cursor = conn.cursor()
+            cursor.execute('INSERT INTO Sessions (TokenID, Kind, Username, ExpiresAt) VALUES (%s, %s, %s, %s)',
+                           (token_id, kind, username, datetime.datetime.fromtimestamp(expires)))
+            if time.monotonic() - self._purged > self.PURGE_INTERVAL:
+                cursor.execute('DELETE FROM Sessions WHERE ExpiresAt <= %s', now)
+                self._purged = time.monotonic()
+            conn.commit()
+        with self._lock:
+            self._remember(token_id, (kind, username, expires, time.monotonic()))
+        return f'{token_id}.{expires:x}.{self._sign(token_id, expires)}'
+
+    def verify(self, token: str):
+        """
+        @return: tuple (kind, username) of the live session token belongs to, or None
+        """
+        match = TOKEN.match(token)
+        if match is None:
+            return None
+        token_id, expires = match.group(1), int(match.group(2), 16)
+        metrics = get_metrics()
+        if not hmac.compare_digest(match.group(3), self._sign(token_id, expires)) or expires <= time.time():
+            metrics.inc('scheduler_session_checks_total', result='rejected')
+            return None
+        with self._lock:
+            entry = self._cache.get(token_id)
+            if entry is not None and time.monotonic() - entry[3] < self.check_interval:
+                self._cache.move_to_end(token_id)
+                metrics.inc('scheduler_session_checks_total', result='cached')
+                return entry[0], entry[1]
+        with ConnectionManager() as conn:
+            cursor = conn.cursor()
+            cursor.execute(self.LOOKUP, (token_id, datetime.datetime.now()))
+            row = cursor.fetchone()
+        with self._lock:
+            if row is None:
+                self._cache.pop(token_id, None)
+            else:
+                self._remember(token_id, (row[0], row[1], expires, time.monotonic()))
+        metrics.inc('scheduler_session_checks_total', result='database' if row is not None else 'rejected')
+        return (row[0], row[1]) if row is not None else None
+
+    def revoke(self, token: str) -> None:
+        """
+        Ends the session of token, in every process sharing the database (within check_interval in the others).
+        """
+        match = TOKEN.match(token)
+        if match is None:
+            return
+        with self._lock:
+            self._cache.pop(match.group(1), None)
+        with ConnectionManager() as conn:
+            conn.cursor().execute('DELETE FROM Sessions WHERE TokenID = %s', match.group(1))
+            conn.commit()
+
+    def _remember(self, token_id: str, entry: tuple) -> None:
+        # Must hold self._lock
+        self._cache[token_id] = entry
+        self._cache.move_to_end(token_id)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+
+_sessions = None
+_sessions_lock = threading.Lock()
+
+
+def get_sessions() -> SessionStore:
+    """
+    Returns the process-wide session store, signing with SessionSecret (.env) and configured by SessionTTLHours,
+    SessionCacheSize and SessionCheckInterval. Without SessionSecret a random key is used, so tokens only resume
+    sessions in the process that issued them.
+    """
+    global _sessions
+    if _sessions is None:
+        with _sessions_lock:
+            if _sessions is None:
+                secret = config('SessionSecret', default='')
+                _sessions = SessionStore(secret.encode() if secret else secrets.token_bytes(32),
+                                         config('SessionTTLHours', default=168.0, cast=float) * 3600,
+                                         config('SessionCacheSize', default=10000, cast=int),
+                                         config('SessionCheckInterval', default=60.0, cast=float))
+    return _sessions
@@ -0,0 +1,186 @@
+import datetime
+import threading
+import time
+from collections import OrderedDict
+from contextlib import nullcontext
+from decouple import config
+from db.ConnectionManager import ConnectionManager
+
+
+class SlotCache:
+    """
+    In-process cache of the open (unreserved) slots per date, kept in least recently used order.
+    Writers in this process keep it exact: reserve removes the booked slot, cancel and upload_availability add
+    slots back. Writes made by other processes are only picked up once an entry is older than ttl seconds.
+    Functions added with add_hook() are told about every change, cached date or not.
+    """
+
+    OPEN_SLOTS = 'SELECT AV.AppointmentID, AV.CaregiverID ' \
+                 'FROM Availabilities AV LEFT JOIN Appointments AP ' \
+                 'ON AP.AppointmentID = AV.AppointmentID ' \
+                 'WHERE AP.AppointmentID is null AND AV.Date = %s'
+    # Open slots, and their number per date, over a range of dates
+    OPEN_SLOTS_BETWEEN = 'SELECT AV.Date, AV.AppointmentID, AV.CaregiverID FROM Availabilities AV ' \
+                         'WHERE AV.Date BETWEEN %s AND %s AND NOT EXISTS ' \
+                         '(SELECT 1 FROM Appointments AP WHERE AP.AppointmentID = AV.AppointmentID)'
+    OPEN_COUNTS = 'SELECT AV.Date, COUNT(*) FROM Availabilities AV ' \
+                  'WHERE AV.Date BETWEEN %s AND %s AND NOT EXISTS ' \
+                  '(SELECT 1 FROM Appointments AP WHERE AP.AppointmentID = AV.AppointmentID) ' \
+                  'GROUP BY AV.Date ORDER BY AV.Date'
+
+    def __init__(self, max_slots: int = 100000, ttl: float = 5.0) -> None:
+        """
+        @param max_slots: int, most slots held across all cached dates before the least recently used are evicted
+        @param ttl: float, seconds before a cached date is reloaded, 0 to keep entries until evicted (only safe when
+        this is the one process writing to the database)
+        """
+        self.max_slots = max_slots
+        self.ttl = ttl
+        self._dates = OrderedDict()  # date -> (loaded at, {AppointmentID: CaregiverID})
+        self._versions = {}          # date -> bumped on every change, so loads that raced a write are discarded
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hooks = []
+        self.hits = 0
+        self.misses = 0
+
+    def add_hook(self, hook) -> None:
+        """
+        @param hook: callable given (event, date, appointment_id, caregiver) for every change, event one of 'add',
+        'remove' (caregiver None) and 'invalidate' (date None for every date). Called with the cache locked.
+        """
+        self.hooks.append(hook)
+
+    def _notify(self, event: str, date, appointment_id=None, caregiver=None) -> None:
+        # Must hold self._lock
+        for hook in self.hooks:
+            hook(event, date, appointment_id, caregiver)
+
+    def get(self, date, conn=None) -> list:
+        """
+        Returns the open slots on date as (AppointmentID, CaregiverID) pairs sorted by caregiver.
+        @param date: datetime.date
+        @param conn: optional connection to load a missing date with, e.g. one the caller is holding
+        """
+        with self._lock:
+            entry = self._dates.get(date)
+            if entry is not None and (not self.ttl or time.monotonic() - entry[0] < self.ttl):
+                self._dates.move_to_end(date)
+                self.hits += 1
+                return self._sorted(entry[1])
+            self.misses += 1
+            version = self._versions.get(date, 0)
+        with ConnectionManager() if conn is None else nullcontext(conn) as conn:
+            cursor = conn.cursor()
+            cursor.execute(self.OPEN_SLOTS, date)
+            slots = {row[0]: row[1] for row in cursor.fetchall()}
+        with self._lock:
+            if self._versions.get(date, 0) == version:
+                self._store(date, slots)
+        return self._sorted(slots)
+
+    def counts_between(self, start, end) -> list:
+        """
+        Returns (date, number of open slots) for every date from start to end (inclusive) with at least one, in
+        date order. Counted by the database in one query, the cache is neither used nor filled.
+        """
+        with ConnectionManager() as conn:
+            cursor = conn.cursor()
+            cursor.execute(self.OPEN_COUNTS, (start, end))
+            return [(row[0], row[1]) for row in cursor.fetchall()]
+
+    def slots_between(self, start, end) -> dict:
+        """
+        Returns the open slots from start to end (inclusive) in one query, as date -> (AppointmentID, CaregiverID)
+        pairs sorted by caregiver, leaving out dates without any. Every date in the range is cached on the way.
+        """
+        dates = [start + datetime.timedelta(days=i) for i in range((end - start).days + 1)]
+        with self._lock:
+            versions = {d: self._versions.get(d, 0) for d in dates}
+        loaded = {d: {} for d in dates}
+        with ConnectionManager() as conn:
+            cursor = conn.cursor()
+            cursor.execute(self.OPEN_SLOTS_BETWEEN, (start, end))
+            for date, apt_id, caregiver in cursor.fetchall():
+                loaded[date][apt_id] = caregiver
+        with self._lock:
+            for d, slots in loaded.items():
+                if self._versions.get(d, 0) == versions[d]:
+                    self._store(d, slots)
+        return {d: self._sorted(slots) for d, slots in loaded.items() if slots}
+
+    @staticmethod
+    def _sorted(slots: dict) -> list:
+        return sorted(slots.items(), key=lambda slot: (slot[1], slot[0]))
+
+    def _store(self, date, slots: dict) -> None:
+        # Must hold self._lock
+        old = self._dates.pop(date, None)
+        if old is not None:
+            self._size -= len(old[1])
+        if len(slots) > self.max_slots:
+            return
+        self._dates[date] = (time.monotonic(), slots)
+        self._size += len(slots)
+        while self._size > self.max_slots:
+            _, (_, evicted) = self._dates.popitem(last=False)
+            self._size -= len(evicted)
+
+    def _changed(self, date) -> dict:
+        # Must hold self._lock. Returns the cached slots for date, or None if it is not cached
+        self._versions[date] = self._versions.get(date, 0) + 1
+        entry = self._dates.get(date)
+        return entry[1] if entry is not None else None
+
+    def add(self, date, appointment_id: str, caregiver: str) -> None:
+        """
+        Records that a slot on date became open (uploaded, or its appointment was cancelled).
+        """
+        with self._lock:
+            self._notify('add', date, appointment_id, caregiver)
+            slots = self._changed(date)
+            if slots is not None and appointment_id not in slots:
+                slots[appointment_id] = caregiver
+                self._size += 1
+                if self._size > self.max_slots:
+                    self._store(date, slots)
+
+    def remove(self, date, appointment_id: str) -> None:
+        """
+        Records that a slot on date was reserved.
+        """
+        with self._lock:
+            self._notify('remove', date, appointment_id)
+            slots = self._changed(date)
+            if slots is not None and slots.pop(appointment_id, None) is not None:
+                self._size -= 1
+
+    def invalidate(self, date=None) -> None:
+        """
+        Drops date from the cache, or every date if none is given.
+        """
+        with self._lock:
+            self._notify('invalidate', date)
+            dates = [date] if date is not None else list(self._dates)
+            for d in dates:
+                self._changed(d)
+                entry = self._dates.pop(d, None)
+                if entry is not None:
+                    self._size -= len(entry[1])
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_slot_cache() -> SlotCache:
+    """
+    Returns the process-wide slot cache, sized from SlotCacheMaxSlots and SlotCacheTTL in .env.
+    """
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = SlotCache(config('SlotCacheMaxSlots', default=100000, cast=int),
+                                   config('SlotCacheTTL', default=5.0, cast=float))
+    return _cache
@@ -0,0 +1,147 @@
+import hashlib
+import math
+import threading
+from contextlib import nullcontext
+from decouple import config
+from db.ConnectionManager import ConnectionManager
+
+
+class UsernameFilter:
+    """
+    In-process Bloom filter over the usernames of Patients or Caregivers, so account creation can tell a name is
+    definitely free without asking the database. Loaded from the table in one streamed query and kept current by
+    the creates made in this process; a name another process has taken since can still be reported free, which
+    the insert-if-absent that creates accounts catches.
+    Sized for twice the rows it was loaded with, and reloaded in the background once it holds more than that.
+    """
+
+    COUNT = 'SELECT COUNT(*) FROM {table}'
+    LOAD = 'SELECT Username FROM {table}'
+    FETCH_ROWS = 5000
+
+    def __init__(self, table: str, bits_per_name: int = 10, min_capacity: int = 1024) -> None:
+        """
+        @param table: str, either 'Patients' or 'Caregivers'
+        @param bits_per_name: int, filter bits per username; 10 gives about 1% false positives at capacity
+        @param min_capacity: int, fewest usernames the filter is sized for
+        """
+        if table != 'Caregivers' and table != 'Patients':
+            raise ValueError('Bad table input, expected Patients or Caregivers')
+        self.table = table
+        self.bits_per_name = bits_per_name
+        self.min_capacity = min_capacity
+        self.hashes = max(1, round(bits_per_name * math.log(2)))
+        self._bits = None      # bytearray, None until loaded
+        self._size = 0         # bits in self._bits
+        self._capacity = 0
+        self._count = 0        # names added since the filter was sized
+        self._pending = None   # names added while a load is running, None when there is none
+        self._lock = threading.Lock()
+
+    def _positions(self, username: str, size: int):
+        digest = hashlib.blake2b(username.encode(), digest_size=16).digest()
+        # Double hashing: k positions from two 64-bit halves
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % size for i in range(self.hashes)]
+
+    @staticmethod
+    def _set(bits: bytearray, positions) -> None:
+        for p in positions:
+            bits[p >> 3] |= 1 << (p & 7)
+
+    def load(self, conn=None) -> None:
+        """
+        (Re)builds the filter from the table. Runs at most once at a time; a call during a load returns at once.
+        @param conn: optional connection to read with, e.g. one the caller already holds; one is borrowed otherwise
+        """
+        with self._lock:
+            if self._pending is not None:
+                return
+            self._pending = []
+        try:
+            with ConnectionManager() if conn is None else nullcontext(conn) as conn:
+                cursor = conn.cursor()
+                cursor.execute(self.COUNT.format(table=self.table))
+                rows = cursor.fetchone()[0]
+                capacity = max(2 * rows, self.min_capacity)
+                size = capacity * self.bits_per_name
+                bits = bytearray((size + 7) // 8)
+                cursor.execute(self.LOAD.format(table=self.table))
+                while True:
+                    names = cursor.fetchmany(self.FETCH_ROWS)
+                    if not names:
+                        break
+                    for (username,) in names:
+                        self._set(bits, self._positions(username, size))
+        except BaseException:
+            with self._lock:
+                self._pending = None
+            raise
+        with self._lock:
+            # Names created while the table was read may have been missed by the query
+            for username in self._pending:
+                self._set(bits, self._positions(username, size))
+            self._count = rows + len(self._pending)
+            self._bits, self._size, self._capacity = bits, size, capacity
+            self._pending = None
+
+    def might_contain(self, username: str, conn=None) -> bool:
+        """
+        @param conn: optional connection to load the filter with if it is not loaded yet
+        @return: bool, False if username is definitely not taken, True if it may be (or the filter is still loading)
+        """
+        with self._lock:
+            bits, size, loading = self._bits, self._size, self._pending is not None
+        if bits is None:
+            if loading:
+                return True
+            self.load(conn)
+            with self._lock:
+                bits, size = self._bits, self._size
+            if bits is None:
+                # Another thread started loading first
+                return True
+        return all(bits[p >> 3] & (1 << (p & 7)) for p in self._positions(username, size))
+
+    def add(self, username: str) -> None:
+        """
+        Records a username created by this process.
+        """
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append(username)
+            if self._bits is None:
+                return
+            self._set(self._bits, self._positions(username, self._size))
+            self._count += 1
+            grow = self._count > self._capacity and self._pending is None
+        if grow:
+            # Past capacity false positives climb quickly, so resize from the table without holding up the caller
+            threading.Thread(target=self._reload, name=f'{self.table}-filter', daemon=True).start()
+
+    def _reload(self) -> None:
+        try:
+            self.load()
+        except Exception:
+            # Keeps answering from the old filter, and tries again on the next add
+            pass
+
+
+_filters = {}
+_filters_lock = threading.Lock()
+
+
+def get_usernames(table: str) -> UsernameFilter:
+    """
+    Returns the process-wide username filter of table ('Patients' or 'Caregivers'), with UsernameFilterBits
+    (.env) bits per name.
+    """
+    usernames = _filters.get(table)
+    if usernames is None:
+        with _filters_lock:
+            usernames = _filters.get(table)
+            if usernames is None:
+                usernames = UsernameFilter(table, config('UsernameFilterBits', default=10, cast=int))
+                _filters[table] = usernames
+    return usernames
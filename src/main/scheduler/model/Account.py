@@ -0,0 +1,59 @@
+import sys
+from contextlib import nullcontext
+sys.path.append("../db/*")
+from db.ConnectionManager import ConnectionManager  # noqa
+from model.AccountRow import AccountRow  # noqa
+
+
+class Account:
+    """
+    Class-level loaders shared by Patient and Caregiver, which name their table in TABLE and take
+    (username, password, salt, uhash, params) in their initializer. Many accounts are read in a few queries rather
+    than one get() round-trip each.
+    """
+    __slots__ = ()
+
+    TABLE = None
+    # Usernames per IN list of get_many; SQL Server allows at most 2100 parameters per statement
+    IN_CHUNK = 500
+    # Rows per fetch of iter_rows
+    FETCH_ROWS = 500
+
+    @classmethod
+    def get_many(cls, usernames, conn=None) -> dict:
+        """
+        Loads the accounts with the given usernames, one query per IN_CHUNK names. No password is checked, so the
+        accounts returned are not logged in.
+        @param conn: optional connection to use, e.g. one the caller already holds
+        @return: dict, username -> account, leaving out names with no account
+        """
+        names = sorted(set(usernames))
+        accounts = {}
+        if not names:
+            return accounts
+        with ConnectionManager() if conn is None else nullcontext(conn) as conn:
+            cursor = conn.cursor()
+            for i in range(0, len(names), cls.IN_CHUNK):
+                part = names[i:i + cls.IN_CHUNK]
+                placeholders = ', '.join(['%s'] * len(part))
+                cursor.execute(f'SELECT Username, Salt, Hash, HashParams FROM {cls.TABLE} '
+                               f'WHERE Username IN ({placeholders})', tuple(part))
+                for username, salt, uhash, params in cursor.fetchall():
+                    accounts[username] = cls(username, salt=salt, uhash=uhash, params=params)
+        return accounts
+
+    @classmethod
+    def iter_rows(cls):
+        """
+        Generates every account as a read-only AccountRow in username order, streamed FETCH_ROWS at a time. The
+        pooled connection is held until the generator is exhausted or closed.
+        """
+        with ConnectionManager() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f'SELECT Username, HashParams FROM {cls.TABLE} ORDER BY Username')
+            while True:
+                rows = cursor.fetchmany(cls.FETCH_ROWS)
+                if not rows:
+                    return
+                for row in rows:
+                    yield AccountRow(*row)
@@ -0,0 +1,10 @@
+from typing import NamedTuple
+
+
+class AccountRow(NamedTuple):
+    """
+    Read-only row of Patients or Caregivers for listing accounts: a plain tuple, so far smaller and cheaper to build
+    than a model object, and it carries no password material.
+    """
+    username: str
+    params: str
@@ -0,0 +1,145 @@
+import sys
+from contextlib import nullcontext
+sys.path.append("../db/*")
+from db.AssignmentPolicy import get_policy  # noqa
+from db.Backend import get_backend, RESERVED, NO_DOSES, NO_SLOTS  # noqa
+from db.ConnectionManager import ConnectionManager  # noqa
+from db.SlotCache import get_slot_cache  # noqa
+from db.InventoryCache import get_inventory  # noqa
+
+
+"""
+Implementation for appointment representation
+"""
+
+
+class Appointment:
+
+    # Outcomes of reserve()
+    RESERVED = RESERVED
+    NO_DOSES = NO_DOSES
+    NO_SLOTS = NO_SLOTS
+
+    # Appointments of a patient or a caregiver in (Date, AppointmentID) order, the key list_for() pages on
+    LIST = 'SELECT AP.AppointmentID, AP.VaccineType, AV.Date, AV.CaregiverID, AP.PatientID ' \
+           'FROM Appointments AP JOIN Availabilities AV ON AV.AppointmentID = AP.AppointmentID WHERE '
+    BY_PATIENT = 'AP.PatientID = %s'
+    BY_CAREGIVER = 'AV.CaregiverID = %s'
+    AFTER = '(AV.Date > (SELECT Date FROM Availabilities WHERE AppointmentID = %s) OR ' \
+            '(AV.Date = (SELECT Date FROM Availabilities WHERE AppointmentID = %s) AND AP.AppointmentID > %s))'
+    # A caregiver has one slot per date, so their pages can walk the UNIQUE(CaregiverID, Date) index without a sort
+    CAREGIVER_AFTER = 'AV.Date > (SELECT Date FROM Availabilities WHERE AppointmentID = %s)'
+    # cancel() puts the dose back with a relative update, so concurrent changes to the inventory are never lost
+    VACCINE_OF = 'SELECT VaccineType FROM Appointments WHERE AppointmentID = %s'
+    RESTORE_DOSE = 'UPDATE Vaccines SET Doses = Doses + 1, Version = Version + 1 WHERE Name = %s'
+    DELETE = 'DELETE FROM Appointments WHERE AppointmentID = %s'
+    # Rows fetched from the cursor at a time
+    FETCH_ROWS = 500
+
+    def __init__(self, appointment_id: str, vaccine_name: str, patient: str, caregiver: str = None,
+                 date=None) -> None:
+        self.appointment_id = appointment_id
+        self.vaccine_name = vaccine_name
+        self.patient = patient
+        self.caregiver = caregiver
+        self.date = date
+
+    @staticmethod
+    def reserve(date, vaccine_name: str, patient: str, conn=None) -> tuple:
+        """
+        Books an open slot on date, with the caregiver chosen by the AssignmentPolicy (by default the first by name),
+        and one dose of vaccine_name for patient, as a single transaction. Concurrent reservations never oversell
+        doses or double-book a slot.
+        @param date: datetime.date of the appointment
+        @param conn: optional connection to use; anything already done in its open transaction is committed with
+        the reservation, or rolled back if nothing is reserved
+        @return: tuple (status, Appointment or None), status one of RESERVED, NO_DOSES, NO_SLOTS
+        """
+        inventory = get_inventory()
+        with inventory.write() as changed, ConnectionManager() if conn is None else nullcontext(conn) as conn:
+            status, apt_id, caregiver = get_policy().reserve(conn, date, vaccine_name, patient)
+            if status == RESERVED:
+                changed(vaccine_name, -1)
+        if status == NO_DOSES:
+            # The cache may have shown doses another process has since used up
+            inventory.invalidate()
+        if status == NO_SLOTS:
+            # The cache may have thought otherwise if another process took the last slot
+            get_slot_cache().invalidate(date)
+        if status != RESERVED:
+            return status, None
+        get_slot_cache().remove(date, apt_id)
+        return status, Appointment(apt_id, vaccine_name, patient, caregiver, date)
+
+    @staticmethod
+    def cancel(appointment_id: str, date, caregiver: str, conn=None) -> bool:
+        """
+        Cancels an appointment as a single transaction: its dose goes back to the inventory and its slot (of caregiver
+        on date) is open again. The caches are only updated once the transaction has committed.
+        @param conn: optional connection to use, e.g. the one the appointment was looked up on
+        @return: bool, False if there is no such appointment
+        """
+        with get_inventory().write() as changed, ConnectionManager() if conn is None else nullcontext(conn) as conn:
+            cursor = conn.cursor()
+            cursor.execute(Appointment.VACCINE_OF, appointment_id)
+            row = cursor.fetchone()
+            if row is None:
+                return False
+            vaccine_name = row[0]
+            if vaccine_name is not None:
+                cursor.execute(Appointment.RESTORE_DOSE, vaccine_name)
+            cursor.execute(Appointment.DELETE, appointment_id)
+            conn.commit()
+            if vaccine_name is not None:
+                changed(vaccine_name, 1)
+        get_slot_cache().add(date, appointment_id, caregiver)
+        return True
+
+    @staticmethod
+    def list_for(patient: str = None, caregiver: str = None, start=None, end=None, after: str = None,
+                 limit: int = None):
+        """
+        Generates the appointments of patient or of caregiver in date order, streamed from the cursor FETCH_ROWS
+        at a time so memory stays flat however many there are. The pooled connection is held until the generator
+        is exhausted or closed.
+        @param start, end: optional datetime.date bounds (inclusive)
+        @param after: optional AppointmentID, only appointments after it in date order (the next page)
+        @param limit: optional int, most appointments generated
+        """
+        conditions = [Appointment.BY_PATIENT if patient is not None else Appointment.BY_CAREGIVER]
+        params = [patient if patient is not None else caregiver]
+        if start is not None:
+            conditions.append('AV.Date >= %s')
+            params.append(start)
+        if end is not None:
+            conditions.append('AV.Date <= %s')
+            params.append(end)
+        if after is not None and patient is not None:
+            conditions.append(Appointment.AFTER)
+            params.extend((after, after, after))
+        elif after is not None:
+            conditions.append(Appointment.CAREGIVER_AFTER)
+            params.append(after)
+        order = ' ORDER BY AV.Date, AP.AppointmentID' if patient is not None else ' ORDER BY AV.Date'
+        query = Appointment.LIST + ' AND '.join(conditions) + order
+        if limit is not None:
+            query = get_backend().limit(query, limit)
+        with ConnectionManager() as conn:
+            cursor = conn.cursor()
+            cursor.execute(query, tuple(params))
+            while True:
+                rows = cursor.fetchmany(Appointment.FETCH_ROWS)
+                if not rows:
+                    return
+                for apt_id, vaccine, date, caregiver_id, patient_id in rows:
+                    yield Appointment(apt_id, vaccine, patient_id, caregiver_id, date)
+
+    def get_appointment_id(self) -> str:
+        return self.appointment_id
+
+    def get_caregiver(self) -> str:
+        return self.caregiver
+
+    def __str__(self):
+        return f"(Appointment ID: {self.appointment_id}, Vaccine: {self.vaccine_name}, Patient: {self.patient}, " \
+               f"Caregiver: {self.caregiver}, Date: {self.date})"
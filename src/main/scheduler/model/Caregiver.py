@@ -1,46 +1,65 @@
-import pymssql
-import uuid
+import datetime
 import sys
 sys.path.append("../util/*")
 sys.path.append("../db/*")
-from util.Util import Util # noqa
-from db.ConnectionManager import ConnectionManager # noqa
+from util.PasswordHasher import get_hasher # noqa
+from db.ConnectionManager import ConnectionManager, DBError, DBIntegrityError # noqa
+from db.SlotCache import get_slot_cache # noqa
+from util.CompactId import get_ids # noqa
+from db.UsernameFilter import get_usernames # noqa
+from model.Account import Account # noqa
 
 
-class Caregiver:
-    def __init__(self, username, password=None, salt=None, uhash=None):
+# Rows per multi-row INSERT; SQL Server allows at most 2100 parameters per statement
+INSERT_CHUNK = 500
+
+
+class Caregiver(Account):
+    # No per-instance dict, so Account.get_many can hold many caregivers cheaply
+    __slots__ = ('username', 'password', 'salt', 'hash', 'params')
+
+    TABLE = 'Caregivers'
+
+    def __init__(self, username, password=None, salt=None, uhash=None, params=None):
         self.username = username
         self.password = password
         self.salt = salt
         self.hash = uhash
+        self.params = params
 
     # getters
     def get(self):
-        cm = ConnectionManager()
-        conn = cm.create_connection()
-        cursor = conn.cursor(as_dict=True)
+        get_caregiver_details = "SELECT Salt, Hash, HashParams FROM Caregivers WHERE Username = %s"
+        # Fetch the row and hand the connection back before running the slow hash
+        with ConnectionManager() as conn:
+            cursor = conn.cursor(as_dict=True)
+            cursor.execute(get_caregiver_details, self.username)
+            row = cursor.fetchone()
+        if row is None:
+            return None
+        hasher = get_hasher()
+        if not hasher.verify(self.password, row['Salt'], row['Hash'], row['HashParams']):
+            # print("Incorrect password")
+            return None
+        self.salt = row['Salt']
+        self.hash = row['Hash']
+        self.params = row['HashParams']
+        if hasher.needs_rehash(self.params):
+            self._rehash(hasher)
+        return self
 
-        get_caregiver_details = "SELECT Salt, Hash FROM Caregivers WHERE Username = %s"
+    # Upgrade the stored hash to the current parameters, unless the password was changed in the meantime
+    def _rehash(self, hasher):
+        salt, uhash, params = hasher.hash(self.password)
+        update_hash = "UPDATE Caregivers SET Salt = %s, Hash = %s, HashParams = %s WHERE Username = %s AND Hash = %s"
         try:
-            cursor.execute(get_caregiver_details, self.username)
-            for row in cursor:
-                curr_salt = row['Salt']
-                curr_hash = row['Hash']
-                calculated_hash = Util.generate_hash(self.password, curr_salt)
-                if not curr_hash == calculated_hash:
-                    # print("Incorrect password")
-                    cm.close_connection()
-                    return None
-                else:
-                    self.salt = curr_salt
-                    self.hash = calculated_hash
-                    cm.close_connection()
-                    return self
-        except pymssql.Error as e:
-            raise e
-        finally:
-            cm.close_connection()
-        return None
+            with ConnectionManager() as conn:
+                conn.cursor().execute(update_hash, (salt, uhash, params, self.username, self.hash))
+                conn.commit()
+        except DBError:
+            # The old hash still works, so try again on the next login
+            return
+        self.salt, self.hash, self.params = salt, uhash, params
 
     def get_username(self):
         return self.username
@@ -51,35 +70,71 @@ class Caregiver:
     def get_hash(self):
         return self.hash
 
-    def save_to_db(self):
-        cm = ConnectionManager()
-        conn = cm.create_connection()
-        cursor = conn.cursor()
+    def get_params(self):
+        return self.params
 
-        add_caregivers = "INSERT INTO Caregivers VALUES (%s, %s, %s)"
+    # Insert the caregiver in one statement that only inserts if the username is free.
+    # Returns False if the username is already taken
+    def save_to_db(self):
+        add_caregivers = "INSERT INTO Caregivers (Username, Salt, Hash, HashParams) SELECT %s, %s, %s, %s " \
+                         "WHERE NOT EXISTS (SELECT 1 FROM Caregivers WHERE Username = %s)"
         try:
-            cursor.execute(add_caregivers, (self.username, self.salt, self.hash))
-            # you must call commit() to persist your data if you don't set autocommit to True
-            conn.commit()
-        except pymssql.Error:
-            raise
-        finally:
-            cm.close_connection()
+            with ConnectionManager() as conn:
+                cursor = conn.cursor()
+                cursor.execute(add_caregivers, (self.username, self.salt, self.hash, self.params, self.username))
+                created = cursor.rowcount == 1
+                # you must call commit() to persist your data if you don't set autocommit to True
+                conn.commit()
+        except DBIntegrityError:
+            # Registered by someone else at the same moment
+            return False
+        if created:
+            get_usernames('Caregivers').add(self.username)
+        return created
 
     # Insert availability with parameter date d
     def upload_availability(self, d):
-        cm = ConnectionManager()
-        conn = cm.create_connection()
-        cursor = conn.cursor()
         # Generate AppointmentID
-        appt_id: str = str(uuid.uuid4())
-        add_availability = "INSERT INTO Availabilities VALUES (%s , %s, %s)"
-        try:
+        appt_id: str = get_ids().next()
+        add_availability = "INSERT INTO Availabilities (CaregiverID, Date, AppointmentID) VALUES (%s , %s, %s)"
+        with ConnectionManager() as conn:
+            cursor = conn.cursor()
             cursor.execute(add_availability, (self.username, d, appt_id))
             # you must call commit() to persist your data if you don't set autocommit to True
             conn.commit()
-        except pymssql.Error:
-            # print("Error occurred when updating caregiver availability")
-            raise
-        finally:
-            cm.close_connection()
+        get_slot_cache().add(d.date() if isinstance(d, datetime.datetime) else d, appt_id, self.username)
+
+    # Insert availability for every date in dates as one transaction, skipping dates already scheduled.
+    # Returns (inserted, skipped)
+    def upload_availability_bulk(self, dates):
+        dates = sorted(set(dates))
+        if not dates:
+            return 0, 0
+        get_scheduled = "SELECT Date FROM Availabilities WHERE CaregiverID = %s AND Date BETWEEN %s AND %s"
+        with ConnectionManager() as conn:
+            cursor = conn.cursor()
+            # A concurrent upload for the same caregiver can still win a date between the read and the insert,
+            # in which case the whole batch is rolled back and retried once against the fresh schedule.
+            for attempt in range(2):
+                cursor.execute(get_scheduled, (self.username, dates[0], dates[-1]))
+                scheduled = {row[0] for row in cursor.fetchall()}
+                new_dates = [d for d in dates if d not in scheduled]
+                appt_ids = get_ids().next_many(len(new_dates))
+                try:
+                    for i in range(0, len(new_dates), INSERT_CHUNK):
+                        params = []
+                        for d, appt_id in zip(new_dates[i:i + INSERT_CHUNK], appt_ids[i:i + INSERT_CHUNK]):
+                            params.extend((self.username, d, appt_id))
+                        rows = ", ".join(["(%s, %s, %s)"] * (len(params) // 3))
+                        cursor.execute("INSERT INTO Availabilities (CaregiverID, Date, AppointmentID) VALUES " + rows,
+                                       tuple(params))
+                    conn.commit()
+                    break
+                except DBIntegrityError:
+                    conn.rollback()
+                    if attempt == 1:
+                        raise
+        cache = get_slot_cache()
+        for d, appt_id in zip(new_dates, appt_ids):
+            cache.add(d, appt_id, self.username)
+        return len(new_dates), len(dates) - len(new_dates)
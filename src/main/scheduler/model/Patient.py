@@ -1,10 +1,11 @@
-import pymssql
 from typing import Optional
 import sys
 sys.path.append("../util/*")
 sys.path.append("../db/*")
-from util.Util import Util # noqa
-from db.ConnectionManager import ConnectionManager  # noqa
+from util.PasswordHasher import get_hasher # noqa
+from db.ConnectionManager import ConnectionManager, DBError, DBIntegrityError  # noqa
+from db.UsernameFilter import get_usernames  # noqa
+from model.Account import Account  # noqa
 
 
 """
@@ -12,45 +13,60 @@ Implementation for patient representation
 """
 
 
-class Patient:
+class Patient(Account):
+    # No per-instance dict, so Account.get_many can hold many patients cheaply
+    __slots__ = ('_uname', '_pw', '_salt', '_hash', '_params')
 
-    def __init__(self, username: str, password: str = None, salt: str = None, uhash: str = None) -> None:
+    TABLE = 'Patients'
+
+    def __init__(self, username: str, password: str = None, salt: str = None, uhash: str = None,
+                 params: str = None) -> None:
         """
-        Patient Initializer, stores username, password, salt and hash in obj.
+        Patient Initializer, stores username, password, salt, hash and hash parameters in obj.
         """
         self._uname: str = username
         self._pw: str = password
         self._salt: str = salt
         self._hash: str = uhash
+        self._params: str = params
 
     def get(self) -> Optional[object]:
         """
         Accesses DB, ensures that provided salt and hash are valid (Correct PW)
         """
-        cm = ConnectionManager()
-        conn = cm.create_connection()
-        cursor = conn.cursor(as_dict=True)
-        get_patient_details = "SELECT Salt, Hash FROM Patients WHERE Username = %s"
-        try:
+        get_patient_details = "SELECT Salt, Hash, HashParams FROM Patients WHERE Username = %s"
+        # Return the connection to the pool before running the slow hash
+        with ConnectionManager() as conn:
+            cursor = conn.cursor(as_dict=True)
             cursor.execute(get_patient_details, self._uname)
-            for row in cursor:
-                curr_salt = row['Salt']
-                curr_hash = row['Hash']
-                calculated_hash = Util.generate_hash(self._pw, curr_salt)
-                if not calculated_hash == curr_hash:
-                    # Incorrect PW entered by user
-                    cm.close_connection()
-                    return None
-                else:
-                    self._salt = curr_salt
-                    self._hash = calculated_hash
-                    cm.close_connection()
-                    return self
-        except pymssql.Error as e:
-            raise e
-        finally:
-            cm.close_connection()
-        return None
+            row = cursor.fetchone()
+        if row is None:
+            return None
+        hasher = get_hasher()
+        if not hasher.verify(self._pw, row['Salt'], row['Hash'], row['HashParams']):
+            # Incorrect PW entered by user
+            return None
+        self._salt = row['Salt']
+        self._hash = row['Hash']
+        self._params = row['HashParams']
+        if hasher.needs_rehash(self._params):
+            self._rehash(hasher)
+        return self
+
+    def _rehash(self, hasher) -> None:
+        """
+        Upgrades the stored hash to the current parameters, unless the password was changed in the meantime.
+        """
+        salt, uhash, params = hasher.hash(self._pw)
+        update_hash = "UPDATE Patients SET Salt = %s, Hash = %s, HashParams = %s WHERE Username = %s AND Hash = %s"
+        try:
+            with ConnectionManager() as conn:
+                conn.cursor().execute(update_hash, (salt, uhash, params, self._uname, self._hash))
+                conn.commit()
+        except DBError:
+            # The old hash still works, so try again on the next login
+            return
+        self._salt, self._hash, self._params = salt, uhash, params
 
     """
     Following functions are helpers for returning private fields.
@@ -64,21 +80,29 @@ class Patient:
     def get_hash(self) -> str:
         return self._hash
 
-    def save_to_db(self) -> None:
+    def get_params(self) -> str:
+        return self._params
+
+    def save_to_db(self) -> bool:
         """
-        Upload changed information (USERNAME, SALT, HASH) into database
+        Upload changed information (USERNAME, SALT, HASH, HASHPARAMS) into database, in one statement that only
+        inserts if the username is free.
+        @return: bool, False if the username is already taken
         """
-        cm = ConnectionManager()
-        conn = cm.create_connection()
-        curr = conn.cursor()
-        add_patient = "INSERT INTO Patients VALUES (%s, %s, %s)"
+        add_patient = "INSERT INTO Patients (Username, Salt, Hash, HashParams) SELECT %s, %s, %s, %s " \
+                      "WHERE NOT EXISTS (SELECT 1 FROM Patients WHERE Username = %s)"
         try:
-            curr.execute(add_patient, (self._uname, self._salt, self._hash))
-            conn.commit()
-        except pymssql.Error as e:
-            raise e
-        finally:
-            cm.close_connection()
+            with ConnectionManager() as conn:
+                curr = conn.cursor()
+                curr.execute(add_patient, (self._uname, self._salt, self._hash, self._params, self._uname))
+                created = curr.rowcount == 1
+                conn.commit()
+        except DBIntegrityError:
+            # Registered by someone else at the same moment
+            return False
+        if created:
+            get_usernames('Patients').add(self._uname)
+        return created
 
     def add_availability(self):
         pass
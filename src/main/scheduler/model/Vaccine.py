@@ -1,32 +1,29 @@
 import sys
 sys.path.append("../db/*")
 from db.ConnectionManager import ConnectionManager
-import pymssql
+from db.InventoryCache import get_inventory
+from model.VaccineRow import VaccineRow
 
 
 class Vaccine:
+    __slots__ = ('vaccine_name', 'available_doses')
+
     def __init__(self, vaccine_name, available_doses=None):
         self.vaccine_name = vaccine_name
         self.available_doses = available_doses
 
-    # getters
+    # getters, served from the write-through inventory cache
     def get(self):
-        cm = ConnectionManager()
-        conn = cm.create_connection()
-        cursor = conn.cursor()
+        doses = get_inventory().get_doses(self.vaccine_name)
+        if doses is None:
+            return None
+        self.available_doses = doses
+        return self
 
-        get_vaccine = f'SELECT Name, Doses FROM Vaccines WHERE Name = %s'
-        try:
-            cursor.execute(get_vaccine, self.vaccine_name)
-            for row in cursor:
-                self.available_doses = row[1]
-                return self
-        except pymssql.Error:
-            # print("Error occurred when getting Vaccine")
-            raise
-        finally:
-            cm.close_connection()
-        return None
+    # VaccineRow (name, doses) of every vaccine, sorted by name
+    @staticmethod
+    def get_all():
+        return [VaccineRow(name, doses) for name, doses in get_inventory().all()]
 
     def get_vaccine_name(self):
         return self.vaccine_name
@@ -38,62 +35,41 @@ class Vaccine:
         if self.available_doses is None or self.available_doses <= 0:
             raise ValueError("Argument cannot be negative!")
 
-        cm = ConnectionManager()
-        conn = cm.create_connection()
-        cursor = conn.cursor()
-
-        add_doses = "INSERT INTO VACCINES VALUES (%s, %d)"
-        try:
+        add_doses = "INSERT INTO Vaccines (Name, Doses, Version) VALUES (%s, %d, 0)"
+        with get_inventory().write() as changed, ConnectionManager() as conn:
+            cursor = conn.cursor()
             cursor.execute(add_doses, (self.vaccine_name, self.available_doses))
             # you must call commit() to persist your data if you don't set autocommit to True
             conn.commit()
-        except pymssql.Error:
-            # print("Error occurred when insert Vaccines")
-            raise
-        finally:
-            cm.close_connection()
+            changed(self.vaccine_name, self.available_doses)
 
-    # Increment the available doses
+    # Increment the available doses. Relative updates, so concurrent changes are never lost
     def increase_available_doses(self, num):
         if num <= 0:
             raise ValueError("Argument cannot be negative!")
-        self.available_doses += num
 
-        cm = ConnectionManager()
-        conn = cm.create_connection()
-        cursor = conn.cursor()
-
-        update_vaccine_availability = "UPDATE vaccines SET Doses = %d WHERE name = %s"
-        try:
-            cursor.execute(update_vaccine_availability, (self.available_doses, self.vaccine_name))
+        update_vaccine_availability = "UPDATE vaccines SET Doses = Doses + %d, Version = Version + 1 WHERE name = %s"
+        with get_inventory().write() as changed, ConnectionManager() as conn:
+            cursor = conn.cursor()
+            cursor.execute(update_vaccine_availability, (num, self.vaccine_name))
             # you must call commit() to persist your data if you don't set autocommit to True
             conn.commit()
-        except pymssql.Error:
-            # print("Error occurred when updating vaccine availability")
-            raise
-        finally:
-            cm.close_connection()
+            changed(self.vaccine_name, num)
+        self.available_doses += num
 
-    # Decrement the available doses
+    # Decrement the available doses, failing if fewer than num are left
     def decrease_available_doses(self, num):
-        if self.available_doses - num < 0:
-            ValueError("Not enough available doses!")
-        self.available_doses -= num
-
-        cm = ConnectionManager()
-        conn = cm.create_connection()
-        cursor = conn.cursor()
-
-        update_vaccine_availability = "UPDATE vaccines SET Doses = %d WHERE name = %s"
-        try:
-            cursor.execute(update_vaccine_availability, (self.available_doses, self.vaccine_name))
+        update_vaccine_availability = "UPDATE vaccines SET Doses = Doses - %d, Version = Version + 1 " \
+                                      "WHERE name = %s AND Doses >= %d"
+        with get_inventory().write() as changed, ConnectionManager() as conn:
+            cursor = conn.cursor()
+            cursor.execute(update_vaccine_availability, (num, self.vaccine_name, num))
+            if cursor.rowcount == 0:
+                raise ValueError("Not enough available doses!")
             # you must call commit() to persist your data if you don't set autocommit to True
             conn.commit()
-        except pymssql.Error:
-            # print("Error occurred when updating vaccine availability")
-            raise
-        finally:
-            cm.close_connection()
+            changed(self.vaccine_name, -num)
+        self.available_doses -= num
 
     def __str__(self):
         return f"(Vaccine Name: {self.vaccine_name}, Available Doses: {self.available_doses})"
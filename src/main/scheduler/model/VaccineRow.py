@@ -0,0 +1,9 @@
+from typing import NamedTuple
+
+
+class VaccineRow(NamedTuple):
+    """
+    Read-only (name, doses) row of Vaccines, as listed by Vaccine.get_all.
+    """
+    name: str
+    doses: int
@@ -0,0 +1,86 @@
+import datetime
+import sys
+sys.path.append("../db/*")
+from db.ConnectionManager import ConnectionManager  # noqa
+
+
+"""
+Implementation for waitlist entry representation
+"""
+
+
+class Waitlist:
+    """
+    A patient waiting for an appointment with vaccine_name on any date from start to end (inclusive).
+    A patient has at most one entry per vaccine; entries are served oldest first by the WaitlistMatcher.
+    """
+
+    WAITING = 'SELECT PatientID, VaccineType, StartDate, EndDate, CreatedAt FROM Waitlist ' \
+              'WHERE EndDate >= %s AND StartDate <= %s'
+    FOR_PATIENT = 'SELECT VaccineType, StartDate, EndDate, CreatedAt FROM Waitlist WHERE PatientID = %s ' \
+                  'ORDER BY VaccineType'
+    REMOVE = 'DELETE FROM Waitlist WHERE PatientID = %s AND VaccineType = %s'
+
+    def __init__(self, patient: str, vaccine_name: str, start, end, created=None) -> None:
+        self.patient = patient
+        self.vaccine_name = vaccine_name
+        self.start = start
+        self.end = end
+        self.created = created
+
+    def save_to_db(self) -> None:
+        """
+        Adds the entry, replacing the patient's earlier one for the same vaccine (which gives up its place).
+        """
+        self.created = datetime.datetime.now()
+        with ConnectionManager() as conn:
+            cursor = conn.cursor()
+            cursor.execute(self.REMOVE, (self.patient, self.vaccine_name))
+            cursor.execute('INSERT INTO Waitlist (PatientID, VaccineType, StartDate, EndDate, CreatedAt) '
+                           'VALUES (%s, %s, %s, %s, %s)',
+                           (self.patient, self.vaccine_name, self.start, self.end, self.created))
+            conn.commit()
+
+    def claim(self, conn) -> bool:
+        """
+        Deletes the entry in the open transaction of conn, before booking it.
+        @return: bool, False if the entry is gone (the patient left the waitlist, or another process booked it)
+        """
+        cursor = conn.cursor()
+        cursor.execute(self.REMOVE, (self.patient, self.vaccine_name))
+        return cursor.rowcount > 0
+
+    @staticmethod
+    def remove(patient: str, vaccine_name: str) -> bool:
+        """
+        @return: bool, False if the patient was not waiting for vaccine_name
+        """
+        with ConnectionManager() as conn:
+            cursor = conn.cursor()
+            cursor.execute(Waitlist.REMOVE, (patient, vaccine_name))
+            removed = cursor.rowcount > 0
+            conn.commit()
+        return removed
+
+    @staticmethod
+    def get_for_patient(patient: str) -> list:
+        with ConnectionManager() as conn:
+            cursor = conn.cursor()
+            cursor.execute(Waitlist.FOR_PATIENT, patient)
+            return [Waitlist(patient, *row) for row in cursor.fetchall()]
+
+    @staticmethod
+    def waiting(start, end, vaccine_name: str = None) -> list:
+        """
+        Returns the entries whose window overlaps start to end, optionally only those for vaccine_name.
+        """
+        query, params = Waitlist.WAITING, (start, end)
+        if vaccine_name is not None:
+            query, params = query + ' AND VaccineType = %s', params + (vaccine_name,)
+        with ConnectionManager() as conn:
+            cursor = conn.cursor()
+            cursor.execute(query, params)
+            return [Waitlist(*row) for row in cursor.fetchall()]
+
+    def __str__(self):
+        return f"{self.vaccine_name} between {self.start} and {self.end}"
@@ -0,0 +1,138 @@
+import csv
+import os
+import time
+from util.Util import Util
+from util.PasswordHasher import get_hasher
+from db.ConnectionManager import ConnectionManager, DBIntegrityError
+from db.UsernameFilter import get_usernames
+from model.Caregiver import Caregiver
+from model.Patient import Patient
+
+
+def _hash_account(account):
+    # Runs in a worker process
+    username, password, params = account
+    salt = Util.generate_salt()
+    return username, salt, Util.generate_hash(password, salt, params), params
+
+
+def _chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class AccountImport:
+    """
+    Streams username/password rows into Patients or Caregivers.
+    Rows are read in chunks: each chunk is checked for existing usernames with Account.get_many (only for names the
+    username filter does not rule out), hashed across a process pool, and inserted in one transaction while the
+    next chunk is hashing.
+    Usernames and passwords are lowercased, matching what the interactive login will compare against.
+    """
+
+    # Rows per multi-row INSERT; SQL Server allows at most 2100 parameters per statement
+    STATEMENT_ROWS = 500
+
+    def __init__(self, table: str, workers: int = None, chunk_size: int = 2000) -> None:
+        """
+        @param table: str, either 'Patients' or 'Caregivers'
+        @param workers: int, hashing processes, defaults to one per core
+        @param chunk_size: int, rows read, hashed and committed together
+        """
+        if table != 'Caregivers' and table != 'Patients':
+            raise ValueError('Bad table input, expected Patients or Caregivers')
+        self.table = table
+        self.account = Patient if table == 'Patients' else Caregiver
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        # Hash with the same parameters as interactive account creation
+        self.params = get_hasher().params
+        self.stats = {'read': 0, 'created': 0, 'existing': 0, 'invalid': 0, 'seconds': 0.0, 'rate': 0.0}
+
+    def _accounts(self, lines):
+        # Yields valid (username, password, params) tuples, skipping an optional header and duplicate usernames
+        seen = set()
+        for i, row in enumerate(csv.reader(lines)):
+            if i == 0 and [c.strip().lower() for c in row] == ['username', 'password']:
+                continue
+            self.stats['read'] += 1
+            if len(row) != 2 or not row[0].strip() or not row[1]:
+                self.stats['invalid'] += 1
+                continue
+            username = row[0].strip().lower()
+            if username in seen:
+                self.stats['existing'] += 1
+                continue
+            seen.add(username)
+            yield username, row[1].lower(), self.params
+
+    def _new_accounts(self, conn, chunk) -> list:
+        usernames = get_usernames(self.table)
+        maybe = [account[0] for account in chunk if usernames.might_contain(account[0], conn)]
+        existing = self.account.get_many(maybe, conn)
+        self.stats['existing'] += len(existing)
+        return [account for account in chunk if account[0] not in existing]
+
+    def _insert(self, conn, hashed) -> None:
+        cursor = conn.cursor()
+        usernames = get_usernames(self.table)
+        rows = list(hashed)
+        try:
+            for part in _chunks(rows, self.STATEMENT_ROWS):
+                values = ', '.join(['(%s, %s, %s, %s)'] * len(part))
+                cursor.execute(f'INSERT INTO {self.table} (Username, Salt, Hash, HashParams) VALUES {values}',
+                               tuple(v for row in part for v in row))
+            conn.commit()
+            self.stats['created'] += len(rows)
+            for row in rows:
+                usernames.add(row[0])
+        except DBIntegrityError:
+            # Someone registered one of these names since the existence check; fall back to row by row
+            conn.rollback()
+            for row in rows:
+                try:
+                    cursor.execute(f'INSERT INTO {self.table} (Username, Salt, Hash, HashParams) '
+                                   f'VALUES (%s, %s, %s, %s)', row)
+                    conn.commit()
+                    self.stats['created'] += 1
+                    usernames.add(row[0])
+                except DBIntegrityError:
+                    conn.rollback()
+                    self.stats['existing'] += 1
+
+    def run(self, lines, progress=None) -> dict:
+        """
+        Imports every account in lines.
+        @param lines: iterable of CSV lines, e.g. an open file
+        @param progress: optional callable, given the stats dict after each committed chunk
+        @return: dict with read, created, existing, invalid counts, seconds elapsed and rate (accounts/second)
+        """
+        # multiprocessing is slow to import, so leave it out of the scheduler's startup
+        from concurrent.futures import ProcessPoolExecutor
+        started = time.perf_counter()
+        with ConnectionManager() as conn, ProcessPoolExecutor(max_workers=self.workers) as pool:
+            pending = None
+            for chunk in _chunks(self._accounts(lines), self.chunk_size):
+                fresh = self._new_accounts(conn, chunk)
+                hashed = pool.map(_hash_account, fresh, chunksize=max(1, len(fresh) // (self.workers * 4)))
+                # Insert the previous chunk while this one hashes
+                if pending is not None:
+                    self._insert(conn, pending)
+                    self._report(started, progress)
+                pending = hashed
+            if pending is not None:
+                self._insert(conn, pending)
+        self._report(started, None)
+        return self.stats
+
+    def _report(self, started, progress) -> None:
+        self.stats['seconds'] = time.perf_counter() - started
+        self.stats['rate'] = self.stats['created'] / self.stats['seconds'] if self.stats['seconds'] else 0.0
+        if progress is not None:
+            progress(self.stats)
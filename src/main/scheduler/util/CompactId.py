@@ -0,0 +1,88 @@
+import os
+import threading
+import time
+
+
+# Crockford's base32 in lower case (commands are lowercased before they are parsed), in ASCII order so that the
+# text of two ids sorts the same as their numbers
+ALPHABET = '0123456789abcdefghjkmnpqrstvwxyz'
+LENGTH = 16  # 80 bits
+
+
+class CompactId:
+    """
+    Time-ordered 16-character identifiers: 48 bits of milliseconds since the epoch, 16 random bits picked per
+    process and a 16-bit counter, written in base32. Ids made later sort later, so new keys are appended at the
+    end of an index instead of landing on random pages as UUIDs do, and they are less than half a UUID's length.
+    Thread-safe; ids from one process are strictly increasing.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._reset()
+        if hasattr(os, 'register_at_fork'):
+            # A forked child must not hand out the same ids as its parent
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self) -> None:
+        self._node = int.from_bytes(os.urandom(2), 'big')
+        self._ms = 0
+        self._counter = 0
+
+    def _next(self) -> int:
+        # Must hold self._lock
+        now = time.time_ns() // 1_000_000
+        if now > self._ms:
+            self._ms, self._counter = now, 0
+        elif self._counter == 0xFFFF:
+            # More than 65536 ids in a millisecond, or the clock went back: borrow from the next millisecond
+            self._ms, self._counter = self._ms + 1, 0
+        else:
+            self._counter += 1
+        return self._ms << 32 | self._node << 16 | self._counter
+
+    def next(self) -> str:
+        with self._lock:
+            return encode(self._next())
+
+    def next_many(self, n: int) -> list:
+        """
+        Returns n increasing ids, taking the lock once.
+        """
+        with self._lock:
+            values = [self._next() for _ in range(n)]
+        return [encode(value) for value in values]
+
+
+def encode(value: int) -> str:
+    chars = []
+    for _ in range(LENGTH):
+        chars.append(ALPHABET[value & 31])
+        value >>= 5
+    return ''.join(reversed(chars))
+
+
+def timestamp(compact_id: str) -> float:
+    """
+    Returns when compact_id was made, in seconds since the epoch.
+    """
+    value = 0
+    for char in compact_id:
+        value = value << 5 | ALPHABET.index(char)
+    return (value >> 32) / 1000
+
+
+_ids = None
+_ids_lock = threading.Lock()
+
+
+def get_ids() -> CompactId:
+    """
+    Returns the process-wide id generator.
+    """
+    global _ids
+    if _ids is None:
+        with _ids_lock:
+            if _ids is None:
+                _ids = CompactId()
+    return _ids
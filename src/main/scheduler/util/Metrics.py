@@ -0,0 +1,236 @@
+import atexit
+import contextvars
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from decouple import config
+
+
+# Upper bounds, in seconds, of the latency histogram buckets
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Time and queries spent by the command running in this context, see Metrics.command()
+_current = contextvars.ContextVar('command_usage', default=None)
+
+
+class Histogram:
+    """
+    Cumulative latency histogram with fixed buckets, as exposed by Prometheus.
+    """
+
+    def __init__(self, buckets: tuple = BUCKETS) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last one counts values above every bucket
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """
+        Estimates the q quantile (0 to 1) as the upper bound of the bucket it falls in.
+        """
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return self.buckets[i] if i < len(self.buckets) else float('inf')
+        return 0.0
+
+
+def current_command():
+    """
+    Returns the name of the command running in this context, or None outside of one.
+    """
+    usage = _current.get()
+    return usage['command'] if usage is not None else None
+
+
+def _labels(labels: tuple) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in labels) + '}'
+
+
+class Metrics:
+    """
+    Process-wide counters and latency histograms: per command, per SQL statement, for password hashing and for
+    the connection pool. Thread-safe; every update takes one short lock.
+    """
+
+    HELP = {
+        'scheduler_command_seconds': ('histogram', 'Time to run a command'),
+        'scheduler_command_queries_total': ('counter', 'SQL statements executed by commands'),
+        'scheduler_command_sql_seconds_total': ('counter', 'Time commands spent executing SQL'),
+        'scheduler_command_hash_seconds_total': ('counter', 'Time commands spent hashing passwords'),
+        'scheduler_command_pool_wait_seconds_total': ('counter', 'Time commands spent waiting for a connection'),
+        'scheduler_query_seconds': ('histogram', 'Time to execute one SQL statement'),
+        'scheduler_rows_fetched_total': ('counter', 'Rows fetched from the database'),
+        'scheduler_connections_opened_total': ('counter', 'Database connections opened'),
+        'scheduler_connect_seconds': ('histogram', 'Time to open a database connection'),
+        'scheduler_pool_wait_seconds': ('histogram', 'Time to borrow a connection from the pool'),
+        'scheduler_prewarm_seconds': ('histogram', 'Time to load the driver and warm the pool at startup'),
+        'scheduler_hash_seconds': ('histogram', 'Time to derive a password hash'),
+        'scheduler_waitlist_booked_total': ('counter', 'Waitlisted patients booked by the waitlist matcher'),
+        'scheduler_session_checks_total': ('counter', 'Session tokens checked, by where the answer came from'),
+    }
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._histograms = {}  # (name, labels) -> Histogram
+        self._counters = {}    # (name, labels) -> float
+
+    def observe(self, name: str, seconds: float, **labels) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    def inc(self, name: str, amount: float = 1, **labels) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def charge(self, kind: str, seconds: float, queries: int = 0) -> None:
+        """
+        Adds time spent on kind ('sql', 'hash' or 'pool_wait') to the command running in this context, if any.
+        """
+        usage = _current.get()
+        if usage is not None:
+            usage[kind] += seconds
+            usage['queries'] += queries
+
+    @contextmanager
+    def command(self, name: str):
+        """
+        Times the command run inside the with block, along with the SQL, hashing and pool waits it causes.
+        """
+        usage = {'command': name, 'sql': 0.0, 'hash': 0.0, 'pool_wait': 0.0, 'queries': 0}
+        token = _current.set(usage)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            _current.reset(token)
+            self.observe('scheduler_command_seconds', elapsed, command=name)
+            self.inc('scheduler_command_queries_total', usage['queries'], command=name)
+            self.inc('scheduler_command_sql_seconds_total', usage['sql'], command=name)
+            self.inc('scheduler_command_hash_seconds_total', usage['hash'], command=name)
+            self.inc('scheduler_command_pool_wait_seconds_total', usage['pool_wait'], command=name)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def render_prometheus(self) -> str:
+        """
+        Returns every metric in the Prometheus text exposition format.
+        """
+        with self._lock:
+            histograms = {key: (h.buckets, list(h.counts), h.sum, h.count) for key, h in self._histograms.items()}
+            counters = dict(self._counters)
+        lines = []
+        for name, (kind, text) in self.HELP.items():
+            lines.append(f'# HELP {name} {text}')
+            lines.append(f'# TYPE {name} {kind}')
+            if kind == 'counter':
+                for (metric, labels), value in sorted(counters.items()):
+                    if metric == name:
+                        lines.append(f'{name}{_labels(labels)} {value:g}')
+                continue
+            for (metric, labels), (buckets, counts, total, count) in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, n in zip(buckets + (float('inf'),), counts):
+                    cumulative += n
+                    le = '+Inf' if bound == float('inf') else f'{bound:g}'
+                    lines.append(f'{name}_bucket{_labels(labels + (("le", le),))} {cumulative}')
+                lines.append(f'{name}_sum{_labels(labels)} {total:g}')
+                lines.append(f'{name}_count{_labels(labels)} {count}')
+        return '\n'.join(lines) + '\n'
+
+    def summary(self) -> str:
+        """
+        Returns a human-readable table of per-command and per-statement latency.
+        """
+        with self._lock:
+            histograms = {key: (h.count, h.sum, h.quantile(0.5), h.quantile(0.95), h.quantile(0.99))
+                          for key, h in self._histograms.items()}
+            counters = dict(self._counters)
+        lines = [f'{"command":<28}{"calls":>8}{"avg ms":>10}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}'
+                 f'{"queries":>9}{"sql ms":>10}{"hash ms":>10}{"wait ms":>10}']
+        for (name, labels), (count, total, p50, p95, p99) in sorted(histograms.items()):
+            if name != 'scheduler_command_seconds':
+                continue
+            # Per call averages of the time the command spent on SQL, hashing and waiting for a connection
+            queries, sql, hashing, wait = (counters.get((metric, labels), 0) / count for metric in (
+                'scheduler_command_queries_total', 'scheduler_command_sql_seconds_total',
+                'scheduler_command_hash_seconds_total', 'scheduler_command_pool_wait_seconds_total'))
+            lines.append(f'{dict(labels)["command"]:<28}{count:>8}{total / count * 1000:>10.2f}{p50 * 1000:>10.1f}'
+                         f'{p95 * 1000:>10.1f}{p99 * 1000:>10.1f}{queries:>9.1f}{sql * 1000:>10.2f}'
+                         f'{hashing * 1000:>10.2f}{wait * 1000:>10.2f}')
+        for (name, labels), (count, total, p50, p95, p99) in sorted(histograms.items()):
+            if name == 'scheduler_command_seconds':
+                continue
+            label = name[len('scheduler_'):-len('_seconds')]
+            if labels:
+                label += ' ' + ' '.join(str(v) for _, v in labels)
+            lines.append(f'{label:<28}{count:>8}{total / count * 1000:>10.2f}{p50 * 1000:>10.1f}{p95 * 1000:>10.1f}'
+                         f'{p99 * 1000:>10.1f}')
+        lines.append(f'rows fetched: {counters.get(("scheduler_rows_fetched_total", ()), 0):g}, '
+                     f'connections opened: {counters.get(("scheduler_connections_opened_total", ()), 0):g}')
+        lines.append('(percentiles are histogram bucket upper bounds)')
+        return '\n'.join(lines)
+
+    def dump(self, path: str) -> None:
+        """
+        Writes render_prometheus() to path, replacing it atomically so a scraper never reads half a file.
+        """
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'w') as f:
+            f.write(self.render_prometheus())
+        os.replace(tmp, path)
+
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+def _dump_forever(metrics: Metrics, path: str, interval: float) -> None:
+    while True:
+        time.sleep(interval)
+        try:
+            metrics.dump(path)
+        except OSError:
+            pass
+
+
+def get_metrics() -> Metrics:
+    """
+    Returns the process-wide metrics. When MetricsFile is set in .env, they are also written to that file in
+    Prometheus text format every MetricsInterval seconds and on exit, e.g. for node_exporter's textfile collector.
+    """
+    global _metrics
+    if _metrics is None:
+        with _metrics_lock:
+            if _metrics is None:
+                metrics = Metrics()
+                path = config('MetricsFile', default='')
+                if path:
+                    interval = config('MetricsInterval', default=15.0, cast=float)
+                    threading.Thread(target=_dump_forever, args=(metrics, path, interval), name='metrics-dump',
+                                     daemon=True).start()
+                    atexit.register(metrics.dump, path)
+                _metrics = metrics
+    return _metrics
@@ -0,0 +1,126 @@
+import hashlib
+import hmac
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decouple import config
+from util.Metrics import get_metrics
+
+
+# Parameters of every hash created before HashParams was stored (NULL in the database)
+LEGACY_PARAMS = 'pbkdf2_sha256$100000'
+# Hash columns are BINARY(16)
+KEY_LENGTH = 16
+ALGORITHMS = ('pbkdf2_sha256', 'pbkdf2_sha512', 'scrypt')
+# Cost used when none is configured: PBKDF2 iterations, or scrypt's N
+DEFAULT_COST = {'pbkdf2_sha256': 100000, 'pbkdf2_sha512': 100000, 'scrypt': 16384}
+# scrypt needs 128 * r * N bytes, so with r = 8 N can be at most SCRYPT_MAX_N
+SCRYPT_MAXMEM = 256 * 1024 * 1024
+SCRYPT_MAX_N = SCRYPT_MAXMEM // (128 * 8) // 2
+
+
+def derive(password: str, salt: bytes, params: str) -> bytes:
+    """
+    Derives a key from password and salt as described by params.
+    @param params: str, 'pbkdf2_sha256$<iterations>', 'pbkdf2_sha512$<iterations>' or 'scrypt$<n>$<r>$<p>'
+    """
+    parts = (params or LEGACY_PARAMS).split('$')
+    algorithm = parts[0]
+    if algorithm in ('pbkdf2_sha256', 'pbkdf2_sha512'):
+        return hashlib.pbkdf2_hmac(algorithm[7:], password.encode('utf-8'), salt, int(parts[1]), dklen=KEY_LENGTH)
+    if algorithm == 'scrypt':
+        n, r, p = (int(v) for v in parts[1:4])
+        return hashlib.scrypt(password.encode('utf-8'), salt=salt, n=n, r=r, p=p, maxmem=SCRYPT_MAXMEM,
+                              dklen=KEY_LENGTH)
+    raise ValueError(f'Unknown hash algorithm {algorithm!r}')
+
+
+class PasswordHasher:
+    """
+    Derives and verifies password hashes on a pool of worker threads. hashlib releases the GIL while deriving,
+    so concurrent logins run in parallel instead of queueing behind one another.
+    """
+
+    def __init__(self, algorithm: str = 'pbkdf2_sha256', cost: int = None, workers: int = None) -> None:
+        """
+        @param algorithm: str, one of ALGORITHMS
+        @param cost: int, iterations for PBKDF2 or N (a power of two) for scrypt, defaults to DEFAULT_COST
+        @param workers: int, derivation threads, defaults to one per core
+        @raise ValueError: for an unknown algorithm or a cost it cannot use, so bad settings fail at startup rather
+            than at every login
+        """
+        if algorithm not in ALGORITHMS:
+            raise ValueError(f'Unknown hash algorithm {algorithm!r}, expected one of {", ".join(ALGORITHMS)}')
+        if cost is None:
+            cost = DEFAULT_COST[algorithm]
+        if algorithm == 'scrypt':
+            if cost < 2 or cost & (cost - 1) or cost > SCRYPT_MAX_N:
+                raise ValueError(f'Hash cost {cost} is not valid for scrypt: N must be a power of two from 2 to '
+                                 f'{SCRYPT_MAX_N}, e.g. {DEFAULT_COST["scrypt"]}')
+            self.params = f'scrypt${cost}$8$1'
+        else:
+            if cost < 1:
+                raise ValueError(f'Hash cost {cost} is not valid for {algorithm}: it needs at least 1 iteration')
+            self.params = f'{algorithm}${cost}'
+        self._executor = ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1,
+                                            thread_name_prefix='hasher')
+
+    def submit(self, password: str, salt: bytes, params: str = None):
+        """
+        Starts a derivation on the pool, defaulting to the current parameters.
+        @return: concurrent.futures.Future resolving to the hash bytes
+        """
+        return self._executor.submit(derive, password, salt, params or self.params)
+
+    @staticmethod
+    def _wait(future) -> bytes:
+        # Time the caller waits, including any queueing behind other derivations
+        started = time.perf_counter()
+        try:
+            return future.result()
+        finally:
+            elapsed = time.perf_counter() - started
+            metrics = get_metrics()
+            metrics.observe('scheduler_hash_seconds', elapsed)
+            metrics.charge('hash', elapsed)
+
+    def hash(self, password: str) -> tuple:
+        """
+        Hashes a new password with a fresh salt and the current parameters.
+        @return: tuple (salt, hash, params)
+        """
+        salt = os.urandom(16)
+        return salt, self._wait(self.submit(password, salt)), self.params
+
+    def verify(self, password: str, salt: bytes, uhash: bytes, params: str = None) -> bool:
+        """
+        Checks password against a stored credential. params of None means LEGACY_PARAMS.
+        """
+        calculated = self._wait(self.submit(password, salt, params or LEGACY_PARAMS))
+        return hmac.compare_digest(calculated, bytes(uhash))
+
+    def needs_rehash(self, params: str = None) -> bool:
+        """
+        True if a credential stored with params should be upgraded to the current parameters.
+        """
+        return (params or LEGACY_PARAMS) != self.params
+
+
+_hasher = None
+_hasher_lock = threading.Lock()
+
+
+def get_hasher() -> PasswordHasher:
+    """
+    Returns the process-wide hasher, configured from HashAlgorithm, HashCost and HashWorkers in .env. HashCost
+    defaults to the algorithm's DEFAULT_COST. Raises ValueError for settings the hasher cannot use.
+    """
+    global _hasher
+    if _hasher is None:
+        with _hasher_lock:
+            if _hasher is None:
+                _hasher = PasswordHasher(config('HashAlgorithm', default='pbkdf2_sha256'),
+                                         config('HashCost', default=0, cast=int) or None,
+                                         config('HashWorkers', default=0, cast=int) or None)
+    return _hasher
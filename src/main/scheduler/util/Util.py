@@ -1,19 +1,12 @@
-import hashlib
 import os
+from util.PasswordHasher import derive, LEGACY_PARAMS
 
 
 class Util:
     def generate_salt():
         return os.urandom(16)
 
-    def generate_hash(password, salt):
-        key = hashlib.pbkdf2_hmac(
-            'sha256',
-            password.encode('utf-8'),
-            salt,
-            100000,
-            dklen=16
-        )
-        return key
+    def generate_hash(password, salt, params=LEGACY_PARAMS):
+        return derive(password, salt, params)
 
 
@@ -0,0 +1,109 @@
+import datetime
+import heapq
+import threading
+from bisect import bisect_left
+from decouple import config
+from db.ConnectionManager import ConnectionManager
+from db.InventoryCache import get_inventory
+from db.SlotCache import get_slot_cache
+from model.Appointment import Appointment
+from model.Waitlist import Waitlist
+from util.Metrics import get_metrics
+
+
+class WaitlistMatcher:
+    """
+    Books waitlisted patients into newly added availability and doses, oldest entry first.
+    Each run loads the entries that could use what was added in one query and the open slots of their dates in
+    another, then plans the whole batch in memory: entries are popped from a priority queue by age and given the
+    earliest date in their window that still has a planned-free slot, while doses of their vaccine last. Each
+    planned booking is then made in its own transaction, which also deletes the entry, so a patient is never booked
+    twice and bookings that lost a race to another process simply stay on the waitlist.
+    """
+
+    def __init__(self, horizon: int = 366) -> None:
+        """
+        @param horizon: int, most days after the first candidate date looked at in one run
+        """
+        self.horizon = horizon
+        # Runs in this process plan against the same caches, so take turns
+        self._lock = threading.Lock()
+
+    def match(self, start=None, end=None, vaccine_name: str = None) -> list:
+        """
+        Books entries waiting between start and end (default today onwards), optionally only for vaccine_name.
+        @return: list of the Appointments booked
+        """
+        today = datetime.date.today()
+        start = max(start or today, today)
+        end = end or start + datetime.timedelta(days=self.horizon - 1)
+        if end < start:
+            return []
+        with self._lock:
+            entries = Waitlist.waiting(start, end, vaccine_name)
+            if not entries:
+                return []
+            first = max(start, min(e.start for e in entries))
+            last = min(end, max(e.end for e in entries), first + datetime.timedelta(days=self.horizon - 1))
+            plan = self.plan(entries, get_slot_cache().slots_between(first, last), dict(get_inventory().all()))
+            return self._book(plan)
+
+    @staticmethod
+    def plan(entries: list, slots: dict, doses: dict) -> list:
+        """
+        Allocates open slots and doses to entries, oldest first.
+        @param slots: dict, date -> open slots on it
+        @param doses: dict, vaccine name -> doses left
+        @return: list of (Waitlist entry, date) in allocation order
+        """
+        free = {date: len(day) for date, day in slots.items() if day}
+        dates = sorted(free)
+        # (CreatedAt, PatientID, VaccineType) is unique, so entries themselves are never compared
+        queue = [(e.created, e.patient, e.vaccine_name, e) for e in entries]
+        heapq.heapify(queue)
+        plan = []
+        while queue and dates:
+            entry = heapq.heappop(queue)[-1]
+            if doses.get(entry.vaccine_name, 0) < 1:
+                continue
+            i = bisect_left(dates, entry.start)
+            if i == len(dates) or dates[i] > entry.end:
+                continue
+            date = dates[i]
+            free[date] -= 1
+            if free[date] == 0:
+                del dates[i]
+            doses[entry.vaccine_name] -= 1
+            plan.append((entry, date))
+        return plan
+
+    @staticmethod
+    def _book(plan: list) -> list:
+        booked = []
+        with ConnectionManager() as conn:
+            for entry, date in plan:
+                if not entry.claim(conn):
+                    conn.rollback()
+                    continue
+                # Commits the claim with the booking, or rolls it back if the slot or dose went elsewhere
+                status, apt = Appointment.reserve(date, entry.vaccine_name, entry.patient, conn)
+                if status == Appointment.RESERVED:
+                    booked.append(apt)
+        get_metrics().inc('scheduler_waitlist_booked_total', len(booked))
+        return booked
+
+
+_matcher = None
+_matcher_lock = threading.Lock()
+
+
+def get_matcher() -> WaitlistMatcher:
+    """
+    Returns the process-wide waitlist matcher, looking WaitlistHorizonDays (.env) ahead.
+    """
+    global _matcher
+    if _matcher is None:
+        with _matcher_lock:
+            if _matcher is None:
+                _matcher = WaitlistMatcher(config('WaitlistHorizonDays', default=366, cast=int))
+    return _matcher
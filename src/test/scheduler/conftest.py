@@ -0,0 +1,61 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'main', 'scheduler'))
+
+import Scheduler  # noqa: E402
+from db import Backend, ConnectionManager, InventoryCache, SlotCache, AssignmentPolicy, SessionStore  # noqa: E402
+from db import UsernameFilter, SQLTracer  # noqa: E402
+from util import Metrics, PasswordHasher, WaitlistMatcher, CompactId  # noqa: E402
+
+# Process-wide singletons, rebuilt from the settings of each test
+SINGLETONS = [(Backend, '_backend', None), (ConnectionManager, '_pool', None), (InventoryCache, '_inventory', None),
+              (SlotCache, '_cache', None), (AssignmentPolicy, '_policy', None), (SessionStore, '_sessions', None),
+              (SQLTracer, '_tracer', None), (Metrics, '_metrics', None), (PasswordHasher, '_hasher', None),
+              (WaitlistMatcher, '_matcher', None), (CompactId, '_ids', None), (UsernameFilter, '_filters', dict)]
+
+
+@pytest.fixture(autouse=True)
+def scheduler(monkeypatch):
+    """
+    A fresh in-memory SQLite database and fresh caches for every test, with cheap password hashing and short pool
+    waits. Settings changed with monkeypatch.setenv before the first command take effect.
+    """
+    monkeypatch.setenv('Backend', 'sqlite')
+    monkeypatch.setenv('SQLitePath', ':memory:')
+    monkeypatch.setenv('HashCost', '1000')
+    monkeypatch.setenv('PoolCheckoutTimeout', '2')
+    for module, name, empty in SINGLETONS:
+        monkeypatch.setattr(module, name, empty() if empty else None)
+    Scheduler.use_session(Scheduler.Session())
+    yield Scheduler
+    pool = ConnectionManager._pool
+    if pool is not None:
+        pool.close()
+
+
+@pytest.fixture
+def run(capsys):
+    """
+    Runs command lines in the current session, returning what they printed.
+    """
+    def run(*lines) -> str:
+        capsys.readouterr()
+        for line in lines:
+            Scheduler.run_command(line)
+        return capsys.readouterr().out
+    return run
+
+
+@pytest.fixture
+def doses():
+    """
+    Reads the doses of a vaccine from the database, bypassing the inventory cache.
+    """
+    def doses(name: str) -> int:
+        with ConnectionManager.ConnectionManager() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT Doses FROM Vaccines WHERE Name = %s', name)
+            return cursor.fetchone()[0]
+    return doses
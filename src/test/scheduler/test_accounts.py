@@ -0,0 +1,69 @@
+from db.ConnectionManager import ConnectionManager
+from db import UsernameFilter
+from db.SQLTracer import get_tracer
+from db.UsernameFilter import get_usernames
+from Export import Exporter
+from model.AccountRow import AccountRow
+from model.Caregiver import Caregiver
+from model.Patient import Patient
+from util.AccountImport import AccountImport
+
+
+def traced():
+    statements = []
+    get_tracer().add_hook(lambda entry: statements.append(entry['statement']))
+    return statements
+
+
+def test_get_many_runs_one_query_per_in_chunk(monkeypatch, run):
+    run(*(f'create_patient p{i} pw' for i in range(5)))
+    monkeypatch.setattr(Patient, 'IN_CHUNK', 2)
+    statements = traced()
+    patients = Patient.get_many([f'p{i}' for i in range(5)] + ['p0', 'nobody'])
+    # Six distinct names in chunks of two
+    assert len([s for s in statements if s.startswith('SELECT Username, Salt, Hash, HashParams FROM Patients')]) == 3
+    assert sorted(patients) == [f'p{i}' for i in range(5)]
+    assert all(type(patient) is Patient and patient.get_hash() for patient in patients.values())
+    assert Patient.get_many([]) == {}
+
+
+def test_get_many_uses_callers_connection(monkeypatch, run):
+    monkeypatch.setenv('PoolMaxSize', '1')
+    run('create_caregiver cg1 pw')
+    with ConnectionManager() as conn:
+        caregivers = Caregiver.get_many(['cg1', 'cg2'], conn)
+    assert list(caregivers) == ['cg1']
+
+
+def test_iter_rows_lists_accounts_without_password_material(monkeypatch, run):
+    run('create_caregiver cg_b pw', 'create_caregiver cg_a pw')
+    monkeypatch.setattr(Caregiver, 'FETCH_ROWS', 1)
+    rows = list(Caregiver.iter_rows())
+    assert [row.username for row in rows] == ['cg_a', 'cg_b']
+    assert all(type(row) is AccountRow and row.params.startswith('pbkdf2_sha256$') for row in rows)
+
+
+def test_import_skips_existing_accounts(run):
+    run('create_patient p1 pw')
+    stats = AccountImport('Patients', workers=1).run(['username,password', 'p1,x', 'p2,y', 'p3,z'])
+    assert (stats['created'], stats['existing']) == (2, 1)
+    assert 'Logged in as p2' in run('login_patient p2 y')
+
+
+def test_import_loads_username_filter_on_the_connection_it_holds(monkeypatch, run):
+    monkeypatch.setenv('PoolMaxSize', '1')
+    run('create_patient p1 pw')
+    # Not loaded yet, so the existence check has to load it while run() holds the only pooled connection
+    monkeypatch.setattr(UsernameFilter, '_filters', {})
+    stats = AccountImport('Patients', workers=1).run(['p1,x', 'p2,y'])
+    assert (stats['created'], stats['existing']) == (1, 1)
+    assert get_usernames('Patients').might_contain('p2')
+
+
+def test_export_lists_accounts(tmp_path, run):
+    run('create_patient p2 pw', 'create_patient p1 pw')
+    path = tmp_path / 'patients.csv'
+    assert Exporter(chunk_rows=1).export('patients', str(path)) == 2
+    lines = path.read_text().splitlines()
+    assert lines[0] == 'Username,HashParams'
+    assert [line.split(',')[0] for line in lines[1:]] == ['p1', 'p2']
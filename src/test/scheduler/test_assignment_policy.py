@@ -0,0 +1,56 @@
+import time
+import pytest
+
+
+def setup_caregivers(run, dates, caregivers=('cg_b', 'cg_a', 'cg_c'), doses=10):
+    for caregiver in caregivers:
+        run(f'create_caregiver {caregiver} pw', f'login_caregiver {caregiver} pw',
+            *(f'upload_availability {date}' for date in dates), 'logout')
+    run(f'login_caregiver {caregivers[0]} pw', f'add_doses pfizer {doses}', 'logout')
+
+
+def reserve(run, patient, date):
+    out = run(f'create_patient {patient} pw', f'login_patient {patient} pw', f'reserve {date} pfizer', 'logout')
+    assert 'Vaccine appointment scheduled!' in out, out
+    return out.split('Caregiver: ')[1].split('\n')[0]
+
+
+@pytest.fixture(params=['alphabetical', 'least_loaded', 'round_robin'])
+def policy(request, monkeypatch):
+    # One pooled connection: a policy that borrowed a second while reserving would time out
+    monkeypatch.setenv('AssignmentPolicy', request.param)
+    monkeypatch.setenv('PoolMaxSize', '1')
+    return request.param
+
+
+def test_every_policy_books_with_one_connection(policy, run):
+    setup_caregivers(run, ['2026-11-01'])
+    started = time.monotonic()
+    booked = [reserve(run, f'p{i}', '2026-11-01') for i in range(3)]
+    assert time.monotonic() - started < 1
+    assert sorted(booked) == ['cg_a', 'cg_b', 'cg_c']
+    assert 'there are no open appointments' in run('login_patient p0 pw', 'reserve 2026-11-01 pfizer')
+
+
+def test_alphabetical_takes_first_caregiver(monkeypatch, run):
+    monkeypatch.setenv('AssignmentPolicy', 'alphabetical')
+    setup_caregivers(run, ['2026-11-01', '2026-11-02'])
+    assert reserve(run, 'p1', '2026-11-01') == 'cg_a'
+    assert reserve(run, 'p2', '2026-11-02') == 'cg_a'
+
+
+def test_least_loaded_takes_least_booked_caregiver(monkeypatch, run):
+    monkeypatch.setenv('AssignmentPolicy', 'least_loaded')
+    setup_caregivers(run, ['2026-11-01', '2026-11-02'], caregivers=('cg_a', 'cg_b'))
+    assert reserve(run, 'p1', '2026-11-01') == 'cg_a'
+    # cg_a now has one appointment and cg_b none
+    assert reserve(run, 'p2', '2026-11-02') == 'cg_b'
+    assert reserve(run, 'p3', '2026-11-02') == 'cg_a'
+
+
+def test_round_robin_takes_turns(monkeypatch, run):
+    monkeypatch.setenv('AssignmentPolicy', 'round_robin')
+    setup_caregivers(run, ['2026-11-01', '2026-11-02'])
+    dates = ['2026-11-01', '2026-11-02', '2026-11-01', '2026-11-02']
+    booked = [reserve(run, f'p{i}', date) for i, date in enumerate(dates)]
+    assert booked == ['cg_a', 'cg_b', 'cg_c', 'cg_a']
@@ -0,0 +1,72 @@
+import sys
+import pytest
+from Batch import BatchRunner
+from db.ConnectionManager import ConnectionManager, DBError
+from db.GroupedConnection import GroupedConnection
+from model.Appointment import Appointment
+
+
+@pytest.fixture
+def batch(monkeypatch):
+    # BatchRunner swaps sys.stdout for a capturing stand-in; put the original back afterwards
+    monkeypatch.setattr(sys, 'stdout', sys.stdout)
+
+    def batch(*lines, group_size=100):
+        results = []
+        stats = BatchRunner(group_size).run(lines, results.append)
+        return results, stats
+    return batch
+
+
+def test_passwords_and_tokens_are_masked(batch):
+    results, _ = batch('create_patient p1 secret', 'login_patient p1 secret', 'logout')
+    token = results[1]['output'].split('Session token: ')[1].split(' ')[0]
+    assert token == '***'
+    assert [result['command'] for result in results] == ['create_patient p1 ***', 'login_patient p1 ***', 'logout']
+    assert all('secret' not in result['output'] for result in results)
+
+
+def count(query, *params):
+    with ConnectionManager() as conn:
+        cursor = conn.cursor()
+        cursor.execute(query, params)
+        return cursor.fetchone()[0]
+
+
+def test_failed_command_rolls_back_to_its_savepoint(monkeypatch, batch):
+    results, _ = batch('create_caregiver cg pw', 'create_patient p1 pw', 'login_caregiver cg pw',
+                       'upload_availability 2026-11-01', 'add_doses pfizer 1', 'logout', 'login_patient p1 pw',
+                       'reserve 2026-11-01 pfizer')
+    apt_id = results[-1]['output'].split('Appointment ID: ')[1].split(',')[0]
+    # The dose goes back before the delete fails; only that command's work is undone
+    monkeypatch.setattr(Appointment, 'DELETE', 'DELETE FROM NoSuchTable WHERE AppointmentID = %s')
+    results, stats = batch('login_patient p1 pw', f'cancel {apt_id}', 'logout', 'login_caregiver cg pw',
+                           'add_doses pfizer 3')
+    assert [result['ok'] for result in results] == [True, False, True, True, True]
+    assert stats['rolled_back'] == 0
+    assert count('SELECT Doses FROM Vaccines WHERE Name = %s', 'pfizer') == 3
+    assert count('SELECT COUNT(*) FROM Appointments') == 1
+
+
+def test_failed_transaction_rolls_back_the_group(monkeypatch, batch):
+    end_command = GroupedConnection.end_command
+    ended = []
+
+    def fail_third(conn):
+        ended.append(1)
+        if len(ended) == 3:
+            raise DBError('connection lost')
+        end_command(conn)
+    monkeypatch.setattr(GroupedConnection, 'end_command', fail_third)
+    results, stats = batch('create_caregiver cg1 pw', 'create_caregiver cg2 pw', 'create_caregiver cg3 pw',
+                           'create_caregiver cg4 pw')
+    assert [result['ok'] for result in results] == [True, True, False, True]
+    assert 'group rolled back' in results[2]['output']
+    assert stats['rolled_back'] == 2
+    assert count('SELECT COUNT(*) FROM Caregivers') == 1
+
+
+def test_groups_commit_every_group_size_commands(batch):
+    _, stats = batch(*(f'create_patient p{i} pw' for i in range(5)), group_size=2)
+    assert stats['commits'] == 3
+    assert count('SELECT COUNT(*) FROM Patients') == 5
@@ -0,0 +1,23 @@
+from db.ConnectionManager import ConnectionManager
+
+
+def booked(date):
+    with ConnectionManager() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT CaregiverID, BookedVaccine FROM Availabilities WHERE Date = %s ORDER BY CaregiverID',
+                       date)
+        return cursor.fetchall()
+
+
+def test_booked_vaccine_follows_reserve_and_cancel(run):
+    run('create_caregiver cg_a pw', 'login_caregiver cg_a pw', 'upload_availability 2026-11-01', 'logout',
+        'create_caregiver cg_b pw', 'login_caregiver cg_b pw', 'upload_availability 2026-11-01',
+        'add_doses pfizer 5', 'add_doses moderna 5', 'logout')
+    assert [vaccine for _, vaccine in booked('2026-11-01')] == [None, None]
+    out = run('create_patient p1 pw', 'login_patient p1 pw', 'reserve 2026-11-01 moderna')
+    apt_id = out.split('Appointment ID: ')[1].split(',')[0]
+    caregiver = out.split('Caregiver: ')[1].split('\n')[0]
+    assert dict(booked('2026-11-01'))[caregiver] == 'moderna'
+    assert sum(vaccine is None for _, vaccine in booked('2026-11-01')) == 1
+    run(f'cancel {apt_id}')
+    assert [vaccine for _, vaccine in booked('2026-11-01')] == [None, None]
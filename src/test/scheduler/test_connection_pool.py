@@ -0,0 +1,76 @@
+import threading
+import time
+import pytest
+from db.ConnectionManager import ConnectionManager, PoolTimeout, get_pool, pin_connection
+from db.InventoryCache import get_inventory
+from model.Appointment import Appointment
+
+
+def book(run, date='2026-11-01'):
+    out = run('create_caregiver cg1 pw', 'create_patient p1 pw', 'login_caregiver cg1 pw',
+              f'upload_availability {date}', 'add_doses pfizer 2', 'logout',
+              'login_patient p1 pw', f'reserve {date} pfizer')
+    assert 'Vaccine appointment scheduled!' in out
+    return out.split('Appointment ID: ')[1].split(',')[0]
+
+
+def test_connections_are_reused():
+    with ConnectionManager() as first:
+        pass
+    with ConnectionManager() as second:
+        assert second is first
+
+
+def test_exhausted_pool_times_out(monkeypatch):
+    monkeypatch.setenv('PoolMaxSize', '1')
+    pool = get_pool()
+    pool.checkout_timeout = 0.2
+    with ConnectionManager():
+        started = time.monotonic()
+        with pytest.raises(PoolTimeout):
+            pool.acquire()
+        assert time.monotonic() - started >= 0.2
+
+
+def test_waiter_gets_released_connection(monkeypatch):
+    monkeypatch.setenv('PoolMaxSize', '1')
+    pool = get_pool()
+    borrowed = pool.acquire()
+    got = []
+    waiter = threading.Thread(target=lambda: got.append(pool.acquire()))
+    waiter.start()
+    time.sleep(0.1)
+    assert not got
+    pool.release(borrowed)
+    waiter.join(1)
+    assert got == [borrowed]
+    pool.release(borrowed)
+
+
+def test_pinned_connection_is_shared_by_nested_managers(monkeypatch):
+    monkeypatch.setenv('PoolMaxSize', '1')
+    with ConnectionManager() as conn, pin_connection(conn):
+        with ConnectionManager() as inner:
+            assert inner is conn
+
+
+def test_cancel_with_one_connection(monkeypatch, run, doses):
+    monkeypatch.setenv('PoolMaxSize', '1')
+    apt_id = book(run)
+    started = time.monotonic()
+    out = run(f'cancel {apt_id}')
+    assert time.monotonic() - started < 1
+    assert 'Appointment successfully cancelled!' in out
+    assert doses('pfizer') == 2
+    assert get_inventory().get_doses('pfizer') == 2
+    assert 'Appointment not found.' in run(f'cancel {apt_id}')
+
+
+def test_failed_cancel_keeps_dose_and_appointment(monkeypatch, run, doses):
+    apt_id = book(run)
+    monkeypatch.setattr(Appointment, 'DELETE', 'DELETE FROM NoSuchTable WHERE AppointmentID = %s')
+    out = run(f'cancel {apt_id}')
+    assert 'Error: Could not cancel appointment.' in out
+    assert doses('pfizer') == 1
+    assert get_inventory().get_doses('pfizer') == 1
+    assert apt_id in run('show_appointments')
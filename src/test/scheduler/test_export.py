@@ -0,0 +1,85 @@
+import csv
+import datetime
+import os
+import pytest
+import Export
+from Export import Exporter
+from model.Appointment import Appointment
+
+DATE = datetime.date(2026, 11, 1)
+
+
+def book(run):
+    # cg_b and cg_a on DATE, cg_a the day after, and one appointment outside the exported range
+    for caregiver, days in (('cg_b', (0,)), ('cg_a', (0, 1, 5))):
+        run(f'create_caregiver {caregiver} pw', f'login_caregiver {caregiver} pw',
+            *(f'upload_availability {DATE + datetime.timedelta(days=d)}' for d in days), 'logout')
+    run('login_caregiver cg_a pw', 'add_doses pfizer 10', 'logout')
+    for days, patient in ((1, 'p1'), (0, 'p2'), (0, 'p3'), (5, 'p4')):
+        run(f'create_patient {patient} pw')
+        assert Appointment.reserve(DATE + datetime.timedelta(days=days), 'pfizer', patient)[0] == Appointment.RESERVED
+
+
+def read(path):
+    with open(path, newline='', encoding='utf-8') as f:
+        return list(csv.reader(f))
+
+
+def test_csv_rows_are_in_date_and_caregiver_order(monkeypatch, tmp_path, run):
+    book(run)
+    writes = []
+    write = Export.CsvWriter.write
+    monkeypatch.setattr(Export.CsvWriter, 'write', lambda self, rows: writes.append(len(rows)) or write(self, rows))
+    path = str(tmp_path / 'appointments.csv')
+    assert Exporter(chunk_rows=1).export('appointments', path, 'csv', DATE, DATE + datetime.timedelta(days=1)) == 3
+    # One row per chunk
+    assert writes == [1, 1, 1]
+    header, *rows = read(path)
+    assert header == ['AppointmentID', 'Date', 'CaregiverID', 'PatientID', 'VaccineType']
+    assert [(date, caregiver) for _, date, caregiver, _, _ in rows] == \
+        [(str(DATE), 'cg_a'), (str(DATE), 'cg_b'), (str(DATE + datetime.timedelta(days=1)), 'cg_a')]
+    assert sorted(patient for _, _, _, patient, _ in rows) == ['p1', 'p2', 'p3']
+    assert os.listdir(tmp_path) == ['appointments.csv']
+
+
+def test_output_appears_only_once_complete(monkeypatch, tmp_path, run):
+    book(run)
+    path = tmp_path / 'appointments.csv'
+    seen = []
+    write = Export.CsvWriter.write
+
+    def watched(self, rows):
+        # While rows are still being written only the temporary file exists
+        seen.append((path.exists(), os.listdir(tmp_path)))
+        write(self, rows)
+    monkeypatch.setattr(Export.CsvWriter, 'write', watched)
+    assert Exporter(chunk_rows=1).export('appointments', str(path)) == 4
+    tmp = f'appointments.csv.{os.getpid()}.tmp'
+    assert seen == [(False, [tmp])] * 4
+    assert len(read(path)) == 5
+
+
+def test_failed_export_keeps_previous_file(monkeypatch, tmp_path, run):
+    book(run)
+    path = tmp_path / 'appointments.csv'
+    path.write_text('previous\n')
+    write = Export.CsvWriter.write
+    written = []
+
+    def failing(self, rows):
+        if written:
+            raise RuntimeError('disk full')
+        written.append(rows)
+        write(self, rows)
+    monkeypatch.setattr(Export.CsvWriter, 'write', failing)
+    with pytest.raises(RuntimeError):
+        Exporter(chunk_rows=1).export('appointments', str(path))
+    assert path.read_text() == 'previous\n'
+    assert os.listdir(tmp_path) == ['appointments.csv']
+
+
+def test_inventory_counts_booked_doses_in_range(tmp_path, run):
+    book(run)
+    path = str(tmp_path / 'inventory.csv')
+    assert Exporter(chunk_rows=1).export('inventory', path, 'csv', DATE, DATE) == 1
+    assert read(path) == [['Vaccine', 'DosesLeft', 'DosesBooked'], ['pfizer', '6', '2']]
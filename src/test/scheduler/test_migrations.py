@@ -0,0 +1,122 @@
+import datetime
+import os
+import re
+import shutil
+import sqlite3
+import pytest
+from db.Backend import DBError, get_backend
+from db.ConnectionManager import ConnectionManager
+from db.MigrationRunner import MIGRATIONS_DIR, MigrationRunner
+from db.SQLiteBackend import CREATE_SQL, SQLiteBackend, SQLiteConnection
+from db.SQLTracer import get_tracer
+from model.Appointment import Appointment
+
+# Placeholders and literals, so a plan-check and the statement it stands for compare equal
+VALUE = re.compile(r"%s|\?|'[^']*'")
+
+
+def shape(query: str) -> str:
+    return VALUE.sub('?', query)
+
+
+@pytest.fixture
+def database(tmp_path):
+    """
+    A SQLite database built from create.sql alone, as a bare connection with the runner to migrate it.
+    """
+    path = str(tmp_path / 'scheduler.db')
+    raw = sqlite3.connect(path, isolation_level='IMMEDIATE')
+    with open(CREATE_SQL) as f:
+        raw.executescript(f.read())
+    conn = SQLiteConnection(raw)
+    yield conn, MigrationRunner(SQLiteBackend(path))
+    conn.close()
+
+
+def tables(conn) -> set:
+    cursor = conn.cursor()
+    cursor.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'index', 'trigger')")
+    return {row[0] for row in cursor.fetchall()}
+
+
+def applied(conn) -> list:
+    cursor = conn.cursor()
+    cursor.execute('SELECT Version FROM SchemaMigrations ORDER BY Version')
+    return [row[0] for row in cursor.fetchall()]
+
+
+def test_upgrade_step_by_step(database):
+    conn, runner = database
+    versions = [migration.version for migration in runner.migrations]
+    assert [migration.version for migration in runner.pending(conn)] == versions
+    assert [migration.version for migration in runner.upgrade(conn, target=3)] == [1, 2, 3]
+    assert applied(conn) == [1, 2, 3]
+    assert 'IX_Availabilities_Date' in tables(conn)
+    assert 'Waitlist' not in tables(conn)
+    assert [migration.version for migration in runner.upgrade(conn)] == versions[3:]
+    assert applied(conn) == versions
+    assert {'Waitlist', 'Sessions', 'IX_Availabilities_BookedVaccine'} <= tables(conn)
+    assert runner.upgrade(conn) == []
+
+
+def test_upgrade_backfills_existing_bookings(database):
+    conn, runner = database
+    runner.upgrade(conn, target=6)
+    cursor = conn.cursor()
+    cursor.execute("INSERT INTO Caregivers (Username, Salt, Hash) VALUES ('cg', x'00', x'00')")
+    cursor.execute("INSERT INTO Patients (Username, Salt, Hash) VALUES ('p1', x'00', x'00')")
+    cursor.execute("INSERT INTO Vaccines (Name, Doses) VALUES ('pfizer', 1)")
+    cursor.execute("INSERT INTO Availabilities VALUES ('cg', '2030-01-01', 'a1'), ('cg', '2030-01-02', 'a2')")
+    cursor.execute("INSERT INTO Appointments VALUES ('a1', 'pfizer', 'p1')")
+    conn.commit()
+    runner.upgrade(conn)
+    cursor.execute('SELECT AppointmentID, BookedVaccine FROM Availabilities ORDER BY AppointmentID')
+    assert cursor.fetchall() == [('a1', 'pfizer'), ('a2', None)]
+
+
+def test_columns_added_by_hand_are_adopted(database):
+    conn, runner = database
+    cursor = conn.cursor()
+    cursor.execute('ALTER TABLE Vaccines ADD Version INT NOT NULL DEFAULT 0')
+    conn.commit()
+    done = runner.upgrade(conn, target=2)
+    assert [migration.version for migration in done] == [2]
+    assert applied(conn) == [1, 2]
+
+
+def test_failed_migration_is_rolled_back(database, tmp_path):
+    conn, runner = database
+    directory = tmp_path / 'migrations'
+    shutil.copytree(MIGRATIONS_DIR, directory, ignore=shutil.ignore_patterns('__pycache__'))
+    (directory / '0099_broken.sql').write_text('CREATE TABLE Broken (ID INT);\nINSERT INTO NoSuchTable VALUES (1);\n')
+    broken = MigrationRunner(runner.backend, str(directory))
+    with pytest.raises((sqlite3.Error, DBError)):
+        broken.upgrade(conn)
+    # Everything before the broken migration stays applied; nothing of it does
+    assert applied(conn)[-1] == runner.migrations[-1].version
+    assert 'Broken' not in tables(conn)
+    assert [migration.version for migration in broken.pending(conn)] == [99]
+    os.remove(directory / '0099_broken.sql')
+    assert MigrationRunner(runner.backend, str(directory)).upgrade(conn) == []
+
+
+def test_plan_checks_are_the_appointment_list_queries():
+    statements = []
+    get_tracer().add_hook(lambda entry: statements.append(entry['statement']))
+    start, end = datetime.date(2030, 1, 1), datetime.date(2030, 12, 31)
+    list(Appointment.list_for(patient='p1'))
+    list(Appointment.list_for(patient='p1', after='a1'))
+    list(Appointment.list_for(caregiver='c1', after='a1'))
+    list(Appointment.list_for(caregiver='c1', start=start, end=end))
+    runner = MigrationRunner(get_backend())
+    checks = {shape(query) for migration in runner.migrations for query in migration.checks}
+    listed = [shape(statement) for statement in statements if statement.startswith(Appointment.LIST)]
+    assert len(listed) == 4
+    assert all(statement in checks for statement in listed)
+
+
+def test_plan_checks_do_not_scan():
+    with ConnectionManager() as conn:
+        results = MigrationRunner(get_backend()).check_plans(conn)
+    assert results
+    assert [(str(migration), query) for migration, query, _, scans in results if scans] == []
@@ -0,0 +1,31 @@
+import pytest
+from util.PasswordHasher import DEFAULT_COST, PasswordHasher
+
+
+@pytest.mark.parametrize('algorithm', ['pbkdf2_sha256', 'pbkdf2_sha512', 'scrypt'])
+def test_default_cost_of_each_algorithm_hashes(algorithm):
+    hasher = PasswordHasher(algorithm)
+    assert str(DEFAULT_COST[algorithm]) in hasher.params
+    salt, uhash, params = hasher.hash('pw')
+    assert hasher.verify('pw', salt, uhash, params)
+    assert not hasher.verify('other', salt, uhash, params)
+
+
+@pytest.mark.parametrize('algorithm, cost', [('scrypt', 100000), ('scrypt', 1), ('scrypt', 2 ** 18),
+                                             ('pbkdf2_sha256', 0)])
+def test_unusable_cost_is_rejected(algorithm, cost):
+    with pytest.raises(ValueError, match=f'Hash cost {cost} is not valid for {algorithm}'):
+        PasswordHasher(algorithm, cost)
+
+
+def test_scrypt_without_cost_logs_in(monkeypatch, run):
+    monkeypatch.setenv('HashAlgorithm', 'scrypt')
+    monkeypatch.delenv('HashCost')
+    assert 'Logged in as' in run('create_patient p1 pw', 'login_patient p1 pw')
+
+
+def test_bad_settings_stop_startup(monkeypatch, scheduler):
+    monkeypatch.setenv('HashAlgorithm', 'scrypt')
+    monkeypatch.setenv('HashCost', '100000')
+    with pytest.raises(SystemExit):
+        scheduler.check_settings()
@@ -0,0 +1,113 @@
+import datetime
+import threading
+from db.ConnectionManager import ConnectionManager
+from db.InventoryCache import get_inventory
+from db.SlotCache import get_slot_cache
+from model.Appointment import Appointment
+
+DATE = datetime.date(2026, 11, 1)
+
+
+def appointments():
+    with ConnectionManager() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT COUNT(*) FROM Appointments')
+        return cursor.fetchone()[0]
+
+
+def setup(run, caregivers=('cg_a', 'cg_b', 'cg_c'), pfizer=2):
+    for caregiver in caregivers:
+        run(f'create_caregiver {caregiver} pw', f'login_caregiver {caregiver} pw', f'upload_availability {DATE}',
+            'logout')
+    run(f'login_caregiver {caregivers[0]} pw', f'add_doses pfizer {pfizer}', 'logout',
+        *(f'create_patient p{i} pw' for i in range(3)))
+
+
+def test_reserve_takes_one_dose_and_one_slot(run, doses):
+    setup(run)
+    status, apt = Appointment.reserve(DATE, 'pfizer', 'p0')
+    assert status == Appointment.RESERVED
+    assert apt.get_caregiver() == 'cg_a'
+    assert doses('pfizer') == get_inventory().get_doses('pfizer') == 1
+    assert apt.get_appointment_id() not in [apt_id for apt_id, _ in get_slot_cache().get(DATE)]
+    assert appointments() == 1
+
+
+def test_reserve_never_oversells(run, doses):
+    setup(run)
+    results = [Appointment.reserve(DATE, 'pfizer', f'p{i}')[0] for i in range(3)]
+    assert results == [Appointment.RESERVED, Appointment.RESERVED, Appointment.NO_DOSES]
+    assert doses('pfizer') == get_inventory().get_doses('pfizer') == 0
+    assert appointments() == 2
+
+
+def booked():
+    with ConnectionManager() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT AP.AppointmentID, AP.PatientID, AV.CaregiverID FROM Appointments AP '
+                       'JOIN Availabilities AV ON AV.AppointmentID = AP.AppointmentID')
+        return cursor.fetchall()
+
+
+def reserve_together(patients):
+    # Every thread reserves at once, so they race for the same doses and slots
+    barrier = threading.Barrier(len(patients))
+    results = {}
+
+    def reserve(patient):
+        barrier.wait()
+        results[patient] = Appointment.reserve(DATE, 'pfizer', patient)[0]
+
+    threads = [threading.Thread(target=reserve, args=(patient,)) for patient in patients]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sorted(results.values())
+
+
+def test_concurrent_reserves_never_oversell_doses(monkeypatch, tmp_path, run, doses):
+    # A database file: in-memory shared-cache connections fail on a lock instead of waiting their turn
+    monkeypatch.setenv('SQLitePath', str(tmp_path / 'scheduler.db'))
+    patients = [f'p{i}' for i in range(8)]
+    setup(run, caregivers=[f'cg{i}' for i in range(6)], pfizer=3)
+    run(*(f'create_patient {patient} pw' for patient in patients[3:]))
+    assert reserve_together(patients) == [Appointment.RESERVED] * 3 + [Appointment.NO_DOSES] * 5
+    assert doses('pfizer') == get_inventory().get_doses('pfizer') == 0
+    rows = booked()
+    assert len(rows) == len({apt_id for apt_id, _, _ in rows}) == len({caregiver for _, _, caregiver in rows}) == 3
+
+
+def test_concurrent_reserves_never_double_book_slots(monkeypatch, tmp_path, run, doses):
+    monkeypatch.setenv('SQLitePath', str(tmp_path / 'scheduler.db'))
+    patients = [f'p{i}' for i in range(8)]
+    setup(run, caregivers=('cg_a', 'cg_b', 'cg_c'), pfizer=8)
+    run(*(f'create_patient {patient} pw' for patient in patients[3:]))
+    assert reserve_together(patients) == [Appointment.RESERVED] * 3 + [Appointment.NO_SLOTS] * 5
+    # A dose is only taken for a reservation that got a slot
+    assert doses('pfizer') == get_inventory().get_doses('pfizer') == 5
+    rows = booked()
+    assert len({apt_id for apt_id, _, _ in rows}) == len({patient for _, patient, _ in rows}) == 3
+    assert sorted(caregiver for _, _, caregiver in rows) == ['cg_a', 'cg_b', 'cg_c']
+
+
+def test_reserve_without_slot_keeps_dose(run, doses):
+    setup(run, caregivers=('cg_a',))
+    assert Appointment.reserve(DATE, 'pfizer', 'p0')[0] == Appointment.RESERVED
+    assert Appointment.reserve(DATE, 'pfizer', 'p1')[0] == Appointment.NO_SLOTS
+    assert doses('pfizer') == get_inventory().get_doses('pfizer') == 1
+    assert appointments() == 1
+
+
+def test_cancel_returns_dose_and_slot(run, doses):
+    setup(run, caregivers=('cg_a',), pfizer=1)
+    _, apt = Appointment.reserve(DATE, 'pfizer', 'p0')
+    assert Appointment.reserve(DATE, 'pfizer', 'p1')[0] == Appointment.NO_DOSES
+    assert Appointment.cancel(apt.get_appointment_id(), DATE, 'cg_a')
+    assert doses('pfizer') == get_inventory().get_doses('pfizer') == 1
+    assert appointments() == 0
+    # Cancelling twice gives nothing back, and the freed slot and dose can be booked again
+    assert not Appointment.cancel(apt.get_appointment_id(), DATE, 'cg_a')
+    assert doses('pfizer') == 1
+    assert Appointment.reserve(DATE, 'pfizer', 'p1')[0] == Appointment.RESERVED
+    assert doses('pfizer') == 0
@@ -0,0 +1,40 @@
+import datetime
+import re
+
+START = datetime.date(2026, 11, 1)
+DAY = re.compile(r'^(\d{4}-\d\d-\d\d) (\d+)$', re.MULTILINE)
+
+
+def counts(out):
+    return [(datetime.date.fromisoformat(date), int(count)) for date, count in DAY.findall(out)]
+
+
+def test_pages_cover_range_without_gaps_or_repeats(scheduler, run):
+    days = 2 * scheduler.SEARCH_PAGE_DAYS + 8
+    dates = [START + datetime.timedelta(days=i) for i in range(days)]
+    # A second caregiver on the days either side of each page boundary
+    edges = [d for i, d in enumerate(dates) if i % scheduler.SEARCH_PAGE_DAYS in (0, scheduler.SEARCH_PAGE_DAYS - 1)]
+    run('create_caregiver cg_a pw', 'login_caregiver cg_a pw', f'upload_availability {START} {days}d', 'logout',
+        'create_caregiver cg_b pw', 'login_caregiver cg_b pw',
+        *(f'upload_availability {d}' for d in edges), 'add_doses pfizer 5')
+    seen = []
+    for page in (1, 2, 3):
+        out = run(f'search_caregiver_schedule {START} {days}d page {page}')
+        first = START + datetime.timedelta(days=(page - 1) * scheduler.SEARCH_PAGE_DAYS)
+        last = min(dates[-1], first + datetime.timedelta(days=scheduler.SEARCH_PAGE_DAYS - 1))
+        assert f'Open appointments from {first} to {last} (page {page} of 3):' in out
+        page_counts = counts(out)
+        assert [d for d, _ in page_counts] == [d for d in dates if first <= d <= last]
+        seen += page_counts
+    assert [d for d, _ in seen] == dates
+    assert seen == [(d, 2 if d in edges else 1) for d in dates]
+    assert 'Error: Page must be between 1 and 3' in run(f'search_caregiver_schedule {START} {days}d page 4')
+
+
+def test_slot_pages_match_count_pages(scheduler, run):
+    days = scheduler.SEARCH_PAGE_DAYS + 1
+    run('create_caregiver cg_a pw', 'login_caregiver cg_a pw', f'upload_availability {START} {days}d')
+    pages = [run(f'search_caregiver_schedule {START} {days}d slots page {page}') for page in (1, 2)]
+    assert [len(counts(out)) for out in pages] == [scheduler.SEARCH_PAGE_DAYS, 1]
+    assert counts(pages[1]) == [(START + datetime.timedelta(days=days - 1), 1)]
+    assert sum(line.startswith('    ') for out in pages for line in out.splitlines()) == days
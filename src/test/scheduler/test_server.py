@@ -0,0 +1,57 @@
+import asyncio
+import json
+import sys
+from Scheduler import Session
+from Server import SchedulerServer, SessionStdout, execute
+
+
+class Client:
+
+    def __init__(self, reader, writer) -> None:
+        self.reader = reader
+        self.writer = writer
+
+    async def send(self, command: str) -> dict:
+        self.writer.write(json.dumps({'id': 1, 'command': command}).encode('utf-8') + b'\n')
+        await self.writer.drain()
+        return json.loads(await self.reader.readline())
+
+
+def test_execute_keeps_sessions_apart(monkeypatch):
+    monkeypatch.setattr(sys, 'stdout', SessionStdout(sys.stdout))
+    first, second = Session(), Session()
+    execute(first, 'create_patient p1 pw')
+    assert 'Logged in as p1' in execute(first, 'login_patient p1 pw')[0]
+    assert 'Please login' in execute(second, 'show_appointments')[0]
+    assert first.patient.get_username() == 'p1'
+    assert second.patient is None
+
+
+def test_connections_have_their_own_logins(monkeypatch):
+    monkeypatch.setattr(sys, 'stdout', sys.stdout)
+
+    async def scenario():
+        server = SchedulerServer('127.0.0.1', 0, workers=2)
+        ready = asyncio.Event()
+        serving = asyncio.create_task(server.serve(ready))
+        await ready.wait()
+        patient = Client(*await asyncio.open_connection('127.0.0.1', server.port))
+        caregiver = Client(*await asyncio.open_connection('127.0.0.1', server.port))
+        try:
+            await patient.send('create_patient p1 pw')
+            await caregiver.send('create_caregiver cg1 pw')
+            assert 'Logged in as p1' in (await patient.send('login_patient p1 pw'))['output']
+            assert 'cg1' in (await caregiver.send('login_caregiver cg1 pw'))['output']
+            assert 'Please login as a caregiver' in (await patient.send('upload_availability 2026-11-01'))['output']
+            assert 'Please login as a patient' in (await caregiver.send('reserve 2026-11-01 pfizer'))['output']
+            # Logging one connection out leaves the other logged in
+            await caregiver.send('logout')
+            assert 'already logged in' in (await patient.send('login_patient p1 pw'))['output']
+            assert server.connections == 2
+        finally:
+            for client in (patient, caregiver):
+                client.writer.close()
+            serving.cancel()
+            server.executor.shutdown()
+
+    asyncio.run(scenario())
@@ -0,0 +1,40 @@
+import pytest
+from db.SessionStore import get_sessions
+
+
+def login(scheduler, run, kind='patient'):
+    out = run(f'create_{kind} u1 pw', f'login_{kind} u1 pw')
+    # Resume from another connection, leaving the session open
+    scheduler.use_session(scheduler.Session())
+    return out.split('Session token: ')[1].split(' ')[0]
+
+
+@pytest.mark.parametrize('kind', ['patient', 'caregiver'])
+def test_resume_logs_in_without_password(kind, scheduler, run):
+    token = login(scheduler, run, kind)
+    assert 'Logged in as' in run(f'resume {token}')
+    assert get_sessions().verify(token) == (kind, 'u1')
+
+
+def test_expired_token_is_rejected(monkeypatch, scheduler, run):
+    monkeypatch.setenv('SessionTTLHours', '0')
+    token = login(scheduler, run)
+    assert 'the session has expired' in run(f'resume {token}')
+
+
+@pytest.mark.parametrize('part', [0, 1, 2])
+def test_tampered_token_is_rejected(part, scheduler, run):
+    token = login(scheduler, run)
+    parts = token.split('.')
+    # Another token id, a later expiry, or another signature
+    parts[part] = format(int(parts[part], 16) + 1, 'x').zfill(len(parts[part]))
+    assert get_sessions().verify('.'.join(parts)) is None
+    assert 'Login failed' in run(f'resume {".".join(parts)}')
+    assert get_sessions().verify(token) is not None
+
+
+def test_logout_ends_session(scheduler, run):
+    token = login(scheduler, run)
+    run(f'resume {token}', 'logout')
+    assert get_sessions().verify(token) is None
+    assert 'Login failed' in run(f'resume {token}')
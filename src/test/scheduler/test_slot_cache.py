@@ -0,0 +1,23 @@
+import datetime
+import time
+from db.ConnectionManager import ConnectionManager
+from db.SlotCache import get_slot_cache
+
+DATE = datetime.date(2026, 11, 1)
+
+
+def test_other_process_uploads_show_up_after_ttl(monkeypatch, run):
+    run('create_caregiver cg_a pw', 'login_caregiver cg_a pw', f'upload_availability {DATE}', 'logout',
+        'create_caregiver cg_b pw')
+    cache = get_slot_cache()
+    assert 0 < cache.ttl < 60
+    assert [caregiver for _, caregiver in cache.get(DATE)] == ['cg_a']
+    # Uploaded by another scheduler process, so this cache is not told about it
+    with ConnectionManager() as conn:
+        conn.cursor().execute("INSERT INTO Availabilities (CaregiverID, Date, AppointmentID) "
+                              "VALUES ('cg_b', %s, 'other')", DATE)
+        conn.commit()
+    assert [caregiver for _, caregiver in cache.get(DATE)] == ['cg_a']
+    real = time.monotonic
+    monkeypatch.setattr(time, 'monotonic', lambda: real() + cache.ttl)
+    assert [caregiver for _, caregiver in cache.get(DATE)] == ['cg_a', 'cg_b']
@@ -0,0 +1,62 @@
+import base64
+import json
+from db.ConnectionManager import ConnectionManager
+from db.SQLTracer import SQLTracer, REDACTED, normalize, redact
+
+
+def entries(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def test_redact():
+    assert redact((b'\x00\x01', bytearray(b'x'), 'pfizer', 3, None)) == [REDACTED, REDACTED, 'pfizer', 3, None]
+    assert redact({'Password': 'secret', 'user_hash': 'abc', 'name': 'p1'}) == \
+        {'Password': REDACTED, 'user_hash': REDACTED, 'name': 'p1'}
+    assert redact(b'\x00') == REDACTED
+    assert redact(tuple(range(25)))[-1] == '... 25 values'
+
+
+def test_normalize_collapses_values_rows():
+    assert normalize('INSERT INTO T VALUES (%s, %s),\n  (%s, %s), (%s, %s)') == 'INSERT INTO T VALUES (%s, %s), ...'
+
+
+def test_slow_and_sampled_statements_are_logged(monkeypatch, tmp_path):
+    path = tmp_path / 'queries.log'
+    tracer = SQLTracer(slow_ms=50, sample_rate=0.5, path=str(path))
+    draws = iter([0.9, 0.1])
+    monkeypatch.setattr('random.random', lambda: next(draws))
+    tracer.record('SELECT 1', None, 0.2, 1)
+    # Fast: skipped on a draw of 0.9, logged on 0.1
+    tracer.record('SELECT 2', None, 0.001, 1)
+    tracer.record('SELECT 3', None, 0.001, 1)
+    logged = entries(path)
+    assert [(e['statement'], e['slow']) for e in logged] == [('SELECT 1', True), ('SELECT 3', False)]
+    assert logged[0]['ms'] == 200.0
+
+
+def test_fast_statements_are_not_logged_without_sampling(tmp_path):
+    path = tmp_path / 'queries.log'
+    tracer = SQLTracer(slow_ms=50, sample_rate=0, path=str(path))
+    tracer.record('SELECT 1', None, 0.001, 1)
+    assert not path.exists()
+
+
+def test_log_never_holds_password_material(monkeypatch, tmp_path, run):
+    path = tmp_path / 'queries.log'
+    monkeypatch.setenv('QueryLogFile', str(path))
+    monkeypatch.setenv('SlowQueryMs', '0')
+    run('create_patient p1 s3cretpassword', 'login_patient p1 s3cretpassword', 'logout',
+        'create_caregiver cg1 s3cretpassword', 'upload_availability 2026-11-01')
+    with ConnectionManager() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT Salt, Hash FROM Patients UNION ALL SELECT Salt, Hash FROM Caregivers')
+        secrets = [value for row in cursor.fetchall() for value in row]
+    logged = entries(path)
+    inserts = [e for e in logged if e['statement'].startswith(('INSERT INTO Patients', 'INSERT INTO Caregivers'))]
+    assert len(inserts) == 2 and all(REDACTED in e['params'] for e in inserts)
+    text = path.read_text(encoding='utf-8')
+    assert 's3cretpassword' not in text
+    for secret in secrets:
+        for form in (secret.hex(), repr(bytes(secret)), base64.b64encode(secret).decode()):
+            assert form not in text
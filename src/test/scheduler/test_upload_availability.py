@@ -0,0 +1,50 @@
+import datetime
+import pytest
+from db.ConnectionManager import ConnectionManager
+
+MONDAY = datetime.date(2026, 11, 2)
+
+
+def scheduled(caregiver):
+    with ConnectionManager() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT Date FROM Availabilities WHERE CaregiverID = %s ORDER BY Date', caregiver)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def test_expand_dates(scheduler):
+    week = [MONDAY + datetime.timedelta(days=i) for i in range(7)]
+    assert scheduler.expand_dates(MONDAY, '2026-11-08') == week
+    assert scheduler.expand_dates(MONDAY, '1w') == scheduler.expand_dates(MONDAY, '7d') == week
+    assert scheduler.expand_dates(MONDAY, '1w', 'weekdays') == week[:5]
+    assert scheduler.expand_dates(MONDAY, '1w', 'weekends') == week[5:]
+    next_week = [day + datetime.timedelta(days=7) for day in week]
+    assert scheduler.expand_dates(MONDAY, '2w', 'mon,fri') == [week[0], week[4], next_week[0], next_week[4]]
+    assert scheduler.expand_dates(MONDAY, '2026-11-02') == [MONDAY]
+
+
+@pytest.mark.parametrize('until, days', [('2026-11-01', 'daily'), ('0d', 'daily'), ('1w', 'mon,funday'),
+                                         ('2028-11-02', 'daily'), ('11/08/2026', 'daily')])
+def test_expand_dates_rejects_bad_ranges(scheduler, until, days):
+    with pytest.raises(ValueError):
+        scheduler.expand_dates(MONDAY, until, days)
+
+
+def test_bad_range_uploads_nothing(run):
+    run('create_caregiver cg pw', 'login_caregiver cg pw')
+    out = run(f'upload_availability {MONDAY} 2026-11-01')
+    assert 'Error: Please enter a valid range' in out
+    assert 'End date is before start date' in out
+    assert 'Error: Please enter a valid range' in run(f'upload_availability {MONDAY} 1w someday')
+    assert scheduled('cg') == []
+
+
+def test_range_skips_scheduled_dates_and_counts_them(run):
+    run('create_caregiver cg pw', 'login_caregiver cg pw', f'upload_availability {MONDAY + datetime.timedelta(2)}')
+    out = run(f'upload_availability {MONDAY} 1w weekdays')
+    assert 'Availability uploaded! 4 date(s) added, 1 already scheduled and skipped.' in out
+    assert scheduled('cg') == [MONDAY + datetime.timedelta(days=i) for i in range(5)]
+    # Nothing left to add the second time round
+    out = run(f'upload_availability {MONDAY} 2026-11-06')
+    assert 'Availability uploaded! 0 date(s) added, 5 already scheduled and skipped.' in out
+    assert len(scheduled('cg')) == 5
@@ -0,0 +1,39 @@
+from db.ConnectionManager import ConnectionManager
+from db.UsernameFilter import UsernameFilter, get_usernames
+
+
+def patients():
+    with ConnectionManager() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT Username, Hash FROM Patients ORDER BY Username')
+        return cursor.fetchall()
+
+
+def test_loaded_and_added_names_are_found(run):
+    run(*(f'create_patient p{i} pw' for i in range(50)))
+    usernames = UsernameFilter('Patients')
+    usernames.load()
+    assert all(usernames.might_contain(f'p{i}') for i in range(50))
+    usernames.add('new')
+    assert usernames.might_contain('new')
+    # About 1% false positives at 10 bits per name
+    assert sum(usernames.might_contain(f'free{i}') for i in range(1000)) < 50
+
+
+def test_names_created_here_are_taken_without_reload(run):
+    assert 'Created user' in run('create_patient p1 pw')
+    assert get_usernames('Patients').might_contain('p1')
+    assert 'Username taken' in run('create_patient p1 other')
+    assert [name for name, _ in patients()] == ['p1']
+
+
+def test_name_taken_by_another_process_is_caught_by_insert(run):
+    run('create_patient p1 pw')
+    before = patients()
+    # Created elsewhere after the filter was loaded, so the filter still reports it free
+    with ConnectionManager() as conn:
+        conn.cursor().execute("INSERT INTO Patients (Username, Salt, Hash) VALUES ('p2', x'00', x'00')")
+        conn.commit()
+    assert not get_usernames('Patients').might_contain('p2')
+    assert 'Username taken' in run('create_patient p2 pw')
+    assert patients() == before + [('p2', b'\x00')]
@@ -0,0 +1,50 @@
+def caregiver(run, *commands):
+    run('create_caregiver cg_a pw', 'login_caregiver cg_a pw', *commands, 'logout')
+
+
+def use_up_pfizer(run):
+    # A vaccine with no doses left: its one dose is booked on a day of its own
+    caregiver(run, 'upload_availability 2026-11-20', 'add_doses pfizer 1')
+    assert 'Vaccine appointment scheduled!' in patient(run, 'p0', 'reserve 2026-11-20 pfizer')
+
+
+def patient(run, name, *commands):
+    return run(f'create_patient {name} pw', f'login_patient {name} pw', *commands, 'logout')
+
+
+def test_reserve_suggests_waitlist_only_for_known_vaccine(run):
+    use_up_pfizer(run)
+    run('login_caregiver cg_a pw', 'upload_availability 2026-11-01', 'logout')
+    out = patient(run, 'p1', 'reserve 2026-11-01 pfizer')
+    assert 'not enough doses of pfizer' in out
+    assert 'use: waitlist 2026-11-01' in out
+    out = run('login_patient p1 pw', 'reserve 2026-11-01 moderna')
+    assert 'Error: Unknown vaccine moderna' in out
+    assert 'waitlist' not in out
+
+
+def test_waitlisted_patients_are_booked_when_doses_arrive(run):
+    use_up_pfizer(run)
+    run('login_caregiver cg_a pw', 'upload_availability 2026-11-01', 'upload_availability 2026-11-02', 'logout')
+    assert 'Added to the waitlist' in patient(run, 'p1', 'waitlist 2026-11-01 2026-11-02 pfizer')
+    assert 'Added to the waitlist' in patient(run, 'p2', 'waitlist 2026-11-01 2026-11-02 pfizer')
+    assert 'Added to the waitlist' in patient(run, 'p3', 'waitlist 2026-11-01 2026-11-02 pfizer')
+    # Two slots for three patients: the oldest entries are booked, in date order
+    assert '2 waitlisted patient(s) booked.' in run('login_caregiver cg_a pw', 'add_doses pfizer 5', 'logout')
+    assert '2026-11-01' in patient(run, 'p1', 'show_appointments')
+    assert '2026-11-02' in patient(run, 'p2', 'show_appointments')
+    assert 'cg_a' not in patient(run, 'p3', 'show_appointments')
+
+
+def test_waitlisted_patient_is_booked_when_availability_opens(run):
+    caregiver(run, 'add_doses pfizer 1')
+    patient(run, 'p1', 'waitlist 2026-11-01 4w pfizer')
+    assert '1 waitlisted patient(s) booked.' in run('login_caregiver cg_a pw', 'upload_availability 2026-11-10')
+    assert '2026-11-10' in patient(run, 'p1', 'show_appointments')
+
+
+def test_joining_with_room_books_at_once(run):
+    caregiver(run, 'upload_availability 2026-11-03', 'add_doses pfizer 1')
+    out = patient(run, 'p1', 'waitlist 2026-11-01 1w pfizer')
+    assert 'Vaccine appointment scheduled!' in out
+    assert 'Date: 2026-11-03' in out